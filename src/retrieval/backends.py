@@ -0,0 +1,837 @@
+"""
+Storage and search engines behind the vector store.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import json
+import operator
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+class StoreBackend:
+    """
+    Interface of the engines VectorStore delegates to.
+
+    Backends store ids, texts, metadata and embeddings, and answer nearest
+    neighbour queries with result dicts of 'id', 'text', 'distance' and
+    'metadata', closest first. Distances are squared L2 distances.
+
+    Searches take optional filters in ChromaDB's syntax: where on the
+    metadata (e.g. {"type": "pdf"} or {"num_pages": {"$gte": 10}}) and
+    where_document on the text (e.g. {"$contains": "Dracula"}). Only
+    documents passing both are ranked, so n_results stays the number of
+    matching documents returned.
+    """
+
+    # most documents one add() accepts, or None for no limit
+    max_batch_size = None
+
+    def add(self, ids: list[str], texts: list[str], metadatas: list[dict], embeddings):
+        """Add (or replace) documents with precomputed embeddings."""
+        raise NotImplementedError
+
+    def search(
+        self,
+        embedding,
+        n_results: int,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[dict]:
+        """Return the n_results documents nearest to one embedding."""
+        return self.search_many(np.asarray(embedding)[None, :], n_results, where, where_document)[0]
+
+    def search_many(
+        self,
+        embeddings,
+        n_results: int,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[list[dict]]:
+        """Return the n_results nearest documents for each embedding."""
+        raise NotImplementedError
+
+    def search_among(
+        self,
+        embedding,
+        ids: list[str],
+        n_results: int,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[dict]:
+        """Return the n_results documents nearest to an embedding, out of ids only."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Return the number of documents stored."""
+        raise NotImplementedError
+
+    def delete(self, ids: list[str]):
+        """Remove documents by id."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every document."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Make sure everything added so far is on disk (if persistent)."""
+
+
+class ChromaBackend(StoreBackend):
+    """Keeps documents in a ChromaDB collection."""
+
+    def __init__(
+        self,
+        embedding_function,
+        collection_name: str = "documents",
+        persist_directory: str | None = None,
+    ):
+        """
+        Initialize the collection.
+
+        Args:
+            embedding_function: ChromaDB embedding function for the collection
+            collection_name: Name for the ChromaDB collection
+            persist_directory: Directory to keep the collection in across
+                restarts, or None for an in-memory collection
+        """
+        # chromadb is slow to import, so only backends that use it do
+        import chromadb
+        from chromadb import Settings
+
+        self.embedding_function = _chroma_function(embedding_function)
+        embedding_function = self.embedding_function
+        self.collection_name = collection_name
+
+        if persist_directory:
+            # reopen whatever a previous run left on disk
+            self.client = chromadb.PersistentClient(
+                path=persist_directory, settings=Settings(anonymized_telemetry=False)
+            )
+            self.collection = self.client.get_or_create_collection(
+                name=collection_name, embedding_function=embedding_function
+            )
+            self.max_batch_size = self.client.get_max_batch_size()
+            return
+
+        # use ChromaDB client
+        self.client = chromadb.Client(Settings(anonymized_telemetry=False))
+
+        # Delete any existing collection if present
+        try:
+            self.client.delete_collection(collection_name)
+        except Exception:
+            pass
+
+        self.collection = self.client.create_collection(
+            name=collection_name, embedding_function=embedding_function
+        )
+        self.max_batch_size = self.client.get_max_batch_size()
+
+    def add(self, ids, texts, metadatas, embeddings):
+        self.collection.add(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+
+    def search_many(self, embeddings, n_results, where=None, where_document=None):
+        results = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=where or None,
+            where_document=where_document or None,
+        )
+        return self._format(results, len(embeddings))
+
+    def search_among(self, embedding, ids, n_results, where=None, where_document=None):
+        if not ids:
+            return []
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            ids=list(ids),
+            n_results=min(n_results, len(ids)),
+            where=where or None,
+            where_document=where_document or None,
+        )
+        return self._format(results, 1)[0]
+
+    @staticmethod
+    def _format(results: dict, queries: int) -> list[list[dict]]:
+        """Turn ChromaDB's column-wise query results into result dicts."""
+        formatted = [[] for _ in range(queries)]
+        for q in range(len(results["ids"])):
+            for i in range(len(results["ids"][q])):
+                formatted[q].append(
+                    {
+                        "id": results["ids"][q][i],
+                        "text": results["documents"][q][i],
+                        "distance": results["distances"][q][i],
+                        "metadata": results["metadatas"][q][i],
+                    }
+                )
+        return formatted
+
+    def count(self):
+        return self.collection.count()
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def clear(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.create_collection(
+            name=self.collection_name, embedding_function=self.embedding_function
+        )
+
+
+def _chroma_function(function):
+    """Wrap a callable embedder in ChromaDB's EmbeddingFunction base class."""
+    from chromadb.api.types import EmbeddingFunction
+
+    if function is None or isinstance(function, EmbeddingFunction):
+        return function
+
+    class ChromaEmbeddingFunction(EmbeddingFunction):
+        def __init__(self, function):
+            self.function = function
+
+        def is_legacy(self) -> bool:
+            """Return True since we don't support build from config, etc."""
+            return True
+
+        def __call__(self, input) -> list[list[float]]:
+            return self.function(input)
+
+        def embed_query(self, input):
+            return self.function.embed_query(input)
+
+    return ChromaEmbeddingFunction(function)
+
+
+class NumpyBackend(StoreBackend):
+    """
+    Exact search over L2-normalized float32 embeddings in one contiguous
+    array: a query is a matrix multiply plus argpartition.
+
+    With quantization, the array that is scanned holds compact codes
+    instead: int8 (4x smaller), scored by integer dot products with the
+    int8 codes of the query, or one bit per dimension (32x smaller),
+    scored by Hamming distance. The best rescore_multiplier * n_results
+    candidates by code are then re-ranked with the float vectors, which
+    are kept memory-mapped on disk (in a temporary file until flushed, or
+    always without a persist_directory) rather than in memory.
+
+    Opened read-only, a saved index is memory-mapped rather than read, so
+    processes searching the same files share one copy in the page cache.
+    """
+
+    quantizations = (None, "int8", "binary")
+    # one bit per dimension loses more, so binary codes rescore more candidates
+    rescore_multipliers = {"int8": 4, "binary": 10}
+    # rows of codes converted or compared at a time while scoring
+    block_rows = 4096
+
+    def __init__(
+        self,
+        collection_name: str = "documents",
+        persist_directory: str | None = None,
+        quantization: str | None = None,
+        rescore_multiplier: int | None = None,
+        read_only: bool = False,
+    ):
+        """
+        Initialize the (empty, or previously saved) index.
+
+        Args:
+            collection_name: Name used for the files on disk
+            persist_directory: Directory the index is saved to by flush(),
+                or None to keep it in memory only
+            quantization: None for exact float search, or "int8" or
+                "binary" to scan quantized codes and rescore the best
+            rescore_multiplier: Candidates rescored per result wanted;
+                None picks a default for the quantization
+            read_only: Memory-map the index saved in persist_directory
+                instead of loading it, and refuse any change to it
+        """
+        if read_only and not persist_directory:
+            raise ValueError("A read-only index needs a persist_directory")
+        if quantization not in self.quantizations:
+            raise ValueError(f"Unknown quantization '{quantization}'")
+        if rescore_multiplier is None:
+            rescore_multiplier = self.rescore_multipliers.get(quantization, 1)
+        if rescore_multiplier < 1:
+            raise ValueError("rescore_multiplier must be at least 1")
+
+        self.collection_name = collection_name
+        self.persist_directory = Path(persist_directory) if persist_directory else None
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._clear()
+        if self.persist_directory and self._vectors_path.exists():
+            self._load()
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.persist_directory / f"{self.collection_name}.vectors.npy"
+
+    @property
+    def _documents_path(self) -> Path:
+        return self.persist_directory / f"{self.collection_name}.documents.json"
+
+    def _codes_path(self, part: str) -> Path:
+        return self.persist_directory / f"{self.collection_name}.{self.quantization}.{part}.npy"
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("The index is read-only")
+
+    def _clear(self):
+        self._ids, self._texts, self._metadatas = [], [], []
+        self._rows = {}  # id -> row
+        self._columns = None  # MetadataColumns of the current metadata, built for filters
+        # rows of vectors, codes and int8 scales, grown by doubling
+        self._buffer = np.zeros((0, 0), dtype=np.float32)
+        self._codes = np.zeros((0, 0), dtype=np.uint8)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._size = 0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Return the normalized embeddings, one row per document."""
+        return self._buffer[: self._size]
+
+    def add(self, ids, texts, metadatas, embeddings):
+        self._check_writable()
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        codes, scales = self._quantize(vectors)
+        with self._lock:
+            if self._buffer.shape[1] != vectors.shape[1]:
+                if self._size:
+                    raise ValueError("Embedding dimension does not match the index")
+                self._buffer = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                self._codes = np.zeros((0, codes.shape[1]), dtype=codes.dtype)
+            if not self._buffer.flags.writeable:
+                # vectors mapped from a saved index are read-only: take a copy to change
+                self._buffer = self._resized_buffer(len(self._buffer))
+            self._columns = None
+
+            for i, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._append_row()
+                    self._rows[doc_id] = row
+                    self._ids.append(doc_id)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                else:
+                    self._texts[row] = text
+                    self._metadatas[row] = metadata
+                self._buffer[row] = vectors[i]
+                self._codes[row] = codes[i]
+                self._scales[row] = scales[i]
+
+    def _append_row(self) -> int:
+        """Make room for one more row and return its index."""
+        if self._size == len(self._buffer):
+            rows = max(2 * self._size, 64)
+            # searches holding the old buffers keep a consistent view of them
+            self._buffer = self._resized_buffer(rows)
+            self._codes = _grown(self._codes, self._size, rows)
+            self._scales = _grown(self._scales, self._size, rows)
+        self._size += 1
+        return self._size - 1
+
+    def _new_buffer(self, rows: int, dim: int) -> np.ndarray:
+        """Return zeroed rows for float vectors, in a temporary file if they are only rescored."""
+        if self.quantization is None or rows == 0:
+            return np.zeros((rows, dim), dtype=np.float32)
+        if self.persist_directory:
+            self.persist_directory.mkdir(parents=True, exist_ok=True)
+        # the file has no name, and is gone once the last mapping of it is
+        with tempfile.TemporaryFile(dir=self.persist_directory) as f:
+            return np.memmap(f, dtype=np.float32, mode="w+", shape=(rows, dim))
+
+    def _resized_buffer(self, rows: int) -> np.ndarray:
+        """Return a new buffer of rows rows, starting with the vectors stored."""
+        buffer = self._new_buffer(rows, self._buffer.shape[1])
+        buffer[: self._size] = self._buffer[: self._size]
+        return buffer
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the codes (and int8 scales) of normalized vectors."""
+        if self.quantization == "int8":
+            # scale each vector so its largest component maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+        return np.zeros((len(vectors), 0), dtype=np.uint8), np.ones(len(vectors), np.float32)
+
+    def search_many(self, embeddings, n_results, where=None, where_document=None):
+        queries = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        with self._lock:
+            size = self._size
+            vectors, codes, scales = self.vectors, self._codes[:size], self._scales[:size]
+            ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            columns = self._metadata_columns() if where else None
+
+        subset = None
+        if where or where_document:
+            # only the rows passing the filters are scored
+            subset = _matching_rows(np.arange(size), columns, texts, where, where_document)
+            codes, scales, size = codes[subset], scales[subset], len(subset)
+
+        k = min(n_results, size)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        if self.quantization is None:
+            top, scores = _top_k(queries @ (vectors if subset is None else vectors[subset]).T, k)
+            if subset is not None:
+                top = subset[top]
+        else:
+            candidates = min(k * self.rescore_multiplier, size)
+            rows, _ = _top_k(self._approximate_scores(queries, codes, scales), candidates)
+            if subset is not None:
+                rows = subset[rows]
+            # rescore just the candidates against the full-precision vectors
+            exact = np.einsum("qd,qcd->qc", queries, vectors[rows])
+            best, scores = _top_k(exact, k)
+            top = np.take_along_axis(rows, best, axis=1)
+
+        return self._results(top, scores, ids, texts, metadatas)
+
+    def search_among(self, embedding, ids, n_results, where=None, where_document=None):
+        query = _normalize(np.atleast_2d(np.asarray(embedding, dtype=np.float32)))
+        with self._lock:
+            rows = np.array([self._rows[i] for i in ids if i in self._rows], dtype=np.int64)
+            vectors = self.vectors
+            all_ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            columns = self._metadata_columns() if where else None
+
+        if where or where_document:
+            rows = _matching_rows(rows, columns, texts, where, where_document)
+
+        k = min(n_results, len(rows))
+        if k == 0:
+            return []
+        # score only the given rows, exactly, whatever the quantization
+        best, scores = _top_k(query @ vectors[rows].T, k)
+        return self._results(rows[best], scores, all_ids, texts, metadatas)[0]
+
+    def _metadata_columns(self) -> "MetadataColumns":
+        """Return the metadata as columns for filtering (call holding the lock)."""
+        if self._columns is None:
+            # the columns themselves are only built as filters name their fields
+            self._columns = MetadataColumns(self._metadatas[: self._size])
+        return self._columns
+
+    @staticmethod
+    def _results(top, scores, ids, texts, metadatas) -> list[list[dict]]:
+        """Turn rows and cosine similarities, one row per query, into result dicts."""
+        # for unit vectors, squared L2 distance is 2 - 2 * cosine similarity
+        distances = np.maximum(2.0 - 2.0 * scores, 0.0)
+
+        return [
+            [
+                {
+                    "id": ids[row],
+                    "text": texts[row],
+                    "distance": float(distance),
+                    "metadata": metadatas[row],
+                }
+                for row, distance in zip(rows, dists)
+            ]
+            for rows, dists in zip(top.tolist(), distances)
+        ]
+
+    def _approximate_scores(self, queries, codes, scales) -> np.ndarray:
+        """Score every row's codes against the queries, higher is closer."""
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        if self.quantization == "binary":
+            # dim minus twice the Hamming distance tracks cosine similarity
+            bits = _words(np.packbits(queries > 0, axis=1))
+            codes = _words(codes)
+            dim = queries.shape[1]
+            for b in range(0, len(codes), self.block_rows):
+                block = codes[b : b + self.block_rows]
+                differ = _popcount(bits[:, None, :] ^ block[None, :, :]).sum(axis=2, dtype=np.int32)
+                scores[:, b : b + len(block)] = dim - 2 * differ
+            return scores
+
+        # int8 dot products of the codes, scaled back to cosine similarities; float32
+        # holds every sum of products exactly up to 1040 dimensions, so BLAS computes
+        # the integer products there, and NumPy's integer matmul beyond
+        query_codes, query_scales = self._quantize(queries)
+        dtype = np.float32 if 127 * 127 * queries.shape[1] < 1 << 24 else np.int32
+        query_codes = query_codes.astype(dtype)
+        for b in range(0, len(codes), self.block_rows):
+            block = codes[b : b + self.block_rows]
+            dots = query_codes @ block.astype(dtype).T
+            scores[:, b : b + len(block)] = dots * scales[None, b : b + len(block)]
+        scores *= query_scales[:, None]
+        return scores
+
+    def recall(self, embeddings, n_results: int = 10) -> float:
+        """
+        Measure how much quantization costs against exact search.
+
+        Args:
+            embeddings: Query embeddings to try
+            n_results: Number of results compared per query
+
+        Returns:
+            Mean fraction of the exact top n_results that the index returns
+        """
+        found = self.search_many(embeddings, n_results)
+        queries = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        with self._lock:
+            vectors, ids = self.vectors, self._ids
+        k = min(n_results, len(vectors))
+        if k == 0:
+            return 1.0
+        exact, _ = _top_k(queries @ vectors.T, k)
+        hits = [
+            len({ids[row] for row in rows} & {result["id"] for result in results})
+            for rows, results in zip(exact.tolist(), found)
+        ]
+        return sum(hits) / (k * len(hits))
+
+    def memory_usage(self) -> dict:
+        """
+        Return the bytes of memory held by the index.
+
+        'codes' is what quantized searches scan (int8 scales included);
+        'vectors' counts the float vectors unless they are memory-mapped
+        from disk.
+        """
+        with self._lock:
+            size = self._size
+            codes = self._codes[:size].nbytes
+            if self.quantization == "int8":
+                codes += self._scales[:size].nbytes
+            mapped = isinstance(self._buffer, np.memmap)
+            return {
+                "documents": size,
+                "quantization": self.quantization,
+                "codes": codes,
+                "vectors": 0 if mapped else self.vectors.nbytes,
+                "vectors_mapped": mapped,
+            }
+
+    def count(self):
+        return self._size
+
+    def delete(self, ids):
+        self._check_writable()
+        with self._lock:
+            doomed = {self._rows[doc_id] for doc_id in ids if doc_id in self._rows}
+            if not doomed:
+                return
+            keep = [row for row in range(self._size) if row not in doomed]
+            # build new arrays and lists so running searches are not disturbed
+            buffer = self._new_buffer(len(keep), self._buffer.shape[1])
+            for b in range(0, len(keep), self.block_rows):
+                buffer[b : b + self.block_rows] = self._buffer[keep[b : b + self.block_rows]]
+            self._buffer = buffer
+            self._codes = self._codes[keep]
+            self._scales = self._scales[keep]
+            self._size = len(keep)
+            self._ids = [self._ids[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._columns = None
+
+    def clear(self):
+        self._check_writable()
+        with self._lock:
+            self._clear()
+
+    def flush(self):
+        if self.persist_directory is None or self.read_only:
+            return
+        with self._lock:
+            self.persist_directory.mkdir(parents=True, exist_ok=True)
+            documents = {"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}
+            _atomic_write(self._vectors_path, lambda f: np.save(f, self.vectors))
+            _atomic_write(self._documents_path, lambda f: f.write(json.dumps(documents).encode()))
+            if self.quantization:
+                # saved codes spare the next load (or reader) from quantizing again
+                codes, scales = self._codes[: self._size], self._scales[: self._size]
+                _atomic_write(self._codes_path("codes"), lambda f: np.save(f, codes))
+                _atomic_write(self._codes_path("scales"), lambda f: np.save(f, scales))
+            if self.quantization and self._size:
+                # searches only touch candidate rows, so leave them on disk
+                self._buffer = np.load(self._vectors_path, mmap_mode="r")
+                self._codes = self._codes[: self._size]
+                self._scales = self._scales[: self._size]
+
+    def _load(self):
+        """Read an index saved by flush()."""
+        with open(self._documents_path, "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        self._ids = documents["ids"]
+        self._texts = documents["texts"]
+        self._metadatas = documents["metadatas"]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        if self.quantization is None and not self.read_only:
+            self._buffer = np.ascontiguousarray(np.load(self._vectors_path), dtype=np.float32)
+            self._size = len(self._buffer)
+            return
+
+        self._buffer = np.load(self._vectors_path, mmap_mode="r")
+        self._size = len(self._buffer)
+        if self.quantization is None:
+            return
+        if self._codes_path("codes").exists():
+            mode = "r" if self.read_only else None
+            codes = np.load(self._codes_path("codes"), mmap_mode=mode)
+            scales = np.load(self._codes_path("scales"), mmap_mode=mode)
+            if len(codes) == self._size:
+                self._codes, self._scales = codes, scales
+                return
+
+        # quantize from the mapped file a block at a time
+        parts = [
+            self._quantize(np.asarray(self._buffer[b : b + self.block_rows]))
+            for b in range(0, self._size, self.block_rows)
+        ]
+        if parts:
+            self._codes = np.concatenate([codes for codes, _ in parts])
+            self._scales = np.concatenate([scales for _, scales in parts])
+
+
+# comparison operators of ChromaDB's metadata filters
+_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, options: value in options,
+    "$nin": lambda value, options: value not in options,
+}
+
+
+def matches_where(where: dict, metadata: dict) -> bool:
+    """
+    Check a document's metadata against a ChromaDB-style where filter.
+
+    Args:
+        where: Filter of field conditions, e.g. {"type": "pdf"} or
+            {"num_pages": {"$gte": 10}}, combined with "$and" / "$or"
+        metadata: The document's metadata
+
+    Returns:
+        True if every condition holds (a missing field fails its condition)
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(clause, metadata) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(clause, metadata) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for name, operand in condition.items():
+                if name not in _OPERATORS:
+                    raise ValueError(f"Unknown filter operator '{name}'")
+                if not _OPERATORS[name](metadata[key], operand):
+                    return False
+    return True
+
+
+def matches_document(where_document: dict, text: str) -> bool:
+    """
+    Check a document's text against a ChromaDB-style where_document filter.
+
+    Args:
+        where_document: Filter such as {"$contains": "Dracula"} or
+            {"$not_contains": "draft"}, combined with "$and" / "$or"
+        text: The document's text
+
+    Returns:
+        True if every condition holds
+    """
+    for key, condition in where_document.items():
+        if key == "$and":
+            passed = all(matches_document(clause, text) for clause in condition)
+        elif key == "$or":
+            passed = any(matches_document(clause, text) for clause in condition)
+        elif key == "$contains":
+            passed = condition in text
+        elif key == "$not_contains":
+            passed = condition not in text
+        else:
+            raise ValueError(f"Unknown document filter operator '{key}'")
+        if not passed:
+            return False
+    return True
+
+
+class MetadataColumns:
+    """
+    Documents' metadata as one NumPy array per field, so that where filters
+    are array comparisons rather than a loop over the documents.
+
+    A field's column is built from the metadata the first time a filter
+    names it, and kept; the columns describe the metadata they were made
+    from, so they are replaced, not updated, when documents change.
+    """
+
+    def __init__(self, metadatas: list[dict | None]):
+        """
+        Initialize the (not yet built) columns.
+
+        Args:
+            metadatas: Metadata of each document, by row
+        """
+        self.metadatas = metadatas
+        self.size = len(metadatas)
+        self._columns = {}  # field -> (rows having it, its values in those rows)
+
+    def column(self, key: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows that have a field, and the field's values in them."""
+        column = self._columns.get(key)
+        if column is None:
+            rows, values = [], []
+            for row, metadata in enumerate(self.metadatas):
+                if metadata and key in metadata:
+                    rows.append(row)
+                    values.append(metadata[key])
+            column = self._columns[key] = (np.array(rows, dtype=np.int64), _column_array(values))
+        return column
+
+    def mask(self, where: dict) -> np.ndarray:
+        """
+        Check every document's metadata against a where filter.
+
+        Args:
+            where: Filter in the syntax of matches_where, with the same
+                semantics (a missing field fails its condition)
+
+        Returns:
+            Boolean array, True for each row passing the filter
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                passed = np.zeros(self.size, dtype=bool)
+                for clause in condition:
+                    passed |= self.mask(clause)
+                mask &= passed
+            else:
+                rows, values = self.column(key)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                hits = np.ones(len(rows), dtype=bool)
+                for name, operand in condition.items():
+                    hits &= _compare(name, values, operand)
+                passed = np.zeros(self.size, dtype=bool)
+                passed[rows[hits]] = True
+                mask &= passed
+        return mask
+
+
+def _column_array(values: list) -> np.ndarray:
+    """Return a field's values as an array NumPy compares natively where it can."""
+    types = {type(value) for value in values}
+    if types <= {int, float, bool} or types == {str}:
+        try:
+            return np.array(values)
+        except OverflowError:
+            pass  # integers too large for int64
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+
+def _compare(name: str, values: np.ndarray, operand) -> np.ndarray:
+    """Apply one filter operator to a column, returning which values pass."""
+    if name not in _OPERATORS:
+        raise ValueError(f"Unknown filter operator '{name}'")
+    if name in ("$in", "$nin"):
+        found = np.zeros(len(values), dtype=bool)
+        for option in operand:
+            found |= values == option
+        return found if name == "$in" else ~found
+    return np.asarray(_OPERATORS[name](values, operand), dtype=bool)
+
+
+def _matching_rows(rows, columns, texts, where, where_document) -> np.ndarray:
+    """Return those of rows whose metadata columns and text pass both filters."""
+    if where:
+        rows = rows[columns.mask(where)[rows]]
+    if where_document:
+        passed = [matches_document(where_document, texts[row]) for row in rows.tolist()]
+        rows = rows[np.array(passed, dtype=bool)]
+    return rows
+
+
+# number of set bits in each byte value, for NumPy without bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Return the number of set bits in each element."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return _POPCOUNT[words.view(np.uint8)].reshape(words.shape + (-1,)).sum(axis=-1)
+
+
+def _words(codes: np.ndarray) -> np.ndarray:
+    """View packed bits as 64-bit words when the rows allow it."""
+    if codes.shape[1] % 8 == 0 and codes.flags.c_contiguous:
+        return codes.view(np.uint64)
+    return codes
+
+
+def _grown(array: np.ndarray, size: int, rows: int) -> np.ndarray:
+    """Return a copy of array's first size rows with room for rows rows."""
+    grown = np.zeros((rows,) + array.shape[1:], dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the columns of the k highest scores of each row, and the scores, best first."""
+    # top k per row without sorting every score, then order just those
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows are left alone)."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _atomic_write(path: Path, write):
+    """Write a file through a temporary file so readers never see half of it."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
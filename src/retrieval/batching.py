@@ -0,0 +1,173 @@
+"""
+Micro-batching of concurrent search requests.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from .timing import Timings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """
+    Collect search requests that arrive close together and answer them with
+    a single batched search, run in a worker thread so the event loop is
+    never blocked by the embedding model or the vector store.
+    """
+
+    def __init__(
+        self,
+        search_many,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        timed: bool = False,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            search_many: Callable taking (queries, n_results, **options) and
+                returning one result list per query, e.g.
+                DocumentRetriever.search_many
+            max_batch_size: Most queries answered by one batched call
+            max_wait_ms: How long the first query of a batch waits for others
+            timed: Also pass search_many a Timings and a cache_hits list, as
+                DocumentRetriever.search_many takes them, so each request
+                can be told the stages of the call that answered it
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be non-negative")
+
+        self.search_many = search_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timed = timed
+        self._queue = None
+        self._worker = None
+
+    @property
+    def running(self) -> bool:
+        """Return True if the batcher is accepting requests."""
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start the batching loop on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still waiting."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            if not future.done():
+                future.set_exception(RuntimeError("QueryBatcher stopped"))
+
+    async def search(
+        self, query: str, n_results: int = 5, timings: Timings | None = None, **options
+    ) -> list[dict]:
+        """
+        Search for documents relevant to the query as part of a batch.
+
+        Args:
+            query: Search query text
+            n_results: Number of results to return
+            timings: Timings to add the request's seconds to: 'queue' (the
+                wait for its batch to be searched) and, if the batcher is
+                timed, the stages of the batched call, plus a 'cache_hit' or
+                'cache_miss' entry (of 0 seconds) for its own result
+            **options: JSON-serializable keyword arguments passed on to
+                search_many (e.g. mode or where); only queries with equal
+                options share a call
+
+        Returns:
+            List of result dicts, as DocumentRetriever.search returns them
+        """
+        if not self.running:
+            raise RuntimeError("QueryBatcher is not running. Call start() first.")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, n_results, options, future, timings, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        """Gather batches until the size or time window closes, then flush."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple]):
+        """Answer one batch of requests with one search_many call per set of options."""
+        # callers that gave up (e.g. disconnected) don't need an answer
+        groups = {}
+        for item in batch:
+            if not item[3].done():
+                # options may hold dicts (filters), so compare them as JSON
+                key = json.dumps(item[2], sort_keys=True)
+                groups.setdefault(key, []).append(item)
+
+        for group in groups.values():
+            await self._search_group(group, group[0][2])
+
+    async def _search_group(self, batch: list[tuple], options: dict):
+        """Answer requests with equal options with a single search_many call."""
+        queries = [item[0] for item in batch]
+        n_results = max(item[1] for item in batch)
+        call_timings, cache_hits = Timings(), []
+        if self.timed:
+            options = {**options, "timings": call_timings, "cache_hits": cache_hits}
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.search_many, queries, n_results, **options)
+        except Exception as e:
+            logger.error(f"Batched search of {len(queries)} queries failed: {e}")
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+
+        stages = call_timings.as_dict()
+        for i, ((_, n, _, future, timings, enqueued), result) in enumerate(zip(batch, results)):
+            if timings is not None:
+                timings.add("queue", started - enqueued)
+                for stage, seconds in stages.items():
+                    timings.add(stage, seconds)
+                if self.timed:
+                    timings.add("cache_hit" if cache_hits[i] else "cache_miss", 0.0)
+            if not future.done():
+                future.set_result(result[:n])
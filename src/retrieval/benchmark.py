@@ -0,0 +1,369 @@
+"""
+Offline benchmarks of chunking, loading, embedding, indexing and search.
+
+Run it with, e.g.:
+    python -m retrieval.benchmark --files 200 --output results.json
+    python -m retrieval.benchmark --baseline results.json
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .embeddings import DocumentEmbedder
+from .loader import DocumentChunker, DocumentLoader
+from .store import VectorStore
+from .timing import Timings
+
+# relative change of a metric, in its worse direction, reported as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# letters of the synthetic words, most frequent in English first, and their frequencies
+_LETTERS = np.array(list("etaoinshrdlcumwfgypbvkjxqz"))
+_LETTER_WEIGHTS = np.array(
+    [12.7, 9.1, 8.2, 7.5, 7.0, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.8]
+    + [2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.2, 0.2, 0.1, 0.1]
+)
+_LETTER_WEIGHTS /= _LETTER_WEIGHTS.sum()
+
+
+def synthetic_corpus(
+    directory: str | Path, files: int = 100, words_per_file: int = 1000, seed: int = 0
+) -> list[Path]:
+    """
+    Write text files of random words, the same ones for the same arguments.
+
+    Word lengths and frequencies roughly follow English (a few words are
+    very common, most are rare), so chunking and tokenizing cost about what
+    real text costs.
+
+    Args:
+        directory: Directory the files are written to (created if needed)
+        files: Number of files
+        words_per_file: Words in each file
+        seed: Seed of the random words
+
+    Returns:
+        Paths of the files written
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [
+        "".join(rng.choice(_LETTERS, size=length, p=_LETTER_WEIGHTS))
+        for length in rng.integers(2, 11, size=5000)
+    ]
+    # Zipf-like word frequencies
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        words = [vocabulary[w] for w in rng.choice(len(vocabulary), size=words_per_file, p=weights)]
+        # sentences of about 15 words, paragraphs of about 8 sentences
+        lines, sentence = [], []
+        for word in words:
+            sentence.append(word)
+            if len(sentence) >= 15:
+                lines.append(" ".join(sentence).capitalize() + ".")
+                sentence = []
+                if len(lines) % 8 == 0:
+                    lines.append("")
+        if sentence:
+            lines.append(" ".join(sentence).capitalize() + ".")
+        path = directory / f"synthetic{i:05d}.txt"
+        path.write_text("\n".join(lines), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def latency_percentiles(seconds: list[float]) -> dict[str, float]:
+    """Return the p50, p95 and p99 of latencies, in milliseconds."""
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def peak_rss_mb() -> float | None:
+    """Return the peak resident memory of this process so far (None if unknown)."""
+    try:
+        import resource
+    except ImportError:
+        return None  # not on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run_benchmarks(
+    directory: str | Path,
+    files: int = 100,
+    words_per_file: int = 1000,
+    queries: int = 200,
+    chunk_size: int = 300,
+    overlap: int = 30,
+    backend: str = "numpy",
+    embed_backend: str = "torch",
+    batch_size: int = 256,
+    load_workers: int = 0,
+    seed: int = 0,
+) -> dict:
+    """
+    Generate a synthetic corpus and time each stage of the pipeline on it.
+
+    Every stage records its own throughput and the process's peak RSS once
+    it is done (the peak only grows, so each stage's value includes the
+    ones before it). With a NumPy backend, search also records its
+    recall@10 against exact search, which quantization lowers.
+
+    Args:
+        directory: Directory the corpus is written to
+        files: Number of files in the corpus
+        words_per_file: Words in each file
+        queries: Number of searches timed one at a time
+        chunk_size: Words per chunk
+        overlap: Words shared by consecutive chunks
+        backend: Vector store backend, e.g. "numpy" or "chroma"
+        embed_backend: Embedding backend, e.g. "torch" or "onnx-int8"
+        batch_size: Chunks embedded per model call
+        load_workers: Processes parsing files (0 parses in this process)
+        seed: Seed of the corpus and of the queries drawn from it
+
+    Returns:
+        JSON-serializable dict with the settings, the environment and the
+        results of every stage
+    """
+    config = {
+        "files": files,
+        "words_per_file": words_per_file,
+        "queries": queries,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "backend": backend,
+        "embed_backend": embed_backend,
+        "batch_size": batch_size,
+        "load_workers": load_workers,
+        "seed": seed,
+    }
+    results = {}
+
+    start = time.perf_counter()
+    paths = synthetic_corpus(directory, files, words_per_file, seed)
+    results["corpus"] = {
+        "seconds": time.perf_counter() - start,
+        "megabytes": sum(path.stat().st_size for path in paths) / (1 << 20),
+    }
+
+    chunker = DocumentChunker(chunk_size=chunk_size, overlap=overlap)
+    texts = [path.read_text(encoding="utf-8") for path in paths]
+    start = time.perf_counter()
+    chunks = [chunk for i, text in enumerate(texts) for chunk in chunker.chunk_text(text, str(i))]
+    seconds = time.perf_counter() - start
+    results["chunking"] = _stage(seconds, chunks=len(chunks), chunks_per_second=len(chunks))
+    del texts, chunks
+
+    loader = DocumentLoader(chunker, max_workers=load_workers)
+    start = time.perf_counter()
+    documents = loader.load_documents(str(directory))
+    seconds = time.perf_counter() - start
+    results["loading"] = _stage(seconds, files=files, files_per_second=files)
+
+    timings = Timings()
+    embedder = DocumentEmbedder(backend=embed_backend, query_cache_size=0, timings=timings)
+    texts = [doc["text"] for doc in documents]
+    embedder.embed_documents(texts[:batch_size])  # warm up
+    start = time.perf_counter()
+    for b in range(0, len(texts), batch_size):
+        embedder.embed_documents(texts[b : b + batch_size])
+    seconds = time.perf_counter() - start
+    results["embedding"] = _stage(
+        seconds,
+        embeddings=len(texts),
+        embeddings_per_second=len(texts),
+        model_load_seconds=timings.as_dict().get("model_load", 0.0),
+    )
+
+    store = VectorStore(
+        embedder,
+        collection_name="benchmark",
+        backend=backend,
+        timings=timings,
+        embed_batch_size=batch_size,
+    )
+    start = time.perf_counter()
+    store.add_documents(documents)
+    seconds = time.perf_counter() - start
+    results["indexing"] = _stage(
+        seconds,
+        chunks=len(documents),
+        chunks_per_second=len(documents),
+        insert_seconds=timings.as_dict().get("insert", 0.0),
+    )
+
+    # queries are distinct runs of words from random chunks, so no cache answers them
+    rng = np.random.default_rng(seed + 1)
+    sample = []
+    for i in rng.integers(0, len(texts), size=queries):
+        words = texts[i].split()
+        offset = rng.integers(0, max(len(words) - 8, 1))
+        sample.append(" ".join(words[offset : offset + 8]))
+    store.search(sample[0])  # warm up
+    latencies = []
+    for query in sample:
+        start = time.perf_counter()
+        store.search(query, n_results=5)
+        latencies.append(time.perf_counter() - start)
+    accuracy = {}
+    if hasattr(store.backend, "recall"):
+        # the share of the exact top 10 a quantized index still finds (1 when exact)
+        accuracy["recall_at_10"] = store.backend.recall(embedder.embed_query(sample), 10)
+    results["search"] = _stage(
+        sum(latencies),
+        queries=queries,
+        queries_per_second=queries,
+        **latency_percentiles(latencies),
+        **accuracy,
+    )
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "model": embedder.model_name,
+        },
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _stage(seconds: float, **metrics) -> dict:
+    """Return a stage's metrics; counts named *_per_second are divided by the seconds."""
+    stage = {"seconds": seconds}
+    for name, value in metrics.items():
+        if name.endswith("_per_second"):
+            value = value / seconds if seconds > 0 else 0.0
+        stage[name] = value
+    stage["peak_rss_mb"] = peak_rss_mb()
+    return stage
+
+
+def _better(metric: str) -> str | None:
+    """Return which way a metric improves ('higher' or 'lower'), or None for counts."""
+    if metric.endswith("_per_second") or metric.startswith("recall"):
+        return "higher"
+    if metric.endswith(("seconds", "_ms", "_mb")):
+        return "lower"
+    return None
+
+
+def compare(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[dict]:
+    """
+    Compare benchmark results with a saved baseline.
+
+    Args:
+        baseline: Results of an earlier run_benchmarks call
+        current: Results to check against it
+        tolerance: Relative change in a metric's worse direction (e.g. 0.1
+            for 10% slower) above which it counts as a regression
+
+    Returns:
+        One dict per metric found in both (stage.metric name, baseline and
+        current values, relative change, and whether it regressed)
+    """
+    rows = []
+    for stage, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            old = baseline["results"].get(stage, {}).get(metric)
+            direction = _better(metric)
+            if direction is None or not old or value is None:
+                continue
+            change = (value - old) / old
+            worse = -change if direction == "higher" else change
+            rows.append(
+                {
+                    "metric": f"{stage}.{metric}",
+                    "baseline": old,
+                    "current": value,
+                    "change": change,
+                    "regression": worse > tolerance,
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the benchmarks (or load saved results) and compare them with a baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--files", type=int, default=100, help="files in the corpus")
+    parser.add_argument("--words", type=int, default=1000, help="words per file")
+    parser.add_argument("--queries", type=int, default=200, help="searches timed")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=30)
+    parser.add_argument("--backend", default="numpy", help="vector store backend")
+    parser.add_argument("--embed-backend", default="torch", help="embedding backend")
+    parser.add_argument("--batch-size", type=int, default=256, help="chunks per model call")
+    parser.add_argument("--load-workers", type=int, default=0, help="parsing processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--results", help="compare these saved results instead of running")
+    parser.add_argument("--baseline", help="saved results to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.results:
+        current = json.loads(Path(args.results).read_text())
+    else:
+        with tempfile.TemporaryDirectory(prefix="retrieval-benchmark-") as directory:
+            current = run_benchmarks(
+                directory,
+                files=args.files,
+                words_per_file=args.words,
+                queries=args.queries,
+                chunk_size=args.chunk_size,
+                overlap=args.overlap,
+                backend=args.backend,
+                embed_backend=args.embed_backend,
+                batch_size=args.batch_size,
+                load_workers=args.load_workers,
+                seed=args.seed,
+            )
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2) + "\n")
+    if not args.baseline:
+        print(json.dumps(current, indent=2))
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    if baseline["config"] != current["config"]:
+        print("warning: the baseline was run with other settings", file=sys.stderr)
+    rows = compare(baseline, current, args.tolerance)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(
+            f"{row['metric']:<36} {row['baseline']:>12.4g} {row['current']:>12.4g} "
+            f"{row['change']:>+8.1%}  {flag}"
+        )
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
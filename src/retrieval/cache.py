@@ -0,0 +1,207 @@
+"""
+Caches used to skip repeated work in the retrieval pipeline.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache with an optional time-to-live.
+
+    Safe to share between threads. Counts hits and misses so callers can
+    report hit rates.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, clock=time.monotonic):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Most entries kept; the least recently used is evicted
+            ttl: Seconds an entry stays valid, or None to keep it until evicted
+            clock: Function returning the current time in seconds
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if full."""
+        if self.maxsize == 0:
+            return
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry (the hit and miss counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """Return the cache's size and hit/miss counters."""
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of text embeddings on disk.
+
+    Vectors are appended to a float32 file that is memory-mapped for
+    reading; a second file holds the 16-byte BLAKE2 digest of each text,
+    row for row. Each model gets its own directory. Meant for one writing
+    process at a time.
+    """
+
+    def __init__(self, directory: str | Path, model_name: str):
+        """
+        Open (or create) the cache for a model.
+
+        Args:
+            directory: Directory holding the caches of all models
+            model_name: Name of the model whose vectors are cached
+        """
+        self.model_name = model_name
+        self.directory = Path(directory) / re.sub(r"[^\w.-]", "_", model_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._keys_path = self.directory / "keys.bin"
+        self._vectors_path = self.directory / "vectors.f32"
+        self._dim_path = self.directory / "dim"
+
+        self.dim = int(self._dim_path.read_text()) if self._dim_path.exists() else None
+        self._rows = {}  # digest -> row in the vectors file
+        self._count = 0  # rows read from the keys file so far
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        """Return the key of a text."""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _refresh(self):
+        """Pick up rows appended since the last refresh, and remap the vectors."""
+        if self.dim is None or not self._keys_path.exists():
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._count * 16)
+            tail = f.read()
+        # a crash may leave vectors without keys: only rows with both count
+        rows = min(self._count + len(tail) // 16, self._vector_rows())
+        for row in range(self._count, rows):
+            offset = (row - self._count) * 16
+            self._rows.setdefault(tail[offset : offset + 16], row)
+        self._count = rows
+        if rows:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+
+    def _vector_rows(self) -> int:
+        """Return the number of whole vectors in the vectors file."""
+        if not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // (4 * self.dim)
+
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """
+        Look up the cached vectors of several texts.
+
+        Returns:
+            One float32 vector per text, or None for texts not in the cache
+        """
+        with self._lock:
+            rows = [self._rows.get(self.digest(text)) for text in texts]
+            vectors = self._vectors
+            hits = sum(row is not None for row in rows)
+            self.hits += hits
+            self.misses += len(rows) - hits
+        return [None if row is None else np.array(vectors[row]) for row in rows]
+
+    def put_many(self, texts: list[str], vectors: np.ndarray):
+        """Add the vectors of texts that aren't cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._dim_path.write_text(str(self.dim))
+            self._refresh()
+
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = self.digest(text)
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+
+            # drop vectors a crash left without keys, then append vectors
+            # before keys so a key never points past the end of the vectors
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self._count * 4 * self.dim)
+                f.write(np.stack(list(new.values())).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.truncate(self._count * 16)
+                f.write(b"".join(new))
+            self._refresh()
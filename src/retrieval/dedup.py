@@ -0,0 +1,222 @@
+"""
+Detection of duplicate and near-duplicate chunks before they are embedded.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from .lexical import tokenize
+
+# modulus of the MinHash permutations, a Mersenne prime above every 32-bit hash
+_PRIME = np.uint64((1 << 61) - 1)
+
+
+class ChunkDeduplicator:
+    """
+    Remembers the chunks kept in the index and recognizes copies of them.
+
+    Chunks whose whitespace-normalized text was seen before are exact
+    duplicates. Otherwise a MinHash signature of the chunk's word shingles
+    estimates its Jaccard similarity to other chunks, and locality-sensitive
+    hashing (bands of the signature as bucket keys) finds the few kept
+    chunks worth comparing it with, so checking a chunk does not scan them
+    all. A duplicate is not stored; it is recorded as an alias of the chunk
+    it copies.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+    ):
+        """
+        Initialize the (empty, or previously saved) deduplicator.
+
+        Args:
+            path: JSON file it is saved to by flush(), or None to keep it in
+                memory only
+            threshold: Estimated Jaccard similarity of word shingles at which
+                a chunk counts as a near-duplicate (0 to 1)
+            num_perm: Number of hash permutations in each MinHash signature
+            bands: Number of LSH bands the signature is split into; more
+                bands find less similar candidates
+            shingle_size: Number of consecutive words in each shingle
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        # the same seed every run, so saved signatures stay comparable
+        rng = np.random.default_rng(5360)
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self._lock = threading.RLock()
+        self.clear()
+        if self.path and self.path.exists():
+            self._load()
+
+    def clear(self):
+        """Forget every chunk."""
+        with self._lock:
+            self._hashes = {}  # exact hash -> kept id
+            self._kept = {}  # kept id -> (exact hash, signature or None)
+            self._buckets = {}  # (band, band bytes) -> kept ids
+            self.aliases = {}  # duplicate id -> id of the kept chunk it copies
+
+    def __len__(self) -> int:
+        return len(self._kept)
+
+    @property
+    def duplicates(self) -> int:
+        """Return the number of chunks currently skipped as duplicates."""
+        return len(self.aliases)
+
+    def check(self, doc_id: str, text: str) -> str | None:
+        """
+        Decide whether a chunk copies one already kept.
+
+        Args:
+            doc_id: Id of the chunk
+            text: Text of the chunk
+
+        Returns:
+            The id of the kept chunk it duplicates (the chunk is then
+            recorded as its alias), or None if the chunk is new and is now
+            kept itself; checking an id again replaces what it was
+        """
+        exact = hashlib.sha1(" ".join(text.split()).encode()).hexdigest()
+        signature = self.signature(text)
+        with self._lock:
+            self.delete([doc_id])
+            original = self._hashes.get(exact)
+            if original is None and signature is not None:
+                original = self._near_duplicate(signature)
+            if original is not None:
+                self.aliases[doc_id] = original
+                return original
+            self._keep(doc_id, exact, signature)
+            return None
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """Return the MinHash signature of a text's word shingles (None if it has no words)."""
+        words = tokenize(text)
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), np.uint64, len(shingles))
+        # each permutation is a * h + b mod a prime (no overflow: a, b < 2^31, h < 2^32);
+        # the signature keeps the minimum of each one
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _near_duplicate(self, signature: np.ndarray) -> str | None:
+        """Return the kept chunk most similar to a signature, if similar enough."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            # the fraction of equal minimums estimates the Jaccard similarity
+            similarity = float(np.mean(self._kept[candidate][1] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _band_keys(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        """Return the LSH bucket keys of a signature, one per band."""
+        return [
+            (band, rows.tobytes()) for band, rows in enumerate(signature.reshape(self.bands, -1))
+        ]
+
+    def _keep(self, doc_id: str, exact: str, signature: np.ndarray | None):
+        """Record a chunk as kept."""
+        self._hashes[exact] = doc_id
+        self._kept[doc_id] = (exact, signature)
+        if signature is not None:
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, []).append(doc_id)
+
+    def delete(self, ids: list[str]) -> list[str]:
+        """
+        Forget chunks by id (unknown ids are ignored).
+
+        Args:
+            ids: Ids of kept chunks or of duplicates
+
+        Returns:
+            Ids of the duplicates whose kept chunk was deleted; their text is
+            no longer in the index, so they need to be indexed again
+        """
+        with self._lock:
+            doomed = set()
+            for doc_id in ids:
+                self.aliases.pop(doc_id, None)
+                entry = self._kept.pop(doc_id, None)
+                if entry is None:
+                    continue
+                doomed.add(doc_id)
+                exact, signature = entry
+                del self._hashes[exact]
+                if signature is not None:
+                    for key in self._band_keys(signature):
+                        self._buckets[key].remove(doc_id)
+                        if not self._buckets[key]:
+                            del self._buckets[key]
+
+            if not doomed:
+                return []
+            orphans = [alias for alias, original in self.aliases.items() if original in doomed]
+            for alias in orphans:
+                del self.aliases[alias]
+            return orphans
+
+    def flush(self):
+        """Save the kept chunks and aliases to the path, if there is one."""
+        if self.path is None:
+            return
+        with self._lock:
+            data = {
+                "kept": {
+                    doc_id: [exact, None if signature is None else signature.tolist()]
+                    for doc_id, (exact, signature) in self._kept.items()
+                },
+                "aliases": self.aliases,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def _load(self):
+        """Read the state saved by flush()."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for doc_id, (exact, signature) in data["kept"].items():
+            if signature is not None:
+                signature = np.array(signature, dtype=np.uint32)
+            self._keep(doc_id, exact, signature)
+        self.aliases = data["aliases"]
@@ -8,8 +8,37 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
+import importlib.util
+import json
+import logging
+import platform
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from .cache import EmbeddingCache, LRUCache
+from .timing import Timings
+
+logger = logging.getLogger(__name__)
+
+# inference backends: the PyTorch model, or an ONNX Runtime export of it
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# sentences used to measure how far an exported model drifts from PyTorch
+DRIFT_TEXTS = [
+    "What is machine learning?",
+    "Python is a popular programming language for data science.",
+    "The vector store keeps an embedding for every chunk of every document.",
+    "Dracula is a novel by Bram Stoker, published in 1897.",
+    "How do I install the package on Windows?",
+    "Search results are ranked by their distance to the query.",
+    "a",
+    "Semantic search finds documents that mean the same thing as the query, "
+    "even when they share none of its words.",
+]
 
 
 class DocumentEmbedder:
@@ -17,22 +46,210 @@ class DocumentEmbedder:
     Document Embedder
     """
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        """Initialize embedder with the specified model."""
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        query_cache_size: int = 1024,
+        query_cache_ttl: float | None = 3600.0,
+        cache_dir: str | None = None,
+        backend: str = "torch",
+        export_dir: str | None = None,
+        timings: Timings | None = None,
+    ):
+        """
+        Initialize embedder with the specified model.
+
+        Args:
+            model_name: Name of the sentence-transformers model
+            query_cache_size: Most query embeddings kept (0 disables the cache)
+            query_cache_ttl: Seconds a cached query embedding stays valid
+            cache_dir: Directory of an on-disk cache of document embeddings,
+                so text embedded once is never embedded again; None disables it
+            backend: "torch" to run the PyTorch model, "onnx" to run an ONNX
+                Runtime export of it, or "onnx-int8" for a dynamically
+                quantized int8 export (fastest on CPU)
+            export_dir: Directory the ONNX exports are made in once and
+                reused from; defaults to ~/.cache/retrieval/onnx
+            timings: Timings to record the 'import' and 'model_load' stages in
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}'")
+
         self.model_name = model_name
-        # use SentenceTransformer model
-        self.model = SentenceTransformer(model_name)
+        self.backend = backend
+        # vectors of different backends differ slightly, so cache them apart
+        self.cache_name = model_name if backend == "torch" else f"{model_name}-{backend}"
+        # how far the exported model's vectors are from PyTorch's, if exported
+        self.drift = None
+        self.timings = timings if timings is not None else Timings()
+        with self.timings.measure("import"):
+            # torch and transformers take seconds to import, so wait until needed
+            from sentence_transformers import SentenceTransformer
+
+        if backend == "torch":
+            with self.timings.measure("model_load"):
+                # use SentenceTransformer model
+                self.model = SentenceTransformer(model_name)
+        else:
+            directory, file_name = export_onnx(model_name, export_dir, backend == "onnx-int8")
+            with self.timings.measure("model_load"):
+                self.model = SentenceTransformer(
+                    str(directory), backend="onnx", model_kwargs={"file_name": file_name}
+                )
+            self.drift = json.loads((directory / "drift.json").read_text())[file_name]
+            logger.info(f"Embedding with {directory / file_name}, drift from PyTorch: {self.drift}")
+        # repeated queries skip the model entirely
+        self.query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.embedding_cache = EmbeddingCache(cache_dir, self.cache_name) if cache_dir else None
+
+    @property
+    def tokenizer(self):
+        """Return the model's tokenizer."""
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        """Return the most tokens the model reads; anything longer is truncated."""
+        return self.model.max_seq_length
 
     def embed_documents(self, texts: list[str]) -> np.ndarray:
         """Generate embeddings for multiple documents."""
+        if self.embedding_cache is None or not texts:
+            return self._encode(texts)
+
+        # only run the model on text the cache has never seen
+        vectors = self.embedding_cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = self._encode(missing)
+            self.embedding_cache.put_many(missing, computed)
+            computed = dict(zip(missing, computed))
+            vectors = [computed[text] if v is None else v for text, v in zip(texts, vectors)]
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        """Run the model on texts."""
         return self.model.encode(texts, show_progress_bar=False)
 
     def embed_query(self, queries: str | list[str]) -> np.ndarray:
         """Generate embedding for a single query."""
         # handle single textual query or a list of queries
         if isinstance(queries, str):
-            queries = [queries]
-            results = self.embed_documents(queries)
-            return results[0]
-        else:
-            return self.embed_documents(queries)
+            return self._embed_queries([queries])[0]
+        if not queries:
+            return self._encode([])
+        return np.stack(self._embed_queries(queries))
+
+    def _embed_queries(self, queries: list[str]) -> list[np.ndarray]:
+        """Embed queries, using cached vectors where possible."""
+        texts = [" ".join(query.split()) for query in queries]
+        vectors = [self.query_cache.get((self.cache_name, text)) for text in texts]
+
+        # embed each distinct query that wasn't cached, all in one call
+        missing = list(dict.fromkeys(text for text, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = dict(zip(missing, self._encode(missing)))
+            for text, vector in computed.items():
+                vector.setflags(write=False)  # shared by everyone who hits the cache
+                self.query_cache.put((self.cache_name, text), vector)
+            vectors = [computed[text] if v is None else v for text, v in zip(texts, vectors)]
+        return vectors
+
+
+def export_onnx(
+    model_name: str, export_dir: str | None = None, quantize: bool = False
+) -> tuple[Path, str]:
+    """
+    Export a model to ONNX (and optionally int8), unless already done.
+
+    The export is a one-time step: later calls find the files on disk.
+    Each new file's drift from the PyTorch model is measured on
+    DRIFT_TEXTS and saved to drift.json next to it.
+
+    Args:
+        model_name: Name of the sentence-transformers model
+        export_dir: Directory holding the exports of all models;
+            defaults to ~/.cache/retrieval/onnx
+        quantize: Also make a dynamically quantized int8 export
+
+    Returns:
+        The export's directory, and the ONNX file to load relative to it
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    for module in ("optimum", "onnxruntime"):
+        if importlib.util.find_spec(module) is None:
+            raise ImportError(
+                "The ONNX embedding backends need optimum and onnxruntime: "
+                "pip install 'sentence-transformers[onnx]'"
+            )
+
+    root = Path(export_dir) if export_dir else Path.home() / ".cache" / "retrieval" / "onnx"
+    directory = root / re.sub(r"[^\w.-]", "_", model_name)
+    config, suffix = quantization_config()
+    file_name = f"onnx/model_{suffix}.onnx" if quantize else "onnx/model.onnx"
+    drift_path = directory / "drift.json"
+    drift = json.loads(drift_path.read_text()) if drift_path.exists() else {}
+    if (directory / file_name).exists() and file_name in drift:
+        return directory, file_name
+
+    logger.info(f"Exporting {model_name} to {directory / file_name} (one time only)...")
+    reference = SentenceTransformer(model_name)
+    if not (directory / "onnx" / "model.onnx").exists():
+        # export from the local PyTorch copy, then move the result into place
+        with tempfile.TemporaryDirectory() as tmp:
+            reference.save_pretrained(f"{tmp}/torch")
+            SentenceTransformer(f"{tmp}/torch", backend="onnx").save_pretrained(f"{tmp}/onnx")
+            directory.parent.mkdir(parents=True, exist_ok=True)
+            shutil.rmtree(directory, ignore_errors=True)
+            shutil.move(f"{tmp}/onnx", directory)
+        drift = {}
+    if quantize and not (directory / file_name).exists():
+        model = SentenceTransformer(str(directory), backend="onnx")
+        # the suffix is passed so the file written is the one loaded
+        export_dynamic_quantized_onnx_model(model, config, str(directory), file_suffix=suffix)
+
+    model = SentenceTransformer(
+        str(directory), backend="onnx", model_kwargs={"file_name": file_name}
+    )
+    drift[file_name] = embedding_drift(reference.encode(DRIFT_TEXTS), model.encode(DRIFT_TEXTS))
+    drift_path.write_text(json.dumps(drift, indent=2))
+    return directory, file_name
+
+
+def quantization_config() -> tuple[str, str]:
+    """
+    Choose the int8 quantization for this machine's CPU.
+
+    Returns:
+        The quantization config name, and the suffix of its ONNX file, named
+        after the weights' type as optimum names it (e.g. 'qint8_arm64')
+    """
+    # int8 kernels differ by CPU; AVX2 runs on any recent x86 server
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64", "qint8_arm64"
+    return "avx2", "quint8_avx2"
+
+
+def embedding_drift(reference: np.ndarray, vectors: np.ndarray) -> dict:
+    """
+    Compare two models' embeddings of the same texts.
+
+    Args:
+        reference: Embeddings from the reference (fp32 PyTorch) model
+        vectors: Embeddings of the same texts from another model
+
+    Returns:
+        Mean and minimum cosine similarity between matching rows, and the
+        largest absolute difference of any component
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    cosine = np.sum(reference * vectors, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1)
+    )
+    return {
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "max_abs_diff": float(np.abs(reference - vectors).max()),
+    }
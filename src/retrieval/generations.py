@@ -0,0 +1,173 @@
+"""
+Index generations built once and shared read-only by several processes.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+from .retriever import DocumentRetriever
+
+logger = logging.getLogger(__name__)
+
+# file in the root naming the generation readers should use
+CURRENT = "CURRENT"
+
+
+def current_generation(root: str | Path) -> Path | None:
+    """
+    Return the directory of the published generation.
+
+    Args:
+        root: Directory holding the generations
+
+    Returns:
+        The generation's directory, or None if none was published
+    """
+    pointer = Path(root) / CURRENT
+    try:
+        name = pointer.read_text().strip()
+    except FileNotFoundError:
+        return None
+    return Path(root) / name if name else None
+
+
+def publish(root: str | Path, generation: str | Path):
+    """
+    Point readers at a generation, atomically.
+
+    Args:
+        root: Directory holding the generations
+        generation: Directory of the generation, inside root
+    """
+    pointer = Path(root) / CURRENT
+    tmp = pointer.with_name(CURRENT + ".tmp")
+    tmp.write_text(Path(generation).name + "\n")
+    os.replace(tmp, pointer)
+
+
+def build_generation(
+    documents_dir: str, root: str | Path, keep: int = 2, **options
+) -> tuple[Path, DocumentRetriever]:
+    """
+    Index a directory into a new generation, publish it, and prune old ones.
+
+    The generation is complete on disk before CURRENT names it, so readers
+    never see half an index. The chunk embedding cache is shared by all
+    generations, so only new or changed text is embedded again.
+
+    Args:
+        documents_dir: Directory containing the documents
+        root: Directory holding the generations
+        keep: Number of generations kept, counting the new one; older ones
+            are deleted (processes still mapping them keep their data)
+        **options: DocumentRetriever settings; the backend must be one of
+            the NumPy ones, since only those can be shared read-only, and
+            defaults to "numpy"; the embedding cache defaults to an
+            'embeddings' folder in root
+
+    Returns:
+        The new generation's directory, and the retriever that built it
+    """
+    # unset settings (None) get the shared defaults
+    if options.get("backend") is None:
+        options["backend"] = "numpy"
+    if not options["backend"].startswith("numpy"):
+        raise ValueError("Shared indexes need a numpy backend")
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    root = Path(root)
+    if options.get("embedding_cache_dir") is None:
+        options["embedding_cache_dir"] = str(root / "embeddings")
+
+    generation = root / f"gen-{time.time_ns()}"
+    try:
+        retriever = DocumentRetriever(persist_directory=str(generation), **options)
+        retriever.index_documents(documents_dir)
+    except BaseException:
+        shutil.rmtree(generation, ignore_errors=True)
+        raise
+    publish(root, generation)
+    logger.info(f"Published {generation} with {retriever.document_count} chunks")
+
+    old = sorted(path for path in root.glob("gen-*") if path.is_dir())[:-keep]
+    for path in old:
+        shutil.rmtree(path, ignore_errors=True)
+    return generation, retriever
+
+
+class GenerationWatcher:
+    """
+    Switch a read-only retriever to each newly published generation.
+
+    Checking is one small file read per interval; switching opens the new
+    generation (mapping its files) in a worker thread while searches go on
+    with the old one.
+    """
+
+    def __init__(self, retriever, root: str | Path, interval: float = 2.0):
+        """
+        Initialize the watcher.
+
+        Args:
+            retriever: DocumentRetriever opened read-only on a generation
+            root: Directory holding the generations
+            interval: Seconds between checks for a new generation
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.retriever = retriever
+        self.root = Path(root)
+        self.interval = interval
+        self.generation = current_generation(root)
+        self._worker = None
+        self._stop = None
+
+    @property
+    def running(self) -> bool:
+        """Return True if the watcher is watching."""
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start watching on the running event loop."""
+        if self.running:
+            return
+        self._stop = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop watching, letting a switch in progress finish first."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self):
+        """Open each new generation as it is published."""
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            generation = current_generation(self.root)
+            if generation is None or generation == self.generation:
+                continue
+            try:
+                await asyncio.to_thread(self.retriever.open_index, str(generation))
+                self.generation = generation
+                logger.info(f"Switched to index generation {generation.name}")
+            except Exception as e:
+                # stay on the old generation, and try again next time
+                logger.error(f"Opening index generation {generation} failed: {e}")
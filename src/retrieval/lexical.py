@@ -0,0 +1,221 @@
+"""
+Lexical (keyword) search with a BM25 inverted index.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word tokens."""
+    return _WORD.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index scoring documents with Okapi BM25.
+
+    Each term maps to the documents containing it and how often, so a
+    query only touches the documents that share a word with it. Removed
+    documents leave their rows empty until those outnumber the live ones;
+    then the rows are renumbered, so churn doesn't grow the index.
+    """
+
+    def __init__(self, path: str | Path | None = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize the (empty, or previously saved) index.
+
+        Args:
+            path: JSON file the index is saved to by flush(), or None to
+                keep it in memory only
+            k1: How quickly repeated terms stop adding to the score
+            b: How much long documents are penalized (0 to 1)
+        """
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.clear()
+        if self.path and self.path.exists():
+            self._load()
+
+    def clear(self):
+        """Remove every document."""
+        with self._lock:
+            self._postings = {}  # term -> {row: term frequency}
+            self._terms = {}  # row -> {term: term frequency}
+            self._lengths = np.zeros(64)  # row -> number of tokens, grown by doubling
+            self._ids = {}  # row -> id
+            self._rows = {}  # id -> row
+            self._next_row = 0
+            self._total_length = 0
+            self._arrays = {}  # term -> (rows, frequencies) arrays, built on demand
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: list[str], texts: list[str]):
+        """Add (or replace) documents."""
+        counts = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            self.delete([doc_id for doc_id in ids if doc_id in self._rows])
+            for doc_id, terms in zip(ids, counts):
+                self._insert(doc_id, terms)
+
+    def _insert(self, doc_id: str, terms: dict[str, int]):
+        """Add one document's term frequencies under a new row."""
+        row = self._next_row
+        self._next_row += 1
+        if row == len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths))])
+        self._ids[row] = doc_id
+        self._rows[doc_id] = row
+        self._terms[row] = terms
+        self._lengths[row] = length = sum(terms.values())
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[row] = frequency
+            self._arrays.pop(term, None)
+
+    def delete(self, ids: list[str]):
+        """Remove documents by id (unknown ids are ignored)."""
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                del self._ids[row]
+                self._total_length -= self._lengths[row]
+                self._lengths[row] = 0
+                for term in self._terms.pop(row):
+                    postings = self._postings[term]
+                    del postings[row]
+                    if not postings:
+                        del self._postings[term]
+                    self._arrays.pop(term, None)
+            if self._next_row - len(self._rows) > max(len(self._rows), 64):
+                self._compact()
+
+    def _compact(self):
+        """Renumber the live rows from 0, keeping their order, to drop the empty ones."""
+        rows = sorted(self._ids)
+        renumbered = {row: new for new, row in enumerate(rows)}
+        self._ids = {new: self._ids[row] for row, new in renumbered.items()}
+        self._rows = {doc_id: new for new, doc_id in self._ids.items()}
+        self._terms = {new: self._terms[row] for row, new in renumbered.items()}
+        self._postings = {
+            term: {renumbered[row]: frequency for row, frequency in postings.items()}
+            for term, postings in self._postings.items()
+        }
+        lengths = np.zeros(max(2 * len(rows), 64))
+        lengths[: len(rows)] = self._lengths[rows]
+        self._lengths = lengths
+        self._next_row = len(rows)
+        self._arrays = {}
+
+    def search(self, query: str, n_results: int = 100) -> list[tuple[str, float]]:
+        """
+        Find the documents that best match the words of a query.
+
+        Args:
+            query: Search query text
+            n_results: Most documents returned
+
+        Returns:
+            (id, score) tuples, best first; documents sharing no word with
+            the query are never returned
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._rows)
+            if not count or n_results < 1:
+                return []
+            average_length = self._total_length / count
+
+            scores = np.zeros(self._next_row)
+            for term in terms:
+                if term not in self._postings:
+                    continue
+                rows, frequencies = self._term_arrays(term)
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / average_length)
+                scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+
+            matched = np.flatnonzero(scores)
+            if len(matched) > n_results:
+                matched = matched[np.argpartition(-scores[matched], n_results - 1)[:n_results]]
+            # best first, ties in the order documents were added
+            matched = matched[np.lexsort((matched, -scores[matched]))]
+            return [(self._ids[row], float(scores[row])) for row in matched.tolist()]
+
+    def _term_arrays(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return a term's postings as arrays of rows and frequencies."""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = (
+                np.fromiter(postings.keys(), np.int64, len(postings)),
+                np.fromiter(postings.values(), np.float64, len(postings)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def flush(self):
+        """Save the index to its path, if it has one."""
+        if self.path is None:
+            return
+        with self._lock:
+            rows = sorted(self._ids)
+            data = {
+                "ids": [self._ids[row] for row in rows],
+                "terms": [self._terms[row] for row in rows],
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def _load(self):
+        """Read an index saved by flush()."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for doc_id, terms in zip(data["ids"], data["terms"]):
+            self._insert(doc_id, terms)
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """
+    Merge several rankings of the same ids into one.
+
+    Each id scores 1 / (k + rank) in every ranking it appears in (rank
+    starting at 1), so ids ranked well by several rankings rise to the
+    top without their raw scores having to be comparable.
+
+    Args:
+        rankings: Lists of ids, best first
+        k: Damping constant; larger values flatten the rank differences
+
+    Returns:
+        (id, fused score) tuples, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
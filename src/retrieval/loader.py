@@ -8,17 +8,123 @@ Seattle University, ARIN 5360
 """
 
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import pypdf
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# lookup table of the characters str.split() splits on (all are below U+3001)
+_SPACES = np.array([chr(c).isspace() for c in range(0x3002)])
+
+
+def _space_mask(text: str, block: int = 1 << 16) -> np.ndarray:
+    """Return a boolean array marking each whitespace character of text."""
+    parts = []
+    for i in range(0, len(text), block):
+        codepoints = np.frombuffer(text[i : i + block].encode("utf-32-le"), dtype=np.uint32)
+        parts.append(_SPACES[np.minimum(codepoints, len(_SPACES) - 1)])
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=bool)
+
+
+class Chunk:
+    """
+    One chunk of a document, stored as offsets into the document's text.
+
+    Reads like the {'id', 'text', 'metadata'} dicts used everywhere else,
+    but every chunk of a document points into the same source string and
+    the text and metadata are only built when asked for. With collapse set,
+    the text comes back with each run of whitespace turned into one space,
+    collapsed on first use and kept.
+    """
+
+    __slots__ = ("doc_id", "index", "source", "start", "end", "collapse", "_text", "_metadata")
+    _fields = ("id", "text", "metadata")
+
+    def __init__(
+        self, doc_id: str, index: int, source: str, start: int, end: int, collapse: bool = False
+    ):
+        self.doc_id = doc_id
+        self.index = index
+        self.source = source
+        self.start = start
+        self.end = end
+        self.collapse = collapse
+        self._text = None
+        self._metadata = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.doc_id}_{self.index}"
+
+    @property
+    def text(self) -> str:
+        if self._text is not None:
+            return self._text
+        text = self.source[self.start : self.end]
+        if self.collapse:
+            # collapsing costs a pass over the text, so it is only done once
+            self._text = text = " ".join(text.split())
+        return text
+
+    @property
+    def metadata(self) -> dict:
+        if self._metadata is None:
+            self._metadata = {"chunk": self.index, "doc_id": self.doc_id}
+        return self._metadata
+
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields
+
+    def keys(self) -> tuple:
+        return self._fields
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Chunk, dict)):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Chunk(id={self.id!r}, start={self.start}, end={self.end})"
+
 
 class DocumentChunker:
     """Chunk documents into smaller pieces for better retrieval."""
 
-    def __init__(self, chunk_size: int = 300, overlap: int = 30):
+    # words per piece of text handed to the tokenizer
+    segment_words = 100
+
+    def __init__(
+        self,
+        chunk_size: int = 300,
+        overlap: int = 30,
+        tokenizer=None,
+        max_length: int | None = None,
+        batch_size: int = 64,
+    ):
+        """
+        Initialize the chunker.
+
+        Args:
+            chunk_size: Words per chunk, or tokens per chunk with a tokenizer
+            overlap: Words (or tokens) shared by consecutive chunks
+            tokenizer: Fast Hugging Face tokenizer of the embedding model; when
+                given, chunks are measured in its tokens instead of words
+            max_length: Most tokens the embedding model reads (including
+                special tokens); chunk_size is capped to fit inside it
+            batch_size: Number of text pieces tokenized per tokenizer call
+        """
+        if tokenizer is not None and max_length is not None:
+            chunk_size = min(chunk_size, max_length - tokenizer.num_special_tokens_to_add())
+
         if overlap < 0:
             raise ValueError("Overlap must be non-negative.")
         if overlap >= chunk_size:
@@ -26,27 +132,80 @@ class DocumentChunker:
 
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
 
-    def chunk_text(self, text: str, doc_id: str) -> list[dict]:
+    def chunk_text(self, text: str, doc_id: str) -> list[Chunk]:
         """Split the given text into overlapping chunks."""
 
-        words = text.split()
-        if len(words) < self.chunk_size:
-            return [{"id": f"{doc_id}_0", "text": text, "metadata": {"chunk": 0, "doc_id": doc_id}}]
-
+        # find where every word starts and ends in one vectorized pass
+        # instead of splitting the text into a list of word strings
+        is_space = _space_mask(text)
+        edges = np.diff(is_space.view(np.int8), prepend=np.int8(1), append=np.int8(1))
+        starts = np.flatnonzero(edges == -1)
+        ends = np.flatnonzero(edges == 1)
+
+        if self.tokenizer is not None:
+            return self._chunk_tokens(text, doc_id, starts, ends)
+
+        num_words = len(starts)
+        if num_words < self.chunk_size:
+            return [Chunk(doc_id, 0, text, 0, len(text))]
+
+        # chunks are the words joined by single spaces; if the text already
+        # looks like that, a chunk is just a slice of it
+        first, last = int(starts[0]), int(ends[-1])
+        gaps = num_words - 1
+        single_spaced = (
+            np.count_nonzero(is_space[first:last]) == gaps and text.count(" ", first, last) == gaps
+        )
+        del is_space, edges
+
+        return self._windows(doc_id, text, starts, ends, collapse=not single_spaced)
+
+    def _chunk_tokens(
+        self, text: str, doc_id: str, starts: np.ndarray, ends: np.ndarray
+    ) -> list[Chunk]:
+        """Split text into windows of tokenizer tokens, kept as raw slices."""
+        # tokenize runs of whole words, batch_size runs per tokenizer call
+        pieces = [
+            (int(starts[i]), int(ends[min(i + self.segment_words, len(starts)) - 1]))
+            for i in range(0, len(starts), self.segment_words)
+        ]
+        offsets = []
+        for b in range(0, len(pieces), self.batch_size):
+            batch = pieces[b : b + self.batch_size]
+            encoded = self.tokenizer(
+                [text[start:end] for start, end in batch],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+            for (start, _), mapping in zip(batch, encoded["offset_mapping"]):
+                if mapping:
+                    offsets.append(np.asarray(mapping, dtype=np.int64) + start)
+
+        if not offsets:
+            return [Chunk(doc_id, 0, text, 0, len(text))]
+        offsets = np.concatenate(offsets)
+        if len(offsets) <= self.chunk_size:
+            return [Chunk(doc_id, 0, text, 0, len(text))]
+
+        return self._windows(doc_id, text, offsets[:, 0], offsets[:, 1])
+
+    def _windows(
+        self, doc_id: str, text: str, starts: np.ndarray, ends: np.ndarray, collapse: bool = False
+    ) -> list[Chunk]:
+        """Make overlapping chunks of chunk_size units with the given spans."""
+        count = len(starts)
         chunks, start, chunk_num = [], 0, 0
-        while start < len(words):
-            end = start + self.chunk_size
-            chunk_text = " ".join(words[start:end])
-
+        while start < count:
+            end = min(start + self.chunk_size, count)
             chunks.append(
-                {
-                    "id": f"{doc_id}_{chunk_num}",
-                    "text": chunk_text,
-                    "metadata": {"chunk": chunk_num, "doc_id": doc_id},
-                }
+                Chunk(doc_id, chunk_num, text, int(starts[start]), int(ends[end - 1]), collapse)
             )
-            start = end - self.overlap
+            start += self.chunk_size - self.overlap
             chunk_num += 1
         return chunks
 
@@ -56,9 +215,22 @@ class DocumentLoader:
     Load and parse documents from the file system.
     """
 
-    def __init__(self, chunker: DocumentChunker = None):
-        """Initialize loader with optional chunker"""
+    def __init__(self, chunker: DocumentChunker = None, max_workers: int = 0):
+        """
+        Initialize loader with optional chunker.
+
+        Args:
+            chunker: Chunker to split each document with, or None
+            max_workers: Number of processes parsing files in parallel;
+                0 or 1 parses them one at a time in this process
+        """
+        if max_workers < 0:
+            raise ValueError("max_workers must be non-negative")
+
         self.chunker = chunker
+        self.max_workers = max_workers
+        # filename -> error message for files that failed to load
+        self.errors = {}
 
     def load_documents(self, directory: str) -> list[dict]:
         """
@@ -70,76 +242,153 @@ class DocumentLoader:
         Returns:
             List of documents, each with 'id', 'text' and 'metadata'.
         """
-        documents = []
+        return list(self.iter_documents(directory))
+
+    def iter_documents(self, directory: str):
+        """
+        Lazily load the documents in a directory, one file at a time.
+
+        Only the file being parsed (plus a few files parsed ahead when
+        running in parallel) is held in memory.
+
+        Args:
+            directory: Path to a directory containing documents
+
+        Yields:
+            Documents, each with 'id', 'text' and 'metadata'.
+        """
+        for _, docs in self.load_files(self.list_files(directory)):
+            yield from docs
+
+    def list_files(self, directory: str) -> list[Path]:
+        """
+        List the supported files in a directory, text files first.
+
+        Args:
+            directory: Path to a directory containing documents
+
+        Returns:
+            List of paths to .txt and .pdf files
+        """
         path = Path(directory)
         if not path.is_dir() or not path.exists():
             raise ValueError(f"Directory '{directory}' does not exist.")
 
-        # load text files
-        for filepath in path.glob("*.txt"):
-            docs = self._load_text_file(filepath)
-            documents.extend(docs)
+        return sorted(path.glob("*.txt")) + sorted(path.glob("*.pdf"))
 
-        # Load PDF files
-        for filepath in path.glob("*.pdf"):
-            logger.info(f"Loading document: {filepath}")
-            docs = self._load_pdf_file(filepath)
-            documents.extend(docs)
+    def load_files(self, filepaths: list[Path]):
+        """
+        Load several files, in parallel if max_workers allows it.
 
-        return documents
+        Files that fail to load yield no documents and are recorded in
+        self.errors, which is reset on every call.
 
-    def _load_text_file(self, filepath: Path) -> list[dict]:
-        """Load a single txt file"""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                text = f.read().strip()
+        Args:
+            filepaths: Paths of the files to load
 
-            if not text:
-                return []
+        Yields:
+            (filepath, documents) tuples in the order of filepaths
+        """
+        self.errors = {}
+        filepaths = [Path(filepath) for filepath in filepaths]
+
+        if self.max_workers > 1 and len(filepaths) > 1:
+            # spawn, not fork: the parent may already run model and DB threads
+            context = multiprocessing.get_context("spawn")
+            workers = min(self.max_workers, len(filepaths))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                # keep only a few files in flight so results don't pile up
+                pending = deque()
+                for filepath in filepaths:
+                    pending.append((filepath, pool.submit(self._try_load, filepath)))
+                    if len(pending) >= 2 * workers:
+                        done, future = pending.popleft()
+                        yield done, self._report(done, *future.result())
+                while pending:
+                    done, future = pending.popleft()
+                    yield done, self._report(done, *future.result())
+            return
+
+        for filepath in filepaths:
+            docs, error = self._try_load(filepath)
+            yield filepath, self._report(filepath, docs, error)
+
+    def load_file(self, filepath: Path) -> list[dict]:
+        """
+        Load a single .txt or .pdf file.
 
-            doc_id = filepath.stem
-            metadata = {"filename": filepath.name, "type": "txt"}
+        Args:
+            filepath: Path to the file
 
-            if self.chunker:
-                chunks = self.chunker.chunk_text(text, doc_id)
-                # add filename to each chunk's metadata
-                for chunk in chunks:
-                    chunk["metadata"].update(metadata)
-                return chunks
-            else:
-                return [{"id": doc_id, "text": text, "metadata": metadata}]
+        Returns:
+            List of documents (or chunks) from the file
+        """
+        [(_, docs)] = self.load_files([filepath])
+        return docs
 
+    def _try_load(self, filepath: Path) -> tuple[list[dict], str | None]:
+        """Load a file, returning its documents and an error message (or None)."""
+        try:
+            if filepath.suffix == ".pdf":
+                return self._load_pdf_file(filepath), None
+            return self._load_text_file(filepath), None
         except Exception as e:
-            logger.warning(f"Warning: Failed to load  {filepath} : {e}")
+            return [], str(e)
+
+    def _report(self, filepath: Path, docs: list[dict], error: str | None) -> list[dict]:
+        """Log and remember a failed file; pass the documents through."""
+        if error is not None:
+            logger.warning(f"Warning: Failed to load  {filepath} : {error}")
+            self.errors[filepath.name] = error
+        elif filepath.suffix == ".pdf":
+            logger.info(f"Loaded document: {filepath}")
+        return docs
+
+    def _load_text_file(self, filepath: Path) -> list[dict]:
+        """Load a single txt file"""
+        with open(filepath, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+
+        if not text:
             return []
 
-    def _load_pdf_file(self, filepath: Path) -> list[dict]:
-        """Load a single PDF file."""
-        try:
-            reader = pypdf.PdfReader(filepath)
+        doc_id = filepath.stem
+        metadata = {"filename": filepath.name, "type": "txt"}
 
-            # Extract text from all pages
-            text_parts = []
-            for page in reader.pages:
-                text_parts.append(page.extract_text())
+        if self.chunker:
+            chunks = self.chunker.chunk_text(text, doc_id)
+            # add filename to each chunk's metadata
+            for chunk in chunks:
+                chunk["metadata"].update(metadata)
+            return chunks
+        else:
+            return [{"id": doc_id, "text": text, "metadata": metadata}]
 
-            text = "\n\n".join(text_parts).strip()
+    def _load_pdf_file(self, filepath: Path) -> list[dict]:
+        """Load a single PDF file."""
+        # imported here so processes that never see a PDF skip it
+        import pypdf
 
-            if not text:
-                return []
+        reader = pypdf.PdfReader(filepath)
 
-            doc_id = filepath.stem
-            metadata = {"filename": filepath.name, "type": "pdf", "num_pages": len(reader.pages)}
+        # Extract text from all pages
+        text_parts = []
+        for page in reader.pages:
+            text_parts.append(page.extract_text())
 
-            if self.chunker:
-                chunks = self.chunker.chunk_text(text, doc_id)
-                # Add PDF metadata to each chunk
-                for chunk in chunks:
-                    chunk["metadata"].update(metadata)
-                return chunks
-            else:
-                return [{"id": doc_id, "text": text, "metadata": metadata}]
+        text = "\n\n".join(text_parts).strip()
 
-        except Exception as e:
-            print(f"Warning: Failed to load  {filepath} : {e}")
+        if not text:
             return []
+
+        doc_id = filepath.stem
+        metadata = {"filename": filepath.name, "type": "pdf", "num_pages": len(reader.pages)}
+
+        if self.chunker:
+            chunks = self.chunker.chunk_text(text, doc_id)
+            # Add PDF metadata to each chunk
+            for chunk in chunks:
+                chunk["metadata"].update(metadata)
+            return chunks
+        else:
+            return [{"id": doc_id, "text": text, "metadata": metadata}]
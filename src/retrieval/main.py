@@ -7,16 +7,32 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
+import asyncio
+import json
 import logging
+import math
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from pathlib import Path
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.staticfiles import StaticFiles
 
+from retrieval.batching import QueryBatcher
+from retrieval.generations import GenerationWatcher, build_generation, current_generation
+from retrieval.metrics import CONTENT_TYPE, Registry, RequestMetrics
+from retrieval.progress import IndexProgress
 from retrieval.retriever import DocumentRetriever
+from retrieval.timing import Timings
+from retrieval.watcher import DirectoryWatcher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +41,210 @@ logger = logging.getLogger(__name__)
 # Global retriever instance
 retriever = None
 
+# Global batcher that groups concurrent /search requests
+batcher = None
+
+# Global startup progress, reported by /health
+progress = None
+
+# Uploads and deletes are indexed on one thread of their own, one after another,
+# so they never take the threads that answer searches
+indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexer")
+
+# Global watcher re-indexing the documents directory (if RETRIEVAL_WATCH is set),
+# or following the published generation of a shared index
+watcher = None
+
+# Where documents are read from and (optionally) where the index is kept
+DOCUMENTS_DIR = os.environ.get("RETRIEVAL_DOCUMENTS_DIR", "documents")
+INDEX_DIR = os.environ.get("RETRIEVAL_INDEX_DIR") or None
+EMBEDDING_CACHE_DIR = os.environ.get("RETRIEVAL_EMBEDDING_CACHE_DIR") or None
+
+# Vector store backend: "chroma", "numpy" for exact in-memory matrix search, or
+# "numpy-int8" / "numpy-binary" for quantized search with float rescoring; unset, it is
+# "numpy" for a shared index (the only kind that can be shared) and "chroma" otherwise
+STORE_BACKEND = os.environ.get("RETRIEVAL_STORE_BACKEND") or None
+
+# Embedding inference: "torch", or "onnx" / "onnx-int8" for ONNX Runtime on CPU
+EMBED_BACKEND = os.environ.get("RETRIEVAL_EMBED_BACKEND", "torch")
+ONNX_DIR = os.environ.get("RETRIEVAL_ONNX_DIR") or None
+
+# Processes used to parse documents while indexing (0 parses in-process)
+LOAD_WORKERS = int(os.environ.get("RETRIEVAL_LOAD_WORKERS", "0"))
+
+# Measure chunks in model tokens (capped at the model's sequence length) instead of words
+CHUNK_BY_TOKENS = os.environ.get("RETRIEVAL_CHUNK_BY_TOKENS", "").lower() in ("1", "true", "yes")
+
+# Build a BM25 keyword index too, and search in hybrid (keyword + vector) mode by default
+LEXICAL = os.environ.get("RETRIEVAL_LEXICAL", "").lower() in ("1", "true", "yes")
+
+# Skip chunks that (nearly) duplicate one already indexed, at this shingle similarity
+DEDUP = os.environ.get("RETRIEVAL_DEDUP", "").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.environ.get("RETRIEVAL_DEDUP_THRESHOLD", "0.85"))
+
+# Keep re-indexing the documents directory as files are added, changed or removed
+WATCH = os.environ.get("RETRIEVAL_WATCH", "").lower() in ("1", "true", "yes")
+WATCH_INTERVAL = float(os.environ.get("RETRIEVAL_WATCH_INTERVAL", "2"))
+
+# Chunks embedded per model call while indexing, and most written to the store at once
+EMBED_BATCH_SIZE = int(os.environ.get("RETRIEVAL_EMBED_BATCH_SIZE", "256"))
+INSERT_BATCH_SIZE = int(os.environ.get("RETRIEVAL_INSERT_BATCH_SIZE", "1024"))
+
+# Serve the index generation published in this directory read-only (memory-mapped, so
+# every worker process shares one copy) instead of indexing; "build" publishes one
+SHARED_INDEX_DIR = os.environ.get("RETRIEVAL_SHARED_INDEX_DIR") or None
+
+# How many concurrent queries are embedded together, and how long to wait for them
+BATCH_MAX_SIZE = int(os.environ.get("RETRIEVAL_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("RETRIEVAL_BATCH_MAX_WAIT_MS", "2"))
+
+# Most queries accepted by one /search/batch request
+MAX_BATCH_QUERIES = 1000
+
+
+def from_retriever(function):
+    """Wrap a function of the retriever so metrics can read it (nothing before startup)."""
+    return lambda: function(retriever) if retriever is not None else None
+
+
+def cache_stats(r: DocumentRetriever) -> dict:
+    """Return the (hits, misses) of each cache, by cache name."""
+    caches = {"result": r.result_cache, "query_embedding": r.embedder.query_cache}
+    if r.embedder.embedding_cache is not None:
+        caches["chunk_embedding"] = r.embedder.embedding_cache
+    return {name: (cache.hits, cache.misses) for name, cache in caches.items()}
+
+
+def index_bytes(r: DocumentRetriever) -> dict | None:
+    """Return the bytes of memory held by the NumPy index, by part."""
+    if not hasattr(r.store.backend, "memory_usage"):
+        return None  # ChromaDB doesn't say
+    usage = r.store.backend.memory_usage()
+    return {("codes",): usage["codes"], ("vectors",): usage["vectors"]}
+
+
+# What each stage in a /search Server-Timing header measured
+SERVER_TIMING_STAGES = {
+    "queue": "waiting for the batch",
+    "embed": "query embedding",
+    "lexical": "keyword search",
+    "query": "store query",
+    "format": "post-processing",
+    "serialize": "serialization",
+    "total": "total",
+}
+
+
+def server_timing(timings: Timings) -> str:
+    """Format a request's timings as a Server-Timing header (durations in milliseconds)."""
+    entries = [
+        f'{stage};desc="{SERVER_TIMING_STAGES.get(stage, stage)}";dur={seconds * 1000:.3f}'
+        for stage, seconds in timings.as_dict().items()
+        if stage not in ("cache_hit", "cache_miss")
+    ]
+    if timings.count("cache_hit") or timings.count("cache_miss"):
+        entries.append(f'cache;desc="{"hit" if timings.count("cache_hit") else "miss"}"')
+    return ", ".join(entries)
+
+
+# Metrics served by /metrics in the Prometheus text format; everything but the
+# request and search timings is read from the retriever only when scraped
+metrics = Registry()
+http_requests = metrics.counter(
+    "retrieval_http_requests_total", "HTTP requests answered", ("method", "route", "status")
+)
+http_errors = metrics.counter(
+    "retrieval_http_request_errors_total", "HTTP requests failed (5xx)", ("method", "route")
+)
+http_seconds = metrics.histogram(
+    "retrieval_http_request_duration_seconds",
+    "Seconds to answer HTTP requests",
+    ("method", "route"),
+)
+search_stage_seconds = metrics.histogram(
+    "retrieval_search_stage_seconds",
+    "Seconds per /search stage: embed, lexical, query and format per batched search, "
+    "serialize per response",
+    ("stage",),
+)
+search_batch_queries = metrics.histogram(
+    "retrieval_search_batch_queries",
+    "Queries answered by each batched /search call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+metrics.counter(
+    "retrieval_indexed_files_total",
+    "Files indexed",
+    function=from_retriever(lambda r: r.indexing_stats["files"]),
+)
+metrics.counter(
+    "retrieval_indexed_bytes_total",
+    "Bytes of the files indexed",
+    function=from_retriever(lambda r: r.indexing_stats["bytes"]),
+)
+metrics.counter(
+    "retrieval_indexed_chunks_total",
+    "Chunks added to the index",
+    function=from_retriever(lambda r: r.indexing_stats["chunks"]),
+)
+metrics.counter(
+    "retrieval_index_embed_seconds_total",
+    "Seconds spent embedding chunks",
+    function=from_retriever(lambda r: r.profile.as_dict().get("embed", 0.0)),
+)
+metrics.counter(
+    "retrieval_index_insert_seconds_total",
+    "Seconds spent writing chunks to the store",
+    function=from_retriever(lambda r: r.profile.as_dict().get("insert", 0.0)),
+)
+metrics.counter(
+    "retrieval_cache_hits_total",
+    "Cache lookups answered from the cache",
+    ("cache",),
+    function=from_retriever(lambda r: {(k,): h for k, (h, _) in cache_stats(r).items()}),
+)
+metrics.counter(
+    "retrieval_cache_misses_total",
+    "Cache lookups not in the cache",
+    ("cache",),
+    function=from_retriever(lambda r: {(k,): m for k, (_, m) in cache_stats(r).items()}),
+)
+metrics.gauge(
+    "retrieval_cache_hit_ratio",
+    "Fraction of cache lookups that were hits",
+    ("cache",),
+    function=from_retriever(
+        lambda r: {(k,): h / (h + m) if h + m else 0.0 for k, (h, m) in cache_stats(r).items()}
+    ),
+)
+metrics.gauge(
+    "retrieval_index_chunks",
+    "Chunks in the index",
+    function=from_retriever(lambda r: r.document_count),
+)
+metrics.gauge(
+    "retrieval_index_files",
+    "Files in the index",
+    function=from_retriever(lambda r: len(r.manifest.files)),
+)
+metrics.gauge(
+    "retrieval_index_bytes",
+    "Bytes of memory held by the NumPy index (memory-mapped vectors count 0)",
+    ("part",),
+    function=from_retriever(index_bytes),
+)
+
+
+class IndexProgressResponse(BaseModel):
+    """Response model for startup progress."""
+
+    files_total: int
+    files_processed: int
+    chunks_embedded: int
+    chunks_deduplicated: int = 0
+    elapsed_seconds: float
+    eta_seconds: float | None
+
 
 class HealthResponse(BaseModel):
     """Response model for health check."""
@@ -32,6 +252,42 @@ class HealthResponse(BaseModel):
     status: str
     documents_indexed: int
     message: str
+    phase: str = "ready"
+    index_generation: str | None = None
+    progress: IndexProgressResponse | None = None
+    startup_profile: dict[str, float] | None = None
+
+
+class SearchFilter(BaseModel):
+    """Conditions on a chunk's metadata and text, all of which must hold."""
+
+    type: str | None = None  # "txt" or "pdf"
+    filename: str | list[str] | None = None  # one file name, or any of several
+    doc_id: str | list[str] | None = None
+    min_pages: int | None = None  # only PDFs have a page count
+    max_pages: int | None = None
+    contains: str | None = None  # text the chunk must contain
+
+    def options(self) -> dict:
+        """Return the filter as the store's where and where_document arguments."""
+        clauses = []
+        if self.type is not None:
+            clauses.append({"type": self.type})
+        for field in ("filename", "doc_id"):
+            value = getattr(self, field)
+            if isinstance(value, list):
+                clauses.append({field: {"$in": value}})
+            elif value is not None:
+                clauses.append({field: value})
+        if self.min_pages is not None:
+            clauses.append({"num_pages": {"$gte": self.min_pages}})
+        if self.max_pages is not None:
+            clauses.append({"num_pages": {"$lte": self.max_pages}})
+
+        # ChromaDB wants at least two clauses under $and
+        where = clauses[0] if len(clauses) == 1 else {"$and": clauses} if clauses else None
+        where_document = {"$contains": self.contains} if self.contains else None
+        return {"where": where, "where_document": where_document}
 
 
 class SearchRequest(BaseModel):
@@ -39,6 +295,9 @@ class SearchRequest(BaseModel):
 
     query: str
     n_results: int = 5
+    mode: str | None = None
+    filter: SearchFilter | None = None
+    timings: bool = False  # also report the stage timings in the response body
 
 
 class SearchResponse(BaseModel):
@@ -47,27 +306,152 @@ class SearchResponse(BaseModel):
     query: str
     results: list[dict]
     count: int
+    # only when requested: milliseconds per stage, and whether the results were cached
+    timings: dict[str, float] | None = None
+    cached: bool | None = None
 
 
-# Define lifespan function to load models on startup
-@asynccontextmanager
-async def lifespan(_app: FastAPI):
-    # Code before the 'yield' is executed during application startup
+class BatchSearchRequest(BaseModel):
+    """Request model for batch search."""
+
+    queries: list[str]
+    n_results: int = 5
+    mode: str | None = None
+    filter: SearchFilter | None = None
+    stream: bool = False
+
+
+class BatchSearchResponse(BaseModel):
+    """Response model for batch search."""
+
+    results: list[SearchResponse]
+    count: int
+
+
+class DocumentUploadResponse(BaseModel):
+    """Response model for document upload."""
+
+    indexed: list[str]
+    errors: dict[str, str]
+    chunks_added: int
+    documents_indexed: int
+
+
+class DocumentDeleteResponse(BaseModel):
+    """Response model for document deletion."""
+
+    doc_id: str
+    files: list[str]
+    chunks_deleted: int
+    documents_indexed: int
+
+
+def retriever_options() -> dict:
+    """Return the DocumentRetriever settings configured by the environment."""
+    return dict(
+        load_workers=LOAD_WORKERS,
+        batch_size=EMBED_BATCH_SIZE,
+        insert_batch_size=INSERT_BATCH_SIZE,
+        chunk_by_tokens=CHUNK_BY_TOKENS,
+        lexical=LEXICAL,
+        dedup=DEDUP,
+        dedup_threshold=DEDUP_THRESHOLD,
+        embedding_cache_dir=EMBEDDING_CACHE_DIR,
+        backend=STORE_BACKEND or ("numpy" if SHARED_INDEX_DIR else "chroma"),
+        embed_backend=EMBED_BACKEND,
+        onnx_dir=ONNX_DIR,
+    )
+
+
+def timed_search_many(
+    queries: list[str], n_results: int, timings: Timings | None = None, **options
+) -> list[list[dict]]:
+    """Search a batch of queries, recording the seconds of each stage in the metrics."""
+    timings = timings if timings is not None else Timings()
+    results = retriever.search_many(queries, n_results, timings=timings, **options)
+    for stage, seconds in timings.as_dict().items():
+        search_stage_seconds.observe(seconds, stage)
+    search_batch_queries.observe(len(queries))
+    return results
+
+
+async def load_and_index():
+    """Load the model and index the documents without blocking the server."""
+    global retriever, batcher, watcher
     try:
-        logger.info("Loading models...")
+        if SHARED_INDEX_DIR:
+            generation = current_generation(SHARED_INDEX_DIR)
+            if generation is None:
+                raise RuntimeError(
+                    f"No index published in {SHARED_INDEX_DIR} "
+                    "(run: python -m retrieval.main build)"
+                )
 
-        # Index documents from the documents/ directory
-        global retriever
-        retriever = DocumentRetriever()
-        num_docs = retriever.index_documents("documents")
-        logger.info(f"Indexed {num_docs} documents successfully!")
+        logger.info("Loading models...")
+        # model loading and embedding are blocking, so they run in a thread
+        if SHARED_INDEX_DIR:
+            # only the model is loaded; the index is mapped, not built
+            retriever = await asyncio.to_thread(
+                DocumentRetriever,
+                persist_directory=str(generation),
+                read_only=True,
+                **retriever_options(),
+            )
+        else:
+            retriever = await asyncio.to_thread(
+                DocumentRetriever, persist_directory=INDEX_DIR, **retriever_options()
+            )
+
+        if progress.cancelled:
+            return
+
+        if not SHARED_INDEX_DIR:
+            # Index documents from the documents/ directory
+            num_docs = await asyncio.to_thread(retriever.index_documents, DOCUMENTS_DIR, progress)
+            if progress.cancelled:
+                return
+            logger.info(f"Indexed {num_docs} documents successfully!")
+
+        batcher = QueryBatcher(
+            timed_search_many,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            timed=True,
+        )
+        batcher.start()
+        progress.finish()
+
+        if SHARED_INDEX_DIR:
+            watcher = GenerationWatcher(retriever, SHARED_INDEX_DIR, interval=WATCH_INTERVAL)
+            watcher.start()
+        elif WATCH:
+            watcher = DirectoryWatcher(retriever, DOCUMENTS_DIR, interval=WATCH_INTERVAL)
+            watcher.start()
     except Exception as e:
-        # Don't crash the server, but log the error
+        # Don't crash the server, but log the error and report it in /health
         logger.error(f"Failed to load model: {str(e)}")
+        progress.fail(str(e))
+
+
+# Define lifespan function to load models on startup
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Code before the 'yield' is executed during application startup
+    global retriever, batcher, progress, watcher
+    retriever, batcher, watcher = None, None, None
+    progress = IndexProgress()
+    # bind the port right away; /health reports how far startup has got
+    startup = asyncio.create_task(load_and_index())
 
     yield  # The application starts receiving requests after the yield
 
     # Code after the 'yield' is executed during application shutdown
+    progress.cancel()
+    await startup
+    if watcher is not None:
+        await watcher.stop()
+    if batcher is not None:
+        await batcher.stop()
     logger.info("Application shutting down (lifespan)...")
 
 
@@ -90,20 +474,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count and time every request, by route
+app.add_middleware(RequestMetrics, requests=http_requests, errors=http_errors, seconds=http_seconds)
+
+
+def require_ready():
+    """Fail fast with 503 and a Retry-After hint until searches can be answered."""
+    if progress is not None and progress.ready and batcher is not None:
+        return
+    if progress is None or progress.phase == "failed":
+        raise HTTPException(status_code=503, detail="Retriever not initialized")
+
+    # retry about when indexing should be done, but at least every minute
+    eta = progress.eta()
+    retry_after = min(max(math.ceil(eta), 1), 60) if eta is not None else 5
+    raise HTTPException(
+        status_code=503,
+        detail=f"Index not ready ({progress.phase})",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def require_writable():
+    """Refuse with 409 to change an index shared read-only by several workers."""
+    if retriever.read_only:
+        raise HTTPException(
+            status_code=409,
+            detail="The index is shared read-only; build and publish a new generation instead",
+        )
+
+
+def check_mode(mode: str | None):
+    """Reject search modes the index can't answer."""
+    if mode not in (None, "vector", "hybrid"):
+        raise HTTPException(status_code=400, detail="mode must be 'vector' or 'hybrid'")
+    if mode == "hybrid" and retriever.lexical is None:
+        raise HTTPException(
+            status_code=400, detail="Hybrid search needs the keyword index (RETRIEVAL_LEXICAL=1)"
+        )
+
+
+def filter_options(search_filter: SearchFilter | None) -> dict:
+    """Return a request's filter as search keyword arguments (none if unfiltered)."""
+    if search_filter is None:
+        return {}
+    if [] in (search_filter.filename, search_filter.doc_id):
+        raise HTTPException(status_code=400, detail="Filter lists cannot be empty")
+    options = search_filter.options()
+    return {key: value for key, value in options.items() if value is not None}
+
 
 @app.post("/search", response_model=SearchResponse)
 async def search(request: SearchRequest):
     """
     Search for documents relevant to the query.
 
+    The Server-Timing header breaks the request down into the wait for its
+    batch, query embedding, store query, post-processing and serialization
+    (milliseconds), and says whether the results came from the cache.
+
     Args:
-        request: SearchRequest with query and optional n_results
+        request: SearchRequest with query, optional n_results, mode, filter,
+            and timings to get the same breakdown (but serialization) in the body
 
     Returns:
         SearchResponse with results
     """
-    if retriever is None:
-        raise HTTPException(status_code=503, detail="Retriever not initialized")
+    start = time.perf_counter()
+    require_ready()
 
     if not request.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
@@ -111,34 +549,287 @@ async def search(request: SearchRequest):
     if request.n_results < 1 or request.n_results > 20:
         raise HTTPException(status_code=400, detail="n_results must be between 1 and 20")
 
+    check_mode(request.mode)
+    options = filter_options(request.filter)
+
+    timings = Timings()
     try:
-        results = retriever.search(request.query, request.n_results)
-        return SearchResponse(query=request.query, results=results, count=len(results))
+        # concurrent requests share one embedding call, off the event loop
+        results = await batcher.search(
+            request.query, request.n_results, timings=timings, mode=request.mode, **options
+        )
+        breakdown = {}
+        if request.timings:
+            # serialization can't report its own time in the body, only in the header
+            breakdown["timings"] = {
+                stage: seconds * 1000
+                for stage, seconds in timings.as_dict().items()
+                if stage not in ("cache_hit", "cache_miss")
+            }
+            breakdown["cached"] = timings.count("cache_hit") > 0
+        response = SearchResponse(
+            query=request.query, results=results, count=len(results), **breakdown
+        )
+        with timings.measure("serialize"):
+            body = response.model_dump_json(exclude_unset=True)
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
         raise HTTPException(status_code=500, detail="Search failed")
 
+    search_stage_seconds.observe(timings.as_dict()["serialize"], "serialize")
+    timings.add("total", time.perf_counter() - start)
+    return Response(
+        body, media_type="application/json", headers={"Server-Timing": server_timing(timings)}
+    )
+
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest):
+    """
+    Search for documents relevant to each of many queries.
+
+    With stream=true the results are sent as newline-delimited JSON, one
+    SearchResponse object per line and query, as soon as each batch of
+    queries has been searched.
+
+    Args:
+        request: BatchSearchRequest with queries, optional n_results, mode,
+            filter (applied to every query) and stream
+
+    Returns:
+        BatchSearchResponse with one SearchResponse per query, or an NDJSON stream
+    """
+    require_ready()
+
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per request"
+        )
+
+    if any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    if request.n_results < 1 or request.n_results > 20:
+        raise HTTPException(status_code=400, detail="n_results must be between 1 and 20")
+
+    check_mode(request.mode)
+    options = filter_options(request.filter)
+
+    if request.stream:
+
+        def lines():
+            # runs in the threadpool, one batch of queries at a time
+            results = retriever.iter_search_many(
+                request.queries, request.n_results, mode=request.mode, **options
+            )
+            try:
+                for query, result in zip(request.queries, results):
+                    yield json.dumps({"query": query, "results": result, "count": len(result)})
+                    yield "\n"
+            except Exception as e:
+                logger.error(f"Batch search error: {str(e)}")
+                yield json.dumps({"detail": "Search failed"}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        results = await run_in_threadpool(
+            retriever.search_many, request.queries, request.n_results, request.mode, **options
+        )
+    except Exception as e:
+        logger.error(f"Batch search error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+    responses = [
+        SearchResponse(query=query, results=result, count=len(result))
+        for query, result in zip(request.queries, results)
+    ]
+    return BatchSearchResponse(results=responses, count=len(responses))
+
+
+async def reindex() -> int:
+    """Bring the index up to date with the documents directory, off the search threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(indexer, retriever.index_documents, DOCUMENTS_DIR)
+
+
+def save_upload(upload: UploadFile, destination: Path):
+    """Copy an upload into place a block at a time, swapping it in only when complete."""
+    tmp = destination.with_name(f".{destination.name}.upload")
+    try:
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(upload.file, f, 1 << 20)
+        os.replace(tmp, destination)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+@app.post("/documents", response_model=DocumentUploadResponse, status_code=201)
+async def upload_documents(files: list[UploadFile]):
+    """
+    Add (or replace) .txt and .pdf documents and index them.
+
+    Each file is streamed to the documents directory a block at a time,
+    then only new or changed files are parsed, embedded in batches and
+    upserted. A file with the name of an existing document replaces it.
+    Extensions are saved in lowercase, so 'NOTES.TXT' becomes 'NOTES.txt'.
+
+    Args:
+        files: Uploaded files (multipart form field "files", repeatable)
+
+    Returns:
+        DocumentUploadResponse with the files indexed, and the error of
+        each file that could not be read (those are not kept)
+    """
+    require_ready()
+    require_writable()
+
+    names = []
+    for upload in files:
+        name = Path(upload.filename or "").name
+        suffix = Path(name).suffix
+        if suffix.lower() not in (".txt", ".pdf") or name.startswith("."):
+            raise HTTPException(
+                status_code=400, detail=f"Only .txt and .pdf files can be uploaded, not '{name}'"
+            )
+        # the loader and DELETE only know lowercase extensions
+        names.append(name[: -len(suffix)] + suffix.lower())
+
+    directory = Path(DOCUMENTS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    before = retriever.document_count
+    try:
+        for upload, name in zip(files, names):
+            await run_in_threadpool(save_upload, upload, directory / name)
+        await reindex()
+    except Exception as e:
+        logger.error(f"Document upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Indexing failed")
+
+    # files the loader couldn't read would only fail again, so drop them
+    errors = {
+        name: retriever.loader.errors[name] for name in names if name in retriever.loader.errors
+    }
+    for name in errors:
+        (directory / name).unlink(missing_ok=True)
+
+    return DocumentUploadResponse(
+        indexed=[name for name in dict.fromkeys(names) if name not in errors],
+        errors=errors,
+        chunks_added=retriever.document_count - before,
+        documents_indexed=retriever.document_count,
+    )
+
+
+@app.delete("/documents/{doc_id}", response_model=DocumentDeleteResponse)
+async def delete_document(doc_id: str):
+    """
+    Remove a document and every chunk of it from the index.
+
+    Args:
+        doc_id: Document id, the file name without its extension
+
+    Returns:
+        DocumentDeleteResponse with the files removed and chunks deleted
+    """
+    require_ready()
+    require_writable()
+
+    directory = Path(DOCUMENTS_DIR)
+    files = [
+        directory / f"{doc_id}{suffix}"
+        for suffix in (".txt", ".pdf")
+        if Path(doc_id).name == doc_id and (directory / f"{doc_id}{suffix}").is_file()
+    ]
+    if not files:
+        raise HTTPException(status_code=404, detail=f"Document '{doc_id}' not found")
+
+    chunks = sum(len(retriever.manifest.ids_for(filepath)) for filepath in files)
+    try:
+        for filepath in files:
+            filepath.unlink(missing_ok=True)
+        await reindex()
+    except Exception as e:
+        logger.error(f"Document delete error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Indexing failed")
+
+    return DocumentDeleteResponse(
+        doc_id=doc_id,
+        files=[filepath.name for filepath in files],
+        chunks_deleted=chunks,
+        documents_indexed=retriever.document_count,
+    )
+
 
 # Implement health check endpoint
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """
-    Check if the API is running.
+    Check if the API is running, and how far startup has got.
+
+    The server answers as soon as it starts: status is "starting" while the
+    model loads and documents are indexed (phase "loading" or "indexing",
+    with progress), "healthy" once searches can be answered (phase "ready"),
+    and "unhealthy" if startup failed.
 
     Returns:
         Health status
     """
-    if retriever is None:
+    if progress is None:
         return HealthResponse(
             status="unhealthy", message="Retriever not initialized", documents_indexed=0
         )
+
+    state = progress.snapshot()
+    documents = retriever.document_count if retriever is not None else 0
+    # seconds per stage: import, model_load, file_scan, parse, embed, insert, ...
+    profile = retriever.profile.as_dict() if retriever is not None else None
+    report = IndexProgressResponse(**state)
+    if state["phase"] == "failed":
+        return HealthResponse(
+            status="unhealthy",
+            message=f"Retriever not initialized: {state['error']}",
+            documents_indexed=documents,
+            phase="failed",
+            progress=report,
+            startup_profile=profile,
+        )
+    if state["phase"] != "ready":
+        message = "Loading model" if state["phase"] == "loading" else "Indexing documents"
+        return HealthResponse(
+            status="starting",
+            message=message,
+            documents_indexed=documents,
+            phase=state["phase"],
+            progress=report,
+            startup_profile=profile,
+        )
     return HealthResponse(
         status="healthy",
         message="API is running and ready",
-        documents_indexed=retriever.document_count,
+        documents_indexed=documents,
+        phase="ready",
+        index_generation=Path(retriever.persist_directory).name if retriever.read_only else None,
+        progress=report,
+        startup_profile=profile,
     )
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Report request, search stage, indexing, cache and index size metrics.
+
+    Returns:
+        Every metric in the Prometheus text exposition format
+    """
+    # reading the index sizes may wait for an insert, so keep it off the event loop
+    return Response(await run_in_threadpool(metrics.render), media_type=CONTENT_TYPE)
+
+
 # Add error handler for general exceptions
 @app.exception_handler(Exception)
 async def general_exception_handler(_request, exc):
@@ -158,7 +849,13 @@ async def test_error():
 #           /stlye.css --> /static/style.css
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
-if __name__ == "__main__":
+if __name__ == "__main__" and sys.argv[1:] == ["build"]:
+    # index the documents into a new generation of the shared index, and publish it
+    if not SHARED_INDEX_DIR:
+        sys.exit("Set RETRIEVAL_SHARED_INDEX_DIR to build a shared index")
+    generation, built = build_generation(DOCUMENTS_DIR, SHARED_INDEX_DIR, **retriever_options())
+    print(f"Published {generation} ({built.document_count} chunks)")
+elif __name__ == "__main__":
     print("To run this application:")
     print("uv run uvicorn src.retrieval.main:app --reload")
     print("\nThen open: http://localhost:8000")
@@ -0,0 +1,139 @@
+"""
+File manifest for incremental indexing.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def fingerprint(filepath: Path, content_hash: bool = True) -> dict:
+    """
+    Describe a file by size, modification time and (optionally) content hash.
+
+    Args:
+        filepath: File to describe
+        content_hash: Whether to read the file and compute its SHA-256
+
+    Returns:
+        Dict with 'size', 'mtime' and 'hash' (None when not computed)
+    """
+    stat = filepath.stat()
+    digest = None
+    if content_hash:
+        sha = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest}
+
+
+class FileManifest:
+    """
+    Remember which files were indexed, what they looked like and which chunk
+    ids they produced, so re-indexing only touches files that changed.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        """
+        Initialize the manifest, loading it from disk if it exists.
+
+        Args:
+            path: JSON file to persist to, or None to keep it in memory only
+        """
+        self.path = Path(path) if path else None
+        self.config = {}
+        self.files = {}
+        if self.path and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.config = data.get("config", {})
+            self.files = data.get("files", {})
+
+    @staticmethod
+    def key(filepath: Path) -> str:
+        """Return the manifest key for a file."""
+        return str(Path(filepath).resolve())
+
+    def matches(self, config: dict) -> bool:
+        """Return True if the manifest was built with the given settings."""
+        return self.config == config
+
+    def reset(self, config: dict) -> list[str]:
+        """
+        Forget every file and adopt new settings.
+
+        Returns:
+            Chunk ids of all the files that were forgotten
+        """
+        ids = [chunk_id for entry in self.files.values() for chunk_id in entry["ids"]]
+        self.config = dict(config)
+        self.files = {}
+        return ids
+
+    def diff(self, filepaths: list[Path], directory: str | Path) -> tuple[dict, list[str]]:
+        """
+        Compare files on disk with the manifest.
+
+        A file whose size and mtime are unchanged is assumed unchanged. If
+        only its mtime moved, the content hash decides.
+
+        Args:
+            filepaths: Files currently present in the directory
+            directory: Directory the files were listed from
+
+        Returns:
+            Tuple of ({path: fingerprint} for new or changed files, keys of
+            files in the directory that have been removed)
+        """
+        changed, seen = {}, set()
+        for filepath in filepaths:
+            key = self.key(filepath)
+            seen.add(key)
+            entry = self.files.get(key)
+            current = fingerprint(filepath, content_hash=False)
+            if entry and entry["size"] == current["size"] and entry["mtime"] == current["mtime"]:
+                continue
+
+            current = fingerprint(filepath)
+            if entry and entry["hash"] == current["hash"]:
+                # touched but not modified, just remember the new mtime
+                entry["mtime"] = current["mtime"]
+                continue
+            changed[filepath] = current
+
+        root = Path(directory).resolve()
+        removed = [key for key in self.files if Path(key).parent == root and key not in seen]
+        return changed, removed
+
+    def ids_for(self, filepath: Path) -> list[str]:
+        """Return the chunk ids recorded for a file."""
+        entry = self.files.get(self.key(filepath))
+        return list(entry["ids"]) if entry else []
+
+    def update(self, filepath: Path, file_fingerprint: dict, ids: list[str]):
+        """Record a file as indexed with the given chunk ids."""
+        self.files[self.key(filepath)] = {**file_fingerprint, "ids": list(ids)}
+
+    def remove(self, key: str) -> list[str]:
+        """Forget a file and return its chunk ids."""
+        entry = self.files.pop(key, None)
+        return entry["ids"] if entry else []
+
+    def save(self):
+        """Write the manifest to disk (atomically), if it has a path."""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"config": self.config, "files": self.files}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,272 @@
+"""
+Counters, gauges and histograms in the Prometheus text exposition format.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import bisect
+import math
+import threading
+import time
+
+# media type of the text format rendered by Registry.render
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# latency buckets in seconds, from a fraction of a millisecond to ten seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Metric:
+    """
+    A named metric, with one value per combination of label values.
+
+    Values are either recorded as they happen, or, given a function, read
+    from it only when the metrics are rendered, which costs nothing between
+    scrapes.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), function=None):
+        """
+        Initialize the metric.
+
+        Args:
+            name: Metric name, e.g. 'retrieval_search_queries_total'
+            help: One line describing the metric
+            labels: Names of the labels the values are split by
+            function: Called at render time, returning the value, or (with
+                labels) a dict from tuples of label values to values; None
+                leaves the metric without values
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        """Return (name suffix, label values, value) for every value."""
+        if self.function is not None:
+            values = self.function()
+            if values is None:
+                values = {}
+            elif not self.labels:
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", key, value) for key, value in values.items()]
+
+    def render(self) -> list[str]:
+        """Return the metric's lines in the text format."""
+        lines = [f"# HELP {self.name} {_escape(self.help, quote=False)}"]
+        lines.append(f"# TYPE {self.name} {self.type}")
+        for suffix, key, value in self.samples():
+            names = self.labels
+            if suffix == "_bucket":
+                # the bucket's upper bound is the last label value
+                names, key = (*names, "le"), (*key[:-1], _number(key[-1]))
+            labels = ",".join(f'{name}="{_escape(str(v))}"' for name, v in zip(names, key))
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}{suffix}{labels} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A count that only goes up, e.g. of requests served."""
+
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        """Add to the count of the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. the size of the index."""
+
+    type = "gauge"
+
+    def set(self, value: float, *labels: str):
+        """Set the value of the given label values."""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Counts of observations (e.g. latencies) falling into fixed buckets.
+
+    Observing costs a binary search and three additions, so it is cheap
+    enough for every request.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        """
+        Initialize the histogram.
+
+        Args:
+            name: Metric name, e.g. 'retrieval_search_stage_seconds'
+            help: One line describing the metric
+            labels: Names of the labels the observations are split by
+            buckets: Upper bounds of the buckets, in increasing order
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        """Record an observation for the given label values."""
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # one count per bucket plus +Inf, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in values.items():
+            # buckets are cumulative: each counts every observation up to its bound
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                samples.append(("_bucket", (*key, bound), total))
+            samples.append(("_sum", key, counts[-1]))
+            samples.append(("_count", key, total))
+        return samples
+
+
+class Registry:
+    """The metrics served together by one /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, returning it."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=(), function=None) -> Counter:
+        """Register and return a counter (see Metric for the arguments)."""
+        return self.register(Counter(name, help, labels, function))
+
+    def gauge(self, name: str, help: str, labels=(), function=None) -> Gauge:
+        """Register and return a gauge (see Metric for the arguments)."""
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        """Register and return a histogram (see Histogram for the arguments)."""
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    """
+    ASGI middleware counting HTTP requests and timing them by route.
+
+    Requests are labelled with the route's path template (e.g.
+    '/documents/{doc_id}'), so the number of label values stays small;
+    requests no API route matched are labelled 'other'.
+    """
+
+    def __init__(self, app, requests: Counter, errors: Counter, seconds: Histogram):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: ASGI application to wrap
+            requests: Counter labelled (method, route, status)
+            errors: Counter labelled (method, route) of server errors (5xx)
+            seconds: Histogram labelled (method, route) of request durations
+        """
+        self.app = app
+        self.requests = requests
+        self.errors = errors
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # unless the app gets to send a response
+        start = time.perf_counter()
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "other")
+            method = scope["method"]
+            self.seconds.observe(time.perf_counter() - start, method, route)
+            self.requests.inc(method, route, str(status))
+            if status >= 500:
+                self.errors.inc(method, route)
+
+
+def _escape(text: str, quote: bool = True) -> str:
+    """Escape a label value (or, without quote, a help text) for the text format."""
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+def _number(value: float) -> str:
+    """Format a sample value (or bucket bound) for the text format."""
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,119 @@
+"""
+Progress of loading the model and indexing documents in the background.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import threading
+import time
+
+
+class IndexProgress:
+    """
+    Thread-safe record of where startup is: loading the model, indexing
+    files, ready to search, or failed.
+
+    The indexing thread updates it; request handlers read snapshot().
+    Setting cancelled asks the indexer to stop after the current file.
+    """
+
+    phases = ("loading", "indexing", "ready", "failed")
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Initialize in the loading phase.
+
+        Args:
+            clock: Function returning the current time in seconds
+        """
+        self.clock = clock
+        self.phase = "loading"
+        self.error = None
+        self.files_total = 0
+        self.files_processed = 0
+        self.chunks_embedded = 0
+        self.chunks_deduplicated = 0
+        self.cancelled = False
+        self._started = clock()
+        self._indexing_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Return True once the index can be searched."""
+        return self.phase == "ready"
+
+    def start_indexing(self, files_total: int):
+        """Enter the indexing phase with the number of files to process."""
+        with self._lock:
+            self.phase = "indexing"
+            self.files_total = files_total
+            self.files_processed = 0
+            self.chunks_embedded = 0
+            self.chunks_deduplicated = 0
+            self._indexing_started = self.clock()
+
+    def file_processed(self):
+        """Count one more file loaded and chunked."""
+        with self._lock:
+            self.files_processed += 1
+
+    def chunks_added(self, count: int):
+        """Count chunks embedded and added to the store."""
+        with self._lock:
+            self.chunks_embedded += count
+
+    def duplicates_skipped(self, count: int):
+        """Count chunks skipped as duplicates of chunks already indexed."""
+        with self._lock:
+            self.chunks_deduplicated += count
+
+    def finish(self):
+        """Enter the ready phase."""
+        with self._lock:
+            self.phase = "ready"
+
+    def fail(self, error: str):
+        """Enter the failed phase with a message saying why."""
+        with self._lock:
+            self.phase = "failed"
+            self.error = error
+
+    def cancel(self):
+        """Ask the indexer to stop early."""
+        self.cancelled = True
+
+    def eta(self) -> float | None:
+        """
+        Estimate the seconds until indexing is done from the rate so far.
+
+        Returns:
+            Seconds remaining, 0 when ready, or None if there is no rate yet
+        """
+        with self._lock:
+            if self.phase == "ready":
+                return 0.0
+            if self.phase != "indexing" or not self.files_processed:
+                return None
+            elapsed = self.clock() - self._indexing_started
+            remaining = self.files_total - self.files_processed
+            return elapsed / self.files_processed * remaining
+
+    def snapshot(self) -> dict:
+        """Return the phase and counters as a plain dict."""
+        eta = self.eta()
+        with self._lock:
+            return {
+                "phase": self.phase,
+                "files_total": self.files_total,
+                "files_processed": self.files_processed,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_deduplicated": self.chunks_deduplicated,
+                "elapsed_seconds": self.clock() - self._started,
+                "eta_seconds": eta,
+                "error": self.error,
+            }
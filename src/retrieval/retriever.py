@@ -8,57 +8,531 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
+import json
+import logging
+import threading
+from pathlib import Path
+
+from .cache import LRUCache
+from .dedup import ChunkDeduplicator
 from .embeddings import DocumentEmbedder
+from .lexical import BM25Index, reciprocal_rank_fusion
 from .loader import DocumentChunker, DocumentLoader
+from .manifest import FileManifest, fingerprint
+from .progress import IndexProgress
 from .store import VectorStore
+from .timing import Timings
+
+logger = logging.getLogger(__name__)
+
+# search stages timed where they happen; the rest of a search is result formatting
+_SEARCH_STAGES = ("embed", "lexical", "query")
 
 
 class DocumentRetriever:
     """High-level interface for document retrieval."""
 
-    def __init__(self, chunk_size: int = 300, overlap: int = 30):
-        """Initialize retriever with default components."""
-        chunker = DocumentChunker(chunk_size=chunk_size, overlap=overlap)
-        self.loader = DocumentLoader(chunker=chunker)
-        self.store = VectorStore(DocumentEmbedder())
-        self._indexed = False  # flag to indicate we've done some indexing
+    def __init__(
+        self,
+        chunk_size: int = 300,
+        overlap: int = 30,
+        persist_directory: str | None = None,
+        result_cache_size: int = 1024,
+        load_workers: int = 0,
+        batch_size: int = 256,
+        insert_batch_size: int = 1024,
+        chunk_by_tokens: bool = False,
+        embedding_cache_dir: str | None = None,
+        backend: str = "chroma",
+        embed_backend: str = "torch",
+        onnx_dir: str | None = None,
+        lexical: bool = False,
+        lexical_candidates: int = 100,
+        dedup: bool = False,
+        dedup_threshold: float = 0.85,
+        read_only: bool = False,
+    ):
+        """
+        Initialize retriever with default components.
+
+        Args:
+            chunk_size: Number of words per chunk
+            overlap: Number of words shared by consecutive chunks
+            persist_directory: Directory for an on-disk index that survives
+                restarts, or None to index in memory
+            result_cache_size: Most search result lists cached (0 disables)
+            load_workers: Processes used to parse files (0 parses in-process)
+            batch_size: Number of chunks embedded at once
+            insert_batch_size: Most chunks written to the store at once (capped
+                at what the backend accepts); inserting a batch overlaps with
+                embedding the next
+            chunk_by_tokens: Measure chunk_size and overlap in the embedding
+                model's tokens, capped at what the model reads, instead of words
+            embedding_cache_dir: Directory of the on-disk chunk embedding
+                cache; defaults to an 'embeddings' folder in persist_directory
+            backend: Vector store backend, "chroma", "numpy", "numpy-int8"
+                or "numpy-binary"
+            embed_backend: Embedding inference backend, "torch", "onnx" or
+                "onnx-int8" (see DocumentEmbedder)
+            onnx_dir: Directory the ONNX exports of the model are kept in
+            lexical: Also build a BM25 keyword index of the chunks, and
+                search in "hybrid" mode by default
+            lexical_candidates: Chunks found by keyword that hybrid search
+                ranks by vector distance
+            dedup: Skip chunks that duplicate (or nearly duplicate) a chunk
+                already indexed, instead of embedding and storing them again
+            dedup_threshold: Estimated word-shingle Jaccard similarity at
+                which a chunk counts as a near-duplicate
+            read_only: Open the index in persist_directory without changing
+                it: the NumPy backends memory-map it so processes share it,
+                and index_documents is refused
+        """
+        if embedding_cache_dir is None and persist_directory and not read_only:
+            embedding_cache_dir = str(Path(persist_directory) / "embeddings")
+        # seconds spent in each stage of startup and indexing, for the logs
+        self.profile = Timings()
+        embedder = DocumentEmbedder(
+            cache_dir=embedding_cache_dir,
+            backend=embed_backend,
+            export_dir=onnx_dir,
+            timings=self.profile,
+        )
+        if chunk_by_tokens:
+            # no chunk is longer than the model reads, so no text is truncated
+            chunker = DocumentChunker(
+                chunk_size=chunk_size,
+                overlap=overlap,
+                tokenizer=embedder.tokenizer,
+                max_length=embedder.max_seq_length,
+            )
+        else:
+            chunker = DocumentChunker(chunk_size=chunk_size, overlap=overlap)
+        self.loader = DocumentLoader(chunker=chunker, max_workers=load_workers)
+        self.embedder = embedder
+        self.backend = backend
+        self.batch_size = batch_size
+        self.insert_batch_size = insert_batch_size
+        self.read_only = read_only
+        self.lexical_candidates = lexical_candidates
+        self.dedup_threshold = dedup_threshold
+        self.default_mode = "hybrid" if lexical else "vector"
+        # settings an index on disk must have been built with to be reused
+        self.config = {
+            "chunk_size": chunker.chunk_size,
+            "overlap": overlap,
+            "unit": "tokens" if chunk_by_tokens else "words",
+            "model": embedder.cache_name,
+            "backend": backend,
+        }
+        if lexical:
+            self.config["lexical"] = True
+        if dedup:
+            self.config["dedup"] = dedup_threshold
+
+        # results are only valid for the store generation they were computed at
+        self.result_cache = LRUCache(maxsize=result_cache_size)
+        # files (and their bytes) and chunks indexed since the retriever was created
+        self.indexing_stats = {"files": 0, "bytes": 0, "chunks": 0}
+        self._cache_generation = None
+        # one indexing run at a time (e.g. the directory watcher's), searches go on meanwhile
+        self._index_lock = threading.Lock()
+        self.store = None
+        self._open(persist_directory)
+
+    def open_index(self, persist_directory: str):
+        """
+        Switch to the index saved in another directory, keeping the model.
+
+        Processes sharing a read-only index call this when a new generation
+        of it is published. Searches running meanwhile finish on the old one.
+
+        Args:
+            persist_directory: Directory of the index to open
+        """
+        with self._index_lock:
+            self._open(persist_directory)
+
+    def _open(self, persist_directory: str | None):
+        """Open (or create) the store, keyword index, deduplicator and manifest."""
+        store = VectorStore(
+            self.embedder,
+            persist_directory=persist_directory,
+            backend=self.backend,
+            timings=self.profile,
+            embed_batch_size=self.batch_size,
+            insert_batch_size=self.insert_batch_size,
+            read_only=self.read_only,
+        )
+        if self.store is not None:
+            # never reuse a generation number, so no cached result looks current
+            store.generation = self.store.generation + 1
+        lexical = None
+        if self.config.get("lexical"):
+            lexical_path = Path(persist_directory) / "lexical.json" if persist_directory else None
+            lexical = BM25Index(lexical_path)
+        dedup = None
+        if self.config.get("dedup") and not self.read_only:
+            dedup_path = Path(persist_directory) / "dedup.json" if persist_directory else None
+            dedup = ChunkDeduplicator(dedup_path, threshold=self.dedup_threshold)
 
-    def index_documents(self, directory: str):
+        # the manifest tells us which files are already in the store
+        manifest_path = Path(persist_directory) / "manifest.json" if persist_directory else None
+        manifest = FileManifest(manifest_path)
+        if not manifest.matches(self.config):
+            if self.read_only:
+                raise ValueError(
+                    f"The index in {persist_directory} was built with other settings: "
+                    f"{manifest.config}"
+                )
+            # settings changed (or no manifest): nothing on disk can be trusted
+            manifest.reset(self.config)
+            if store.count() > 0:
+                store.clear()
+            if lexical is not None:
+                lexical.clear()
+            if dedup is not None:
+                dedup.clear()
+            manifest.save()
+
+        self.store, self.lexical, self.dedup, self.manifest = store, lexical, dedup, manifest
+        self.persist_directory = persist_directory
+        self._indexed = self.document_count > 0  # flag to indicate we've done some indexing
+
+    def index_documents(self, directory: str, progress: IndexProgress | None = None):
         """
         Load and index documents from a directory.
 
+        Only files that are new or changed since the last call are loaded
+        and embedded; chunks of files that were removed are deleted. Chunks
+        are streamed into the store batch_size at a time, so memory does not
+        grow with the number of files. With dedup on, chunks copying one
+        already indexed are skipped.
+
         Args:
             directory: Path to the directory containing documents
+            progress: Optional IndexProgress to report files and chunks to;
+                cancelling it stops indexing after the current file, and
+                the files not reached are indexed by the next call
 
         Returns:
             Number of documents indexed
         """
+        if self.read_only:
+            raise RuntimeError("The index is read-only")
+        with self._index_lock:
+            return self._index_documents(directory, progress)
+
+    def _index_documents(self, directory: str, progress: IndexProgress | None) -> int:
+        """Bring the index up to date with a directory (see index_documents)."""
         # use our components to load and add documents
         before = self.document_count
-        documents = self.loader.load_documents(directory)
-        self.store.add_documents(documents)
+        with self.profile.measure("file_scan"):
+            changed, removed = self.manifest.diff(self.loader.list_files(directory), directory)
+
+        orphans = []
+        for key in removed:
+            orphans += self._delete(self.manifest.remove(key))
+
+        for filepath in changed:
+            orphans += self._delete(self.manifest.ids_for(filepath))
+
+        # files with chunks skipped as copies of deleted chunks are indexed again
+        while orphans:
+            orphans = set(orphans)
+            changed_keys = {self.manifest.key(filepath) for filepath in changed}
+            again = [
+                Path(key)
+                for key, entry in self.manifest.files.items()
+                if key not in changed_keys and orphans & set(entry["ids"]) and Path(key).exists()
+            ]
+            orphans = []
+            for filepath in again:
+                changed[filepath] = fingerprint(filepath)
+                orphans += self._delete(self.manifest.ids_for(filepath))
+
+        if progress is not None:
+            progress.start_indexing(len(changed))
+
+        # stream chunks into the store in bounded batches, noting each file's ids
+        file_ids = {}
+        skipped = 0
+
+        def chunks():
+            nonlocal skipped
+            files = self.loader.load_files(list(changed))
+            while True:
+                with self.profile.measure("parse"):
+                    filepath, documents = next(files, (None, None))
+                if filepath is None:
+                    return
+                if progress is not None and progress.cancelled:
+                    return
+                file_ids[filepath] = [doc["id"] for doc in documents]
+                self.indexing_stats["files"] += 1
+                self.indexing_stats["bytes"] += changed[filepath]["size"]
+                if self.dedup is not None:
+                    # duplicates stay in the manifest, so deleting the file forgets them
+                    documents = [
+                        doc for doc in documents if self.dedup.check(doc["id"], doc["text"]) is None
+                    ]
+                    duplicates = len(file_ids[filepath]) - len(documents)
+                    skipped += duplicates
+                    if progress is not None:
+                        progress.duplicates_skipped(duplicates)
+                if self.lexical is not None:
+                    self.lexical.add(
+                        [doc["id"] for doc in documents], [doc["text"] for doc in documents]
+                    )
+                self.indexing_stats["chunks"] += len(documents)
+                yield from documents
+                if progress is not None:
+                    progress.file_processed()
+
+        on_batch = progress.chunks_added if progress is not None else None
+        self.store.add_stream(chunks(), on_batch=on_batch)
+
+        for filepath, ids in file_ids.items():
+            if filepath.name in self.loader.errors:
+                # leave it out of the manifest so the next call retries it
+                self.manifest.remove(self.manifest.key(filepath))
+                continue
+            self.manifest.update(filepath, changed[filepath], ids)
+
+        # the store must be on disk before the manifest says the files are in it
+        self.store.flush()
+        if self.lexical is not None:
+            self.lexical.flush()
+        if self.dedup is not None:
+            self.dedup.flush()
+        self.manifest.save()
+        logger.info(
+            f"Indexed {directory}: {len(changed)} new or changed, {len(removed)} removed files"
+        )
+        if self.dedup is not None:
+            logger.info(
+                f"Skipped {skipped} duplicate chunks ({self.dedup.duplicates} in the index so far)"
+            )
+        logger.info(f"Time per stage so far: {self.profile.summary()}")
         self._indexed = True
         return self.document_count - before
 
-    def search(self, query: str, n_results: int = 5) -> list[dict]:
+    def _delete(self, ids: list[str]) -> list[str]:
+        """
+        Remove chunks from the store, the keyword index and the deduplicator.
+
+        Returns:
+            Ids of skipped duplicates whose kept copy was among the chunks
+        """
+        self.store.delete(ids)
+        if self.lexical is not None:
+            self.lexical.delete(ids)
+        return self.dedup.delete(ids) if self.dedup is not None else []
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        mode: str | None = None,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[dict]:
         """
         Search for documents relevant to the query.
 
         Args:
             query: Search query text
             n_results: Number of results to return
+            mode: "vector" to rank every chunk by embedding distance, or
+                "hybrid" to rank the chunks BM25 finds by both keyword and
+                embedding, fused by reciprocal rank; None uses default_mode
+            where: Only return chunks whose metadata matches this
+                ChromaDB-style filter, e.g. {"type": "pdf"}
+            where_document: Only return chunks whose text matches this
+                filter, e.g. {"$contains": "Dracula"}
 
         Returns:
             List of result dicts with document information
         """
+        return self.search_many([query], n_results, mode, where, where_document)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        n_results: int = 5,
+        mode: str | None = None,
+        where: dict | None = None,
+        where_document: dict | None = None,
+        timings: Timings | None = None,
+        cache_hits: list[bool] | None = None,
+    ) -> list[list[dict]]:
+        """
+        Search for documents relevant to each of several queries at once.
+
+        Args:
+            queries: Search query texts
+            n_results: Number of results to return per query
+            mode: "vector" or "hybrid" (see search), or None for default_mode
+            where: Metadata filter applied to every query (see search)
+            where_document: Text filter applied to every query (see search)
+            timings: Timings to add the seconds of each search stage to:
+                'embed' (query embedding), 'lexical' (BM25, hybrid mode
+                only), 'query' (the vector store) and 'format' (the rest:
+                result cache lookups, fusion, copying results)
+            cache_hits: List to append, for each query in order, whether its
+                results came from the result cache
+
+        Returns:
+            One list of result dicts per query
+        """
+        return list(
+            self.iter_search_many(
+                queries,
+                n_results,
+                mode=mode,
+                where=where,
+                where_document=where_document,
+                timings=timings,
+                cache_hits=cache_hits,
+            )
+        )
+
+    def iter_search_many(
+        self,
+        queries: list[str],
+        n_results: int = 5,
+        batch_size: int = 64,
+        mode: str | None = None,
+        where: dict | None = None,
+        where_document: dict | None = None,
+        timings: Timings | None = None,
+        cache_hits: list[bool] | None = None,
+    ):
+        """
+        Search for many queries, yielding results as each batch completes.
+
+        Queries are embedded and searched batch_size at a time, so even
+        thousands of queries never hold more than one batch in memory.
+
+        Args:
+            queries: Search query texts
+            n_results: Number of results to return per query
+            batch_size: Number of queries searched together
+            mode: "vector" or "hybrid" (see search), or None for default_mode
+            where: Metadata filter applied to every query (see search)
+            where_document: Text filter applied to every query (see search)
+            timings: Timings to add the seconds of each search stage to (see
+                search_many)
+            cache_hits: List to append whether each query's results came
+                from the result cache to (see search_many)
+
+        Yields:
+            One list of result dicts per query, in the order of the queries
+        """
+        mode = mode or self.default_mode
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown search mode '{mode}'")
+        if mode == "hybrid" and self.lexical is None:
+            raise ValueError("Hybrid search needs the keyword index (lexical=True)")
+
         # use our vector store to query
         if not self._indexed:
             raise ValueError("No documents indexed. Call index_documents() first.")
 
-        return self.store.search(query, n_results)
+        filters = {"where": where or None, "where_document": where_document or None}
+        timings = timings if timings is not None else Timings()
+        for start in range(0, len(queries), batch_size):
+            yield from self._cached_search(
+                queries[start : start + batch_size], n_results, mode, filters, timings, cache_hits
+            )
+
+    def _cached_search(
+        self,
+        queries: list[str],
+        n_results: int,
+        mode: str,
+        filters: dict,
+        timings: Timings,
+        cache_hits: list[bool] | None = None,
+    ) -> list[list[dict]]:
+        """Answer queries from the result cache, searching the store for the rest."""
+        start = timings.clock()
+        searched = _search_seconds(timings)
+        generation = self.store.generation
+        if generation != self._cache_generation:
+            # the index changed, so every cached result may be stale
+            self.result_cache.clear()
+            self._cache_generation = generation
+
+        # results differ by filter, so the filters are part of the key
+        filter_key = json.dumps(filters, sort_keys=True)
+        keys = [
+            (generation, " ".join(query.split()), n_results, mode, filter_key) for query in queries
+        ]
+        results = [self.result_cache.get(key) for key in keys]
+        if cache_hits is not None:
+            cache_hits.extend(result is not None for result in results)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            search = self._hybrid_search if mode == "hybrid" else self.store.search_many
+            found = search([queries[i] for i in missing], n_results, timings=timings, **filters)
+            for i, result in zip(missing, found):
+                self.result_cache.put(keys[i], result)
+                results[i] = result
+
+        # hand out copies so callers can't change what's cached
+        results = [list(result) for result in results]
+        searched = _search_seconds(timings) - searched
+        timings.add("format", timings.clock() - start - searched)
+        return results
+
+    def _hybrid_search(
+        self,
+        queries: list[str],
+        n_results: int,
+        where: dict | None = None,
+        where_document: dict | None = None,
+        timings: Timings | None = None,
+    ) -> list[list[dict]]:
+        """
+        Two-stage search: BM25 picks candidates, vectors rank just those,
+        and the keyword and vector rankings are fused by reciprocal rank.
+
+        Queries with no candidate passing the filters fall back to vector
+        search. Results carry the fused 'score' next to the vector 'distance'.
+        """
+        timings = timings if timings is not None else Timings()
+        size = max(self.lexical_candidates, n_results)
+        with timings.measure("lexical"):
+            candidates = [[doc_id for doc_id, _ in self.lexical.search(q, size)] for q in queries]
+        ranked = self.store.search_among(
+            queries, candidates, size, where, where_document, timings=timings
+        )
+
+        results = []
+        for lexical_ids, vector_results in zip(candidates, ranked):
+            by_id = {result["id"]: result for result in vector_results}
+            fused = reciprocal_rank_fusion([lexical_ids, list(by_id)])
+            fused = [(doc_id, score) for doc_id, score in fused if doc_id in by_id][:n_results]
+            results.append([{**by_id[doc_id], "score": score} for doc_id, score in fused])
+
+        unmatched = [i for i, result in enumerate(results) if not result]
+        if unmatched:
+            found = self.store.search_many(
+                [queries[i] for i in unmatched], n_results, where, where_document, timings=timings
+            )
+            for i, result in zip(unmatched, found):
+                results[i] = result
+        return results
 
     # define a property that fetches the number of indexed documents
     @property
     def document_count(self) -> int:
         """Return the number of indexed documents."""
         return self.store.count()
+
+
+def _search_seconds(timings: Timings) -> float:
+    """Return the seconds recorded for the search stages timed where they happen."""
+    seconds = timings.as_dict()
+    return sum(seconds.get(stage, 0.0) for stage in _SEARCH_STAGES)
@@ -1,5 +1,5 @@
 """
-Vector store for semantic search using ChromaDB.
+Vector store for semantic search using ChromaDB (or another backend).
 
 @author: Anthony Nguyen and Sebastian Silva
 Seattle University, ARIN 5360
@@ -8,15 +8,22 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
-import chromadb
-from chromadb import Settings
-from chromadb.api.types import EmbeddingFunction
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from .backends import ChromaBackend, NumpyBackend, StoreBackend
+from .timing import Timings
 
-class EmbedderAdaptor(EmbeddingFunction):
+logger = logging.getLogger(__name__)
+
+
+class EmbedderAdaptor:
     """
     Adapts our style of embedder to ChromaDB's which wants a callable
-    interface.
+    interface. ChromaBackend wraps it in ChromaDB's EmbeddingFunction
+    base class, so importing this module does not import chromadb.
     """
 
     def __init__(self, embedder):
@@ -35,81 +42,329 @@ class EmbedderAdaptor(EmbeddingFunction):
 
         return self.embedder.embed_documents(input).tolist()
 
+    def embed_query(self, input):
+        """Embed queries through the embedder's query path (and its cache)."""
+        return self.embedder.embed_query(list(input))
+
 
 class VectorStore:
-    """Manages document storage and retrieval using ChromaDB."""
+    """Manages document storage and retrieval using ChromaDB or NumPy."""
 
-    def __init__(self, embedder, collection_name: str = "documents"):
+    def __init__(
+        self,
+        embedder,
+        collection_name: str = "documents",
+        persist_directory: str | None = None,
+        backend: str | StoreBackend = "chroma",
+        timings: Timings | None = None,
+        embed_batch_size: int = 256,
+        insert_batch_size: int = 1024,
+        read_only: bool = False,
+    ):
         """
         Initialize vector store with an embedder.
 
         Args:
             embedder: DocumentEmbedder instance for generating vectors
             collection_name: Name for the ChromaDB collection
+            persist_directory: Directory to keep the collection in across
+                restarts, or None for an in-memory collection
+            backend: "chroma", "numpy" (exact matrix search), "numpy-int8"
+                or "numpy-binary" (quantized search with float rescoring),
+                or a StoreBackend instance
+            timings: Timings to record the 'store_open', 'embed' and
+                'insert' stages in
+            embed_batch_size: Most documents embedded by one model call
+            insert_batch_size: Most documents written to the backend at once
+                (never more than the backend accepts)
+            read_only: Memory-map the NumPy index saved in persist_directory
+                and refuse changes, so several processes can share it
         """
+        if embed_batch_size < 1 or insert_batch_size < 1:
+            raise ValueError("Batch sizes must be at least 1")
         self.embedder = EmbedderAdaptor(embedder)
-        # use ChromaDB client
-        self.client = chromadb.Client(Settings(anonymized_telemetry=False))
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        # bumped on every change so callers can tell cached results are stale
+        self.generation = 0
+        self.timings = timings if timings is not None else Timings()
 
-        # Delete any existing collection if present
-        try:
-            self.client.delete_collection(collection_name)
-        except Exception:
-            pass
+        with self.timings.measure("store_open"):
+            if isinstance(backend, StoreBackend):
+                self.backend = backend
+            elif backend == "chroma":
+                if read_only:
+                    raise ValueError("Only the numpy backends can be opened read-only")
+                self.backend = ChromaBackend(self.embedder, collection_name, persist_directory)
+            elif backend in ("numpy", "numpy-int8", "numpy-binary"):
+                quantization = backend.removeprefix("numpy").removeprefix("-") or None
+                self.backend = NumpyBackend(
+                    collection_name, persist_directory, quantization, read_only=read_only
+                )
+            else:
+                raise ValueError(f"Unknown store backend '{backend}'")
 
-        self.collection = self.client.create_collection(
-            name=collection_name,
-            embedding_function=self.embedder,  # Should use self.embedder
-        )
+        self.embed_batch_size = embed_batch_size
+        self.insert_batch_size = insert_batch_size
+        if self.backend.max_batch_size:
+            self.insert_batch_size = min(insert_batch_size, self.backend.max_batch_size)
 
     def add_documents(self, documents):
         """
         Add documents to the vector store.
 
+        Documents are embedded embed_batch_size at a time, and each batch
+        is inserted while the next one is embedded, so memory does not grow
+        with the number of documents.
+
         Args:
             documents: List of dicts with 'id', 'text', and 'metadata'
         """
-        if not documents:
-            return
+        size = self.embed_batch_size
+        self._add_batches(
+            documents[start : start + size] for start in range(0, len(documents), size)
+        )
+
+    def _add_batches(self, batches, on_batch=None) -> int:
+        """
+        Embed batches of documents and insert them, overlapping the two.
+
+        At most one batch is being inserted while the next is embedded.
+
+        Returns:
+            Number of documents added
+        """
+        added = 0
+        pending = None  # (insert future, batch size, embed seconds) of the batch being inserted
+        # one thread writes a batch to the backend while the next is embedded; if anything
+        # fails, leaving the block lets the insert in flight end before giving up
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-insert") as inserter:
+            for batch in batches:
+                if not batch:
+                    continue
+                # pull out fields into separate lists like ChromaDB expects
+                ids = [doc["id"] for doc in batch]
+                texts = [doc["text"] for doc in batch]
+                metadatas = [doc["metadata"] for doc in batch]
+
+                # embed them ourselves so every backend gets the same vectors
+                start = self.timings.clock()
+                with self.timings.measure("embed"):
+                    embeddings = self.embedder.embedder.embed_documents(texts)
+                embed_seconds = self.timings.clock() - start
+
+                if pending is not None:
+                    added += self._finish_insert(*pending, on_batch)
+                future = inserter.submit(self._insert, ids, texts, metadatas, embeddings)
+                pending = (future, len(batch), embed_seconds)
+
+            if pending is not None:
+                added += self._finish_insert(*pending, on_batch)
+        return added
+
+    def _insert(self, ids, texts, metadatas, embeddings) -> float:
+        """Write one embedded batch to the backend, insert_batch_size at a time."""
+        start = self.timings.clock()
+        for i in range(0, len(ids), self.insert_batch_size):
+            part = slice(i, i + self.insert_batch_size)
+            with self.timings.measure("insert"):
+                self.backend.add(ids[part], texts[part], metadatas[part], embeddings[part])
+            self.generation += 1
+        return self.timings.clock() - start
+
+    def _finish_insert(self, future, size: int, embed_seconds: float, on_batch) -> int:
+        """Wait for a batch's insert, then report it."""
+        insert_seconds = future.result()
+        logger.debug(
+            f"Added {size} documents: embed {embed_seconds:.3f}s, insert {insert_seconds:.3f}s"
+        )
+        if on_batch is not None:
+            on_batch(size)
+        return size
+
+    def add_stream(
+        self, documents, batch_size: int | None = None, prefetch: int = 2, on_batch=None
+    ) -> int:
+        """
+        Add documents from an iterable in fixed-size batches.
+
+        The iterable is consumed in a background thread, so parsing the
+        next documents overlaps with embedding the current batch, which
+        overlaps with inserting the previous one. At most prefetch batches
+        wait in memory.
+
+        Args:
+            documents: Iterable of dicts with 'id', 'text', and 'metadata'
+            batch_size: Number of documents embedded at once; None uses
+                embed_batch_size
+            prefetch: Number of batches prepared ahead of the one being added
+            on_batch: Called with the size of each batch once it is added
+
+        Returns:
+            Number of documents added
+        """
+        batch_size = batch_size or self.embed_batch_size
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
 
-        # pull out fields into separate lists like ChromaDB expects
-        ids = [doc["id"] for doc in documents]
-        texts = [doc["text"] for doc in documents]
-        metadatas = [doc["metadata"] for doc in documents]
+        batches = queue.Queue(maxsize=max(prefetch, 1))
+        stop = threading.Event()
+        finished = object()
 
-        # add them to ChromaDB's collection
-        self.collection.add(ids=ids, documents=texts, metadatas=metadatas)
+        def put(item):
+            # give up if the consumer has stopped taking batches
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
 
-    def search(self, query: str, n_results: int = 5) -> list[dict]:
+        def produce():
+            try:
+                batch = []
+                for doc in documents:
+                    batch.append(doc)
+                    if len(batch) == batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+                put(finished)
+            except BaseException as e:
+                put(e)
+
+        def consume():
+            while (item := batches.get()) is not finished:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+
+        producer = threading.Thread(target=produce, name="add-stream", daemon=True)
+        producer.start()
+        try:
+            return self._add_batches(consume(), on_batch)
+        finally:
+            stop.set()
+            producer.join()
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[dict]:
         """
         Search for documents similar to the query.
 
         Args:
             query: Search query text
             n_results: Number of results to return
+            where: Only search documents whose metadata matches this
+                ChromaDB-style filter, e.g. {"type": "pdf"}
+            where_document: Only search documents whose text matches this
+                filter, e.g. {"$contains": "Dracula"}
 
         Returns:
             List of result dicts with 'id', 'text', 'distance', and 'metadata'
         """
-        # use ChromaDB's query interface
-        results = self.collection.query(query_texts=[query], n_results=n_results)
-
-        formatted = []
-        # Format results
-        if len(results["ids"]) > 0:
-            for i in range(len(results["ids"][0])):
-                formatted.append(
-                    {
-                        "id": results["ids"][0][i],
-                        "text": results["documents"][0][i],
-                        "distance": results["distances"][0][i],
-                        "metadata": results["metadatas"][0][i],
-                    }
-                )
+        return self.search_many([query], n_results, where, where_document)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        n_results: int = 5,
+        where: dict | None = None,
+        where_document: dict | None = None,
+        timings: Timings | None = None,
+    ) -> list[list[dict]]:
+        """
+        Search for documents similar to each of several queries at once.
+
+        All queries are embedded together (repeated queries come from the
+        embedder's query cache) and sent to the backend in a single query.
+
+        Args:
+            queries: Search query texts
+            n_results: Number of results to return per query
+            where: Metadata filter applied to every query (see search)
+            where_document: Text filter applied to every query (see search)
+            timings: Timings to add the 'embed' and 'query' seconds of this
+                search to
+
+        Returns:
+            One list of result dicts per query, in the order of the queries
+        """
+        if not queries:
+            return []
+
+        timings = timings if timings is not None else Timings()
+        with timings.measure("embed"):
+            embeddings = self.embedder.embed_query(queries)
+        with timings.measure("query"):
+            return self.backend.search_many(embeddings, n_results, where, where_document)
+
+    def search_among(
+        self,
+        queries: list[str],
+        candidates: list[list[str]],
+        n_results: int = 5,
+        where: dict | None = None,
+        where_document: dict | None = None,
+        timings: Timings | None = None,
+    ) -> list[list[dict]]:
+        """
+        Search each query among its own set of candidate documents only.
+
+        Args:
+            queries: Search query texts
+            candidates: For each query, the ids of the documents to rank
+            n_results: Number of results to return per query
+            where: Metadata filter the candidates must also pass (see search)
+            where_document: Text filter the candidates must also pass
+            timings: Timings to add the 'embed' and 'query' seconds of this
+                search to
+
+        Returns:
+            One list of result dicts per query, nearest first
+        """
+        if not queries:
+            return []
+
+        timings = timings if timings is not None else Timings()
+        with timings.measure("embed"):
+            embeddings = self.embedder.embed_query(queries)
+        with timings.measure("query"):
+            return [
+                self.backend.search_among(embedding, ids, n_results, where, where_document)
+                for embedding, ids in zip(embeddings, candidates)
+            ]
+
+    def delete(self, ids: list[str]):
+        """
+        Remove documents from the vector store.
+
+        Args:
+            ids: Ids of the documents to remove
+        """
+        if not ids:
+            return
+        self.backend.delete(list(ids))
+        self.generation += 1
+
+    def clear(self):
+        """Remove every document from the vector store."""
+        self.backend.clear()
+        self.generation += 1
 
-        return formatted
+    def flush(self):
+        """Write pending changes to disk, for backends that need it."""
+        self.backend.flush()
 
     def count(self) -> int:
         """Return the number of documents in the store."""
-        # ask the collection for its size
-        return self.collection.count()
+        # ask the backend for its size
+        return self.backend.count()
@@ -0,0 +1,68 @@
+"""
+Wall-clock timings of the stages of the retrieval pipeline.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Timings:
+    """
+    Thread-safe totals of the seconds spent in named stages.
+
+    Stages timed more than once (e.g. embedding every batch) add up, and
+    each keeps a count of how often it ran.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        """
+        Initialize with no stages.
+
+        Args:
+            clock: Function returning the current time in seconds
+        """
+        self.clock = clock
+        self._seconds = {}  # stage -> total seconds, in first-seen order
+        self._counts = {}  # stage -> times measured
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Time the body of a with statement as (part of) a stage."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(stage, self.clock() - start)
+
+    def add(self, stage: str, seconds: float):
+        """Add seconds to a stage."""
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def count(self, stage: str) -> int:
+        """Return how many times a stage was measured."""
+        return self._counts.get(stage, 0)
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the total seconds of each stage, in the order first seen."""
+        with self._lock:
+            return dict(self._seconds)
+
+    def summary(self) -> str:
+        """Return the stages as one line for the log, e.g. 'embed=1.20s insert=0.30s'."""
+        return " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in self.as_dict().items())
+
+    def reset(self):
+        """Forget every stage."""
+        with self._lock:
+            self._seconds.clear()
+            self._counts.clear()
@@ -0,0 +1,154 @@
+"""
+Re-indexing of a document directory whenever its files change.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+import importlib.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryWatcher:
+    """
+    Watch an indexed directory and bring the index up to date when its
+    files change.
+
+    File system events (inotify and friends, through the optional
+    watchfiles package) or, without it, polling the files' sizes and
+    modification times tell when something changed. Once the directory
+    has been quiet for the debounce time, DocumentRetriever.index_documents
+    runs in a worker thread: its manifest upserts the chunks of new or
+    changed files and deletes those of removed files, while searches keep
+    being answered.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        directory: str,
+        interval: float = 2.0,
+        debounce: float = 1.0,
+        events: bool | None = None,
+    ):
+        """
+        Initialize the watcher.
+
+        Args:
+            retriever: DocumentRetriever that indexed the directory
+            directory: Directory to watch
+            interval: Seconds between polls (or between checks for stopping,
+                with file events)
+            debounce: Seconds the directory must stay unchanged before it
+                is re-indexed, so a file being copied is indexed once
+            events: Use file system events (True), polling (False), or
+                events when watchfiles is installed (None)
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if debounce < 0:
+            raise ValueError("debounce must be non-negative")
+        if events is None:
+            events = importlib.util.find_spec("watchfiles") is not None
+
+        self.retriever = retriever
+        self.directory = directory
+        self.interval = interval
+        self.debounce = debounce
+        self.events = events
+        self.updates = 0  # times the index was brought up to date
+        self._worker = None
+        self._stop = None
+
+    @property
+    def running(self) -> bool:
+        """Return True if the watcher is watching."""
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start watching on the running event loop."""
+        if self.running:
+            return
+        self._stop = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop watching, letting an update in progress finish first."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self):
+        """Update the index every time the directory settles after a change."""
+        changes = self._events() if self.events else self._poll()
+        logger.info(f"Watching {self.directory} ({'events' if self.events else 'polling'})")
+        async for _ in changes:
+            try:
+                count = await asyncio.to_thread(self.retriever.index_documents, self.directory)
+                self.updates += 1
+                logger.info(f"Re-indexed {self.directory}, {count:+d} documents")
+            except Exception as e:
+                # keep watching; the files that failed are retried next time
+                logger.error(f"Re-indexing {self.directory} failed: {e}")
+
+    async def _events(self):
+        """Yield once per debounced batch of file system events."""
+        from watchfiles import awatch
+
+        # catch up with changes made while the directory was first indexed
+        yield
+        async for _ in awatch(
+            self.directory,
+            # yield once no event came for debounce seconds (or after 30s of them)
+            step=max(int(self.debounce * 1000), 50),
+            debounce=30_000,
+            rust_timeout=int(self.interval * 1000),
+            stop_event=self._stop,
+            recursive=False,
+            watch_filter=lambda _, path: path.endswith((".txt", ".pdf")),
+        ):
+            yield
+
+    async def _poll(self):
+        """Yield once the files' sizes and times have changed and then stayed put."""
+        loop = asyncio.get_running_loop()
+        previous, changed_at = await asyncio.to_thread(self._snapshot), loop.time()
+        # None differs from any snapshot, so the first poll catches up with
+        # changes made while the directory was first indexed
+        indexed = None
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            current = await asyncio.to_thread(self._snapshot)
+            if current != previous:
+                previous, changed_at = current, loop.time()
+            if current != indexed and loop.time() - changed_at >= self.debounce:
+                indexed = current
+                yield
+
+    def _snapshot(self) -> dict:
+        """Return the size and modification time of every file to index."""
+        snapshot = {}
+        try:
+            filepaths = self.retriever.loader.list_files(self.directory)
+        except ValueError:
+            return snapshot  # the directory is gone, which looks like no files
+        for filepath in filepaths:
+            try:
+                stat = filepath.stat()
+            except FileNotFoundError:
+                continue  # removed while listing
+            snapshot[filepath] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
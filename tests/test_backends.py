@@ -0,0 +1,285 @@
+"""
+Unit tests of the vector store backends.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import numpy as np
+import pytest
+
+from retrieval.backends import (
+    ChromaBackend,
+    MetadataColumns,
+    NumpyBackend,
+    matches_document,
+    matches_where,
+)
+
+
+@pytest.fixture
+def vectors():
+    """Random unit vectors standing in for embeddings."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 16)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_all(backend, vectors):
+    """Add one document per vector."""
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    texts = [f"text {i}" for i in range(len(vectors))]
+    metadatas = [{"n": i} for i in range(len(vectors))]
+    backend.add(ids, texts, metadatas, vectors)
+
+
+def test_numpy_search_finds_nearest(vectors):
+    """Test that each vector's nearest neighbour is itself, at distance 0."""
+    backend = NumpyBackend()
+    add_all(backend, vectors)
+
+    results = backend.search_many(vectors[:3], n_results=4)
+
+    assert [result[0]["id"] for result in results] == ["doc0", "doc1", "doc2"]
+    assert all(len(result) == 4 for result in results)
+    assert results[0][0]["distance"] == pytest.approx(0.0, abs=1e-5)
+    assert results[0][0]["text"] == "text 0"
+    assert results[0][0]["metadata"] == {"n": 0}
+    distances = [result["distance"] for result in results[0]]
+    assert distances == sorted(distances)
+
+
+def test_numpy_matches_chroma(vectors):
+    """Test that the exact search agrees with ChromaDB on a small index."""
+    numpy_backend, chroma_backend = NumpyBackend(), ChromaBackend(None, "backend_test")
+    add_all(numpy_backend, vectors)
+    add_all(chroma_backend, vectors)
+
+    expected = chroma_backend.search_many(vectors[10:15], n_results=5)
+    actual = numpy_backend.search_many(vectors[10:15], n_results=5)
+
+    for want, got in zip(expected, actual):
+        assert [result["id"] for result in got] == [result["id"] for result in want]
+        assert [r["distance"] for r in got] == pytest.approx(
+            [r["distance"] for r in want], abs=1e-4
+        )
+
+
+def test_numpy_empty_and_small(vectors):
+    """Test searching an empty index and asking for more than it has."""
+    backend = NumpyBackend()
+    assert backend.search(vectors[0], n_results=3) == []
+
+    add_all(backend, vectors[:2])
+    assert len(backend.search(vectors[0], n_results=5)) == 2
+    assert backend.count() == 2
+
+
+def test_numpy_delete_and_replace(vectors):
+    """Test that deleted documents disappear and re-added ids are replaced."""
+    backend = NumpyBackend()
+    add_all(backend, vectors[:10])
+
+    backend.delete(["doc3", "missing"])
+    backend.add(["doc4"], ["new text"], [{"n": 40}], vectors[4:5])
+
+    assert backend.count() == 9
+    assert "doc3" not in [r["id"] for r in backend.search(vectors[3], n_results=10)]
+    assert backend.search(vectors[4], n_results=1)[0]["text"] == "new text"
+
+
+def test_numpy_flush_and_reload(tmp_path, vectors):
+    """Test that a flushed index is loaded again by a new backend."""
+    backend = NumpyBackend(persist_directory=str(tmp_path))
+    add_all(backend, vectors)
+    backend.flush()
+
+    reloaded = NumpyBackend(persist_directory=str(tmp_path))
+
+    assert reloaded.count() == 50
+    assert reloaded.search(vectors[7], n_results=1)[0]["id"] == "doc7"
+    reloaded.clear()
+    assert reloaded.count() == 0
+
+
+@pytest.mark.parametrize(
+    "quantization, ratio, min_recall", [("int8", 3.5, 0.9), ("binary", 25, 0.5)]
+)
+def test_quantized_memory_and_recall(quantization, ratio, min_recall):
+    """Test that quantized codes are much smaller and lose little recall."""
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(2000, 384)).astype(np.float32)
+    backend = NumpyBackend(quantization=quantization)
+    backend.add([f"doc{i}" for i in range(2000)], [""] * 2000, [{}] * 2000, data)
+
+    usage = backend.memory_usage()
+    queries = data[:50] + rng.normal(size=(50, 384)).astype(np.float32) * 0.3
+
+    # the float vectors are rescored from a mapped file, so only the codes stay in memory
+    assert usage["vectors"] == 0 and usage["vectors_mapped"]
+    assert backend.vectors.nbytes / usage["codes"] > ratio
+    # the nearest neighbour is always kept; further ones are near-ties on random data
+    assert backend.recall(queries, n_results=1) == 1.0
+    assert backend.recall(queries, n_results=10) > min_recall
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_distances_are_exact(vectors, quantization):
+    """Test that rescored results carry exact float distances."""
+    exact, quantized = NumpyBackend(), NumpyBackend(quantization=quantization)
+    add_all(exact, vectors)
+    add_all(quantized, vectors)
+
+    for want, got in zip(exact.search_many(vectors, 3), quantized.search_many(vectors, 3)):
+        assert got[0]["id"] == want[0]["id"]
+        assert got[0]["distance"] == pytest.approx(want[0]["distance"], abs=1e-5)
+
+
+def test_quantized_reload_maps_vectors(tmp_path, vectors):
+    """Test that a reloaded quantized index maps its vectors and can still change."""
+    backend = NumpyBackend(persist_directory=str(tmp_path), quantization="int8")
+    add_all(backend, vectors)
+    backend.flush()
+
+    reloaded = NumpyBackend(persist_directory=str(tmp_path), quantization="int8")
+    assert reloaded.memory_usage()["vectors_mapped"]
+    assert reloaded.memory_usage()["vectors"] == 0
+    assert reloaded.search(vectors[9], n_results=1)[0]["id"] == "doc9"
+
+    reloaded.add(["doc9"], ["moved"], [{}], vectors[20:21])
+    reloaded.delete(["doc20"])
+    assert reloaded.search(vectors[20], n_results=1)[0]["text"] == "moved"
+    assert reloaded.count() == 49
+    # changes are made to a mapped copy, not one in memory
+    assert reloaded.memory_usage()["vectors"] == 0
+
+
+def test_int8_scores_are_integer_dot_products(vectors):
+    """Test that int8 candidates are scored by exact integer products of the codes."""
+    backend = NumpyBackend(quantization="int8")
+    add_all(backend, vectors)
+    codes, scales = backend._codes[:50], backend._scales[:50]
+    query_codes, query_scales = backend._quantize(vectors[:3])
+
+    dots = query_codes.astype(np.int32) @ codes.astype(np.int32).T
+    expected = dots * query_scales[:, None] * scales[None, :]
+    assert np.allclose(backend._approximate_scores(vectors[:3], codes, scales), expected)
+
+
+@pytest.mark.parametrize("quantization", [None, "int8", "binary"])
+def test_read_only_maps_saved_index(tmp_path, vectors, quantization):
+    """Test that a read-only backend maps the saved vectors and codes and refuses changes."""
+    backend = NumpyBackend(persist_directory=str(tmp_path), quantization=quantization)
+    add_all(backend, vectors)
+    backend.flush()
+
+    shared = NumpyBackend(
+        persist_directory=str(tmp_path), quantization=quantization, read_only=True
+    )
+
+    assert shared.memory_usage()["vectors_mapped"]
+    if quantization:
+        assert isinstance(shared._codes, np.memmap)
+    assert shared.search(vectors[9], n_results=1)[0]["id"] == "doc9"
+    for change in (lambda: add_all(shared, vectors), lambda: shared.delete(["doc1"])):
+        with pytest.raises(RuntimeError, match="read-only"):
+            change()
+    with pytest.raises(ValueError, match="persist_directory"):
+        NumpyBackend(read_only=True)
+
+
+def test_unknown_quantization():
+    """Test that an unknown quantization raises an error."""
+    with pytest.raises(ValueError, match="Unknown quantization"):
+        NumpyBackend(quantization="int4")
+
+
+@pytest.mark.parametrize(
+    "make_backend",
+    [
+        lambda: ChromaBackend(None, "filter_test"),
+        NumpyBackend,
+        lambda: NumpyBackend(quantization="int8"),
+        lambda: NumpyBackend(quantization="binary"),
+    ],
+    ids=["chroma", "numpy", "numpy-int8", "numpy-binary"],
+)
+def test_filters_are_pushed_down(vectors, make_backend):
+    """Test that only documents passing where and where_document are ranked."""
+    backend = make_backend()
+    add_all(backend, vectors)
+
+    where = {"$and": [{"n": {"$gte": 10}}, {"n": {"$lt": 20}}]}
+    results = backend.search_many(vectors[:2], n_results=5, where=where)
+    for result in results:
+        assert len(result) == 5
+        assert all(10 <= r["metadata"]["n"] < 20 for r in result)
+
+    # n_results counts matching documents, not documents searched
+    result = backend.search(vectors[0], 5, where={"n": {"$in": [3, 4]}})
+    assert sorted(r["id"] for r in result) == ["doc3", "doc4"]
+    result = backend.search(vectors[0], 20, where_document={"$contains": "text 4"})
+    assert sorted(r["id"] for r in result) == ["doc4"] + [f"doc4{i}" for i in range(10)]
+
+    among = backend.search_among(vectors[1], ["doc1", "doc2", "doc3"], 3, where={"n": {"$ne": 1}})
+    assert sorted(r["id"] for r in among) == ["doc2", "doc3"]
+
+
+def test_matches_where_and_document():
+    """Test the filter semantics the NumPy backend applies."""
+    metadata = {"type": "pdf", "num_pages": 12, "filename": "a.pdf"}
+    assert matches_where({"type": "pdf"}, metadata)
+    assert matches_where({"num_pages": {"$gte": 10, "$lte": 12}}, metadata)
+    assert matches_where({"$or": [{"type": "txt"}, {"filename": {"$in": ["a.pdf"]}}]}, metadata)
+    assert not matches_where({"$and": [{"type": "pdf"}, {"num_pages": {"$gt": 12}}]}, metadata)
+    # a missing field never matches, even a negated condition
+    assert not matches_where({"chunk": {"$ne": 3}}, metadata)
+    with pytest.raises(ValueError, match="Unknown filter operator"):
+        matches_where({"type": {"$like": "p%"}}, metadata)
+
+    assert matches_document({"$contains": "Count"}, "Count Dracula")
+    assert not matches_document({"$not_contains": "Count"}, "Count Dracula")
+    assert matches_document({"$or": [{"$contains": "x"}, {"$contains": "Drac"}]}, "Dracula")
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        {"type": "pdf"},
+        {"num_pages": {"$gte": 10, "$lt": 30}},
+        {"num_pages": {"$ne": 12}},
+        {"type": {"$nin": ["txt"]}},
+        {"draft": True},
+        {"$or": [{"type": "txt"}, {"num_pages": {"$in": [3, 40]}}]},
+        {"$and": [{"type": {"$ne": "pdf"}}, {"chunk": {"$lte": 1}}]},
+    ],
+)
+def test_metadata_columns_match_matches_where(where):
+    """Test that filtering by columns gives what checking each document does."""
+    metadatas = [
+        {"type": "pdf", "num_pages": 12, "chunk": 0},
+        {"type": "pdf", "num_pages": 40, "draft": True},
+        {"type": "txt", "chunk": 1},
+        {"type": 3, "num_pages": 3.0},
+        {},
+        None,
+    ]
+    expected = [matches_where(where, metadata or {}) for metadata in metadatas]
+    assert MetadataColumns(metadatas).mask(where).tolist() == expected
+    with pytest.raises(ValueError, match="Unknown filter operator"):
+        MetadataColumns(metadatas).mask({"type": {"$like": "p%"}})
+
+
+def test_filters_see_changed_metadata(vectors):
+    """Test that filtered searches follow added, replaced and deleted documents."""
+    backend = NumpyBackend()
+    add_all(backend, vectors[:10])
+    assert len(backend.search(vectors[0], 20, where={"n": {"$gte": 5}})) == 5
+
+    backend.add(["doc0", "doc10"], ["", ""], [{"n": 50}, {"n": 60}], vectors[10:12])
+    backend.delete(["doc9"])
+    result = backend.search(vectors[0], 20, where={"n": {"$gte": 5}})
+    assert sorted(r["id"] for r in result) == ["doc0", "doc10", "doc5", "doc6", "doc7", "doc8"]
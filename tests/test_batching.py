@@ -0,0 +1,180 @@
+"""
+Unit tests for the query batcher.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+
+import pytest
+
+from retrieval.batching import QueryBatcher
+from retrieval.timing import Timings
+
+
+class RecordingSearch:
+    """A search_many stand-in that remembers how it was called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, queries, n_results):
+        self.calls.append((list(queries), n_results))
+        return [[{"id": f"{query}_{i}"} for i in range(n_results)] for query in queries]
+
+
+async def run_queries(batcher, requests):
+    """Start the batcher, send requests concurrently and stop it again."""
+    batcher.start()
+    try:
+        return await asyncio.gather(*(batcher.search(q, n) for q, n in requests))
+    finally:
+        await batcher.stop()
+
+
+def test_concurrent_queries_share_one_call():
+    """Test that queries arriving together are answered by one call."""
+    search_many = RecordingSearch()
+    batcher = QueryBatcher(search_many, max_batch_size=8, max_wait_ms=50)
+
+    results = asyncio.run(run_queries(batcher, [("a", 1), ("b", 3), ("c", 2)]))
+
+    assert len(search_many.calls) == 1
+    assert search_many.calls[0] == (["a", "b", "c"], 3)
+    assert [len(result) for result in results] == [1, 3, 2]
+    assert results[1][0]["id"] == "b_0"
+
+
+def test_batches_respect_max_size():
+    """Test that a burst of queries is split into batches of max size."""
+    search_many = RecordingSearch()
+    batcher = QueryBatcher(search_many, max_batch_size=2, max_wait_ms=50)
+
+    results = asyncio.run(run_queries(batcher, [(str(i), 1) for i in range(5)]))
+
+    assert [len(queries) for queries, _ in search_many.calls] == [2, 2, 1]
+    assert [result[0]["id"] for result in results] == ["0_0", "1_0", "2_0", "3_0", "4_0"]
+
+
+def test_errors_reach_every_caller():
+    """Test that a failing batch fails each of its requests."""
+
+    def failing_search(queries, n_results):
+        raise ValueError("No documents indexed")
+
+    batcher = QueryBatcher(failing_search, max_wait_ms=10)
+
+    async def run():
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.search("a"), batcher.search("b"), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_search_requires_start():
+    """Test that searching a batcher that isn't running raises."""
+    batcher = QueryBatcher(RecordingSearch())
+
+    with pytest.raises(RuntimeError, match="not running"):
+        asyncio.run(batcher.search("a"))
+
+
+def test_bad_settings():
+    """Test that invalid batch settings raise an error."""
+    with pytest.raises(ValueError):
+        QueryBatcher(RecordingSearch(), max_batch_size=0)
+    with pytest.raises(ValueError):
+        QueryBatcher(RecordingSearch(), max_wait_ms=-1)
+
+
+def test_options_are_batched_separately():
+    """Test that only queries with the same options share a call."""
+    calls = []
+
+    def search_many(queries, n_results, mode=None):
+        calls.append((list(queries), mode))
+        return [[{"id": f"{query}_{mode}"}] for query in queries]
+
+    async def run():
+        batcher = QueryBatcher(search_many, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.search("a", 1, mode="hybrid"),
+                batcher.search("b", 1),
+                batcher.search("c", 1, mode="hybrid"),
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(run())
+
+    assert sorted(calls, key=str) == sorted([(["a", "c"], "hybrid"), (["b"], None)], key=str)
+    assert [result[0]["id"] for result in results] == ["a_hybrid", "b_None", "c_hybrid"]
+
+
+def test_dict_options_are_grouped():
+    """Test that unhashable options such as filters still batch together when equal."""
+    calls = []
+
+    def search_many(queries, n_results, where=None):
+        calls.append((list(queries), where))
+        return [[{"id": query}] for query in queries]
+
+    async def run():
+        batcher = QueryBatcher(search_many, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.search("a", 1, where={"type": "pdf"}),
+                batcher.search("b", 1, where={"type": "txt"}),
+                batcher.search("c", 1, where={"type": "pdf"}),
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(run())
+
+    assert sorted(calls, key=str) == sorted(
+        [(["a", "c"], {"type": "pdf"}), (["b"], {"type": "txt"})], key=str
+    )
+    assert [result[0]["id"] for result in results] == ["a", "b", "c"]
+
+
+def test_timed_batches_report_each_request():
+    """Test that a timed batcher gives each request the call's stages and its cache status."""
+
+    def search_many(queries, n_results, timings, cache_hits):
+        timings.add("embed", 0.25)
+        cache_hits.extend(query == "cached" for query in queries)
+        return [[{"id": query}] for query in queries]
+
+    async def run():
+        batcher = QueryBatcher(search_many, max_batch_size=8, max_wait_ms=50, timed=True)
+        batcher.start()
+        try:
+            timings = [Timings(), Timings()]
+            await asyncio.gather(
+                batcher.search("cached", 1, timings=timings[0]),
+                batcher.search("new", 1, timings=timings[1]),
+            )
+            return timings
+        finally:
+            await batcher.stop()
+
+    cached, new = asyncio.run(run())
+
+    assert cached.as_dict()["embed"] == new.as_dict()["embed"] == 0.25
+    assert cached.as_dict()["queue"] >= 0
+    assert cached.count("cache_hit") == 1 and cached.count("cache_miss") == 0
+    assert new.count("cache_miss") == 1 and new.count("cache_hit") == 0
@@ -0,0 +1,78 @@
+"""
+Unit tests of the benchmark suite.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import json
+
+import pytest
+
+from retrieval.benchmark import compare, latency_percentiles, main, run_benchmarks, synthetic_corpus
+
+
+def test_synthetic_corpus_is_reproducible(tmp_path):
+    """Test that the same seed writes the same files of the requested size."""
+    first = synthetic_corpus(tmp_path / "a", files=3, words_per_file=200, seed=7)
+    second = synthetic_corpus(tmp_path / "b", files=3, words_per_file=200, seed=7)
+    other = synthetic_corpus(tmp_path / "c", files=1, words_per_file=200, seed=8)
+
+    assert len(first) == 3
+    assert [p.read_text() for p in first] == [p.read_text() for p in second]
+    assert first[0].read_text() != other[0].read_text()
+    assert len(first[0].read_text().split()) == 200
+
+
+def test_latency_percentiles():
+    """Test that percentiles are reported in milliseconds."""
+    percentiles = latency_percentiles([i / 1000 for i in range(1, 101)])
+    assert percentiles["p50_ms"] == pytest.approx(50.5)
+    assert percentiles["p99_ms"] == pytest.approx(99.01)
+
+
+def test_compare_flags_regressions_by_direction():
+    """Test that lower throughput or recall and higher latency are regressions, counts aren't."""
+    baseline = {"results": {"search": {"queries_per_second": 100.0, "p95_ms": 10.0, "queries": 5}}}
+    current = {"results": {"search": {"queries_per_second": 80.0, "p95_ms": 9.0, "queries": 9}}}
+    baseline["results"]["search"]["recall_at_10"] = 1.0
+    current["results"]["search"]["recall_at_10"] = 0.8
+
+    rows = {row["metric"]: row for row in compare(baseline, current, tolerance=0.1)}
+
+    assert set(rows) == {"search.queries_per_second", "search.p95_ms", "search.recall_at_10"}
+    assert rows["search.recall_at_10"]["regression"]
+    assert rows["search.queries_per_second"]["regression"]
+    assert rows["search.queries_per_second"]["change"] == pytest.approx(-0.2)
+    assert not rows["search.p95_ms"]["regression"]
+    assert not compare(baseline, current, tolerance=0.25)[0]["regression"]
+
+
+def test_run_and_compare(tmp_path, capsys):
+    """Test that a small run reports every stage and compares clean against itself."""
+    results = run_benchmarks(tmp_path / "corpus", files=4, words_per_file=400, queries=10)
+
+    assert set(results["results"]) == {
+        "corpus",
+        "chunking",
+        "loading",
+        "embedding",
+        "indexing",
+        "search",
+    }
+    assert results["results"]["chunking"]["chunks"] == results["results"]["indexing"]["chunks"]
+    assert results["results"]["search"]["p50_ms"] <= results["results"]["search"]["p99_ms"]
+    assert results["results"]["search"]["recall_at_10"] == 1.0
+
+    saved = tmp_path / "results.json"
+    saved.write_text(json.dumps(results))
+    assert main(["--results", str(saved), "--baseline", str(saved)]) == 0
+    assert "0 regression(s)" in capsys.readouterr().out
+
+    slower = json.loads(saved.read_text())
+    slower["results"]["search"]["p95_ms"] *= 2
+    (tmp_path / "slower.json").write_text(json.dumps(slower))
+    assert main(["--results", str(tmp_path / "slower.json"), "--baseline", str(saved)]) == 1
@@ -0,0 +1,130 @@
+"""
+Unit tests for the caches.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import numpy as np
+import pytest
+
+from retrieval.cache import EmbeddingCache, LRUCache
+
+
+class FakeClock:
+    """A clock we can move forward by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_put():
+    """Test that stored values come back and misses return the default."""
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("b", 0) == 0
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_is_evicted():
+    """Test that the cache never grows past maxsize."""
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # now b is the least recently used
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_entries_expire():
+    """Test that entries are dropped once their ttl has passed."""
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.put("a", 1)
+
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_zero_size_disables_cache():
+    """Test that a cache of size 0 stores nothing."""
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert cache.hit_rate == 0.0
+
+
+def test_bad_settings():
+    """Test that invalid settings raise an error."""
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=-1)
+    with pytest.raises(ValueError):
+        LRUCache(ttl=0)
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    """Test that cached vectors come back, and unknown texts don't."""
+    cache = EmbeddingCache(tmp_path, "some/model")
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    cache.put_many(["a", "b"], vectors)
+
+    found = cache.get_many(["b", "c", "a"])
+
+    assert np.array_equal(found[0], vectors[1])
+    assert found[1] is None
+    assert np.array_equal(found[2], vectors[0])
+    assert len(cache) == 2
+
+
+def test_embedding_cache_persists(tmp_path):
+    """Test that a reopened cache still has its vectors, per model."""
+    EmbeddingCache(tmp_path, "model-a").put_many(["a"], np.ones((1, 4)))
+
+    reopened = EmbeddingCache(tmp_path, "model-a")
+    other_model = EmbeddingCache(tmp_path, "model-b")
+
+    assert np.array_equal(reopened.get_many(["a"])[0], np.ones(4, dtype=np.float32))
+    assert other_model.get_many(["a"]) == [None]
+
+
+def test_embedding_cache_skips_known_texts(tmp_path):
+    """Test that texts already cached are not appended again."""
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.put_many(["a", "a"], np.ones((2, 2)))
+    cache.put_many(["a", "b"], np.zeros((2, 2)))
+
+    assert len(cache) == 2
+    assert (cache.directory / "vectors.f32").stat().st_size == 2 * 2 * 4
+    assert np.array_equal(cache.get_many(["a"])[0], np.ones(2, dtype=np.float32))
+
+
+def test_embedding_cache_recovers_from_partial_write(tmp_path):
+    """Test that vectors left without a key by a crash are ignored."""
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.put_many(["a"], np.ones((1, 2)))
+    with open(cache.directory / "vectors.f32", "ab") as f:
+        f.write(np.full(2, 7, dtype=np.float32).tobytes())
+
+    reopened = EmbeddingCache(tmp_path, "model")
+    reopened.put_many(["b"], np.zeros((1, 2)))
+
+    assert np.array_equal(reopened.get_many(["b"])[0], np.zeros(2, dtype=np.float32))
+    assert np.array_equal(EmbeddingCache(tmp_path, "model").get_many(["b"])[0], np.zeros(2))
@@ -12,6 +12,7 @@ from pathlib import Path
 
 import pytest
 
+from retrieval.embeddings import DocumentEmbedder
 from retrieval.loader import DocumentChunker
 
 
@@ -77,3 +78,83 @@ def test_sample():
     assert chunks[500]["text"][:24] == "thin mist began to creep"
     assert chunks[500]["id"] == "dracula_by_bram_stoker_500"
     assert chunks[500]["metadata"] == {"chunk": 500, "doc_id": "dracula_by_bram_stoker"}
+
+
+def test_chunks_carry_offsets():
+    """Test that chunks are offsets into the text, joined by single spaces."""
+    chunker = DocumentChunker(chunk_size=3, overlap=1)
+    text = "one two\n\nthree  four\tfive six"
+
+    chunks = chunker.chunk_text(text, "doc")
+
+    assert [chunk["text"] for chunk in chunks] == ["one two three", "three four five", "five six"]
+    assert (chunks[1].start, chunks[1].end) == (9, 25)
+    assert text[chunks[1].start : chunks[1].end] == "three  four\tfive"
+    assert all(chunk.source is text for chunk in chunks)
+    assert dict(chunks[2]) == {
+        "id": "doc_2",
+        "text": "five six",
+        "metadata": {"chunk": 2, "doc_id": "doc"},
+    }
+    # the collapsed text is built once and then reused
+    assert chunks[1]["text"] is chunks[1]["text"]
+
+
+def test_chunks_of_single_spaced_text_are_slices():
+    """Test that single-spaced text needs no rejoining."""
+    chunker = DocumentChunker(chunk_size=2, overlap=0)
+
+    chunks = chunker.chunk_text("a b c d e", "doc")
+
+    assert [chunk["text"] for chunk in chunks] == ["a b", "c d", "e"]
+    assert not any(chunk.collapse for chunk in chunks)
+    with pytest.raises(KeyError):
+        chunks[0]["missing"]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    """The tokenizer of the default embedding model."""
+    return DocumentEmbedder().tokenizer
+
+
+def test_token_chunks_fit_the_model(tokenizer):
+    """Test that token chunks are capped at the model's sequence length."""
+    chunker = DocumentChunker(chunk_size=1000, overlap=20, tokenizer=tokenizer, max_length=256)
+    text = "The quick brown fox jumps over the lazy dog. " * 200
+
+    chunks = chunker.chunk_text(text, "fox")
+
+    assert chunker.chunk_size == 254
+    assert len(chunks) > 1
+    lengths = [
+        len(tokenizer(chunk["text"], add_special_tokens=False)["input_ids"]) for chunk in chunks
+    ]
+    assert max(lengths) <= 254
+    assert all(chunk["text"] in text for chunk in chunks)
+    # consecutive chunks overlap
+    assert chunks[1].start < chunks[0].end
+
+
+def test_token_chunks_small_text(tokenizer):
+    """Test that text within the token budget becomes a single chunk."""
+    chunker = DocumentChunker(chunk_size=50, overlap=5, tokenizer=tokenizer)
+
+    chunks = chunker.chunk_text("Short  document", "doc1")
+
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == "Short  document"
+
+
+def test_token_chunks_sample(tokenizer):
+    """Test that token chunking covers the whole sample book."""
+    chunker = DocumentChunker(chunk_size=256, overlap=32, tokenizer=tokenizer, max_length=256)
+    sample_file = Path(__file__).parent / "data" / "dracula_by_bram_stoker.txt"
+    text = sample_file.read_text(encoding="utf-8")
+
+    chunks = chunker.chunk_text(text, "dracula")
+
+    # nothing but the byte order mark comes before the first chunk
+    assert text[: chunks[0].start] == "\ufeff"
+    assert chunks[-1].end == len(text.rstrip())
+    assert all(chunks[i + 1].start < chunks[i].end for i in range(len(chunks) - 1))
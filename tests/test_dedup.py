@@ -0,0 +1,78 @@
+"""
+Unit tests of the duplicate chunk detector.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import pytest
+
+from retrieval.dedup import ChunkDeduplicator
+
+# a paragraph long enough for word shingles to mean something
+PARAGRAPH = " ".join(f"word{i}" for i in range(200))
+
+
+def test_exact_duplicates():
+    """Test that the same text, however it is spaced, is a duplicate."""
+    dedup = ChunkDeduplicator()
+
+    assert dedup.check("a", "Terms and conditions apply.") is None
+    assert dedup.check("b", "  Terms and\nconditions   apply. ") == "a"
+    assert dedup.check("c", "Terms and conditions do not apply.") is None
+    assert len(dedup) == 2
+    assert dedup.duplicates == 1
+    assert dedup.aliases == {"b": "a"}
+
+
+def test_near_duplicates():
+    """Test that small edits are near-duplicates and unrelated text is not."""
+    dedup = ChunkDeduplicator()
+
+    assert dedup.check("a", PARAGRAPH) is None
+    assert dedup.check("b", PARAGRAPH.replace("word100", "changed")) == "a"
+    assert dedup.check("c", PARAGRAPH.upper() + "!") == "a"
+    assert dedup.check("d", " ".join(f"other{i}" for i in range(200))) is None
+    # half the words shared is similar, but not a duplicate
+    assert dedup.check("e", " ".join(f"word{i}" for i in range(100, 300))) is None
+    assert dedup.duplicates == 2
+
+
+def test_delete_returns_orphaned_duplicates():
+    """Test that deleting a kept chunk reports the duplicates that relied on it."""
+    dedup = ChunkDeduplicator()
+    dedup.check("a", PARAGRAPH)
+    dedup.check("b", PARAGRAPH)
+    dedup.check("c", "something else entirely")
+
+    assert dedup.delete(["b", "unknown"]) == []
+    dedup.check("b", PARAGRAPH)
+    assert dedup.delete(["a"]) == ["b"]
+    assert dedup.duplicates == 0
+    # the text is new again once its kept copy is gone
+    assert dedup.check("b", PARAGRAPH) is None
+
+
+def test_flush_and_reload(tmp_path):
+    """Test that kept chunks and aliases survive a restart."""
+    path = tmp_path / "dedup.json"
+    dedup = ChunkDeduplicator(path)
+    dedup.check("a", PARAGRAPH)
+    dedup.check("b", PARAGRAPH + " extra")
+    dedup.flush()
+
+    reloaded = ChunkDeduplicator(path)
+    assert reloaded.aliases == {"b": "a"}
+    assert reloaded.check("c", PARAGRAPH.replace("word5", "five")) == "a"
+    assert reloaded.delete(["a"]) == ["b", "c"]
+
+
+def test_bad_settings():
+    """Test that invalid settings are rejected."""
+    with pytest.raises(ValueError):
+        ChunkDeduplicator(threshold=0)
+    with pytest.raises(ValueError):
+        ChunkDeduplicator(num_perm=100, bands=16)
@@ -8,11 +8,13 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
+import platform
+
 import numpy as np
 import pytest
 
 # import DocumentEmbedder
-from retrieval.embeddings import DocumentEmbedder
+from retrieval.embeddings import DocumentEmbedder, embedding_drift, quantization_config
 
 
 @pytest.fixture
@@ -92,3 +94,99 @@ def test_custom_model_name():
     embedder = DocumentEmbedder(model_name="all-MiniLM-L6-v2")
 
     assert embedder.model_name == "all-MiniLM-L6-v2"
+
+
+def test_repeated_query_uses_cache(embedder):
+    """Test that a repeated query comes from the cache."""
+    first = embedder.embed_query("vampire hunters")
+    second = embedder.embed_query("  vampire   hunters ")
+
+    assert np.array_equal(first, second)
+    assert embedder.query_cache.stats()["hits"] == 1
+    assert embedder.query_cache.stats()["misses"] == 1
+    assert not second.flags.writeable
+
+
+def test_query_list_mixes_cached_and_new(embedder):
+    """Test that a list of queries only embeds the ones not cached."""
+    single = embedder.embed_query("query1")
+    both = embedder.embed_query(["query1", "query2", "query2"])
+
+    assert both.shape == (3, 384)
+    assert np.array_equal(both[0], single)
+    assert len(embedder.query_cache) == 2
+
+
+def test_query_cache_can_be_disabled():
+    """Test that a cache size of 0 turns the query cache off."""
+    embedder = DocumentEmbedder(query_cache_size=0)
+    embedder.embed_query("test query")
+
+    assert len(embedder.query_cache) == 0
+
+
+def test_embedding_cache_skips_the_model(tmp_path):
+    """Test that documents embedded once come from the on-disk cache."""
+    texts = ["Python programming", "Machine learning"]
+    first = DocumentEmbedder(cache_dir=str(tmp_path)).embed_documents(texts)
+
+    embedder = DocumentEmbedder(cache_dir=str(tmp_path))
+
+    def no_model(texts):
+        raise AssertionError("the model should not run")
+
+    embedder._encode = no_model
+    second = embedder.embed_documents(texts)
+
+    assert np.allclose(first, second)
+    assert second.dtype == np.float32
+
+
+def test_unknown_backend():
+    """Test that an unknown inference backend raises an error."""
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        DocumentEmbedder(backend="tensorrt")
+
+
+def test_embedding_drift():
+    """Test the drift report between two sets of embeddings."""
+    reference = np.array([[1.0, 0.0], [0.0, 1.0]])
+    drift = embedding_drift(reference, np.array([[1.0, 0.0], [1.0, 1.0]]))
+
+    assert drift["mean_cosine"] == pytest.approx((1 + 2**-0.5) / 2)
+    assert drift["min_cosine"] == pytest.approx(2**-0.5)
+    assert drift["max_abs_diff"] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize(
+    "machine, expected",
+    [
+        ("x86_64", ("avx2", "quint8_avx2")),
+        ("aarch64", ("arm64", "qint8_arm64")),
+        ("arm64", ("arm64", "qint8_arm64")),
+    ],
+)
+def test_quantization_config(monkeypatch, machine, expected):
+    """Test that the int8 export is named as optimum writes it on each CPU."""
+    monkeypatch.setattr(platform, "machine", lambda: machine)
+    assert quantization_config() == expected
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_backend(tmp_path, embedder, backend):
+    """Test that the ONNX backends are exported once and stay close to PyTorch."""
+    pytest.importorskip("optimum.onnxruntime")
+    onnx_embedder = DocumentEmbedder(backend=backend, export_dir=str(tmp_path))
+    exports = {p: p.stat().st_mtime_ns for p in tmp_path.glob("*/onnx/*.onnx")}
+
+    texts = ["Python programming", "Machine learning"]
+    expected = embedder.embed_documents(texts)
+    actual = onnx_embedder.embed_documents(texts)
+
+    assert actual.shape == expected.shape
+    assert embedding_drift(expected, actual)["min_cosine"] > 0.95
+    assert onnx_embedder.drift["min_cosine"] > 0.95
+    assert onnx_embedder.cache_name.endswith(backend)
+    # a second embedder reuses the export instead of making a new one
+    DocumentEmbedder(backend=backend, export_dir=str(tmp_path))
+    assert {p: p.stat().st_mtime_ns for p in tmp_path.glob("*/onnx/*.onnx")} == exports
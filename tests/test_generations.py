@@ -0,0 +1,103 @@
+"""
+Unit tests of the shared, read-only index generations.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+
+import pytest
+
+from retrieval.embeddings import DocumentEmbedder
+from retrieval.generations import (
+    GenerationWatcher,
+    build_generation,
+    current_generation,
+    publish,
+)
+from retrieval.retriever import DocumentRetriever
+
+
+@pytest.fixture
+def sample_directory(tmp_path):
+    """Create a temporary directory with sample text files."""
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    (directory / "doc1.txt").write_text("Python is a programming language")
+    (directory / "doc2.txt").write_text("Machine learning uses neural networks")
+    return directory
+
+
+def test_publish_and_current_generation(tmp_path):
+    """Test that publishing names the generation readers should use."""
+    assert current_generation(tmp_path) is None
+    publish(tmp_path, tmp_path / "gen-1")
+    assert current_generation(tmp_path) == tmp_path / "gen-1"
+
+
+def test_build_publishes_and_prunes(tmp_path, sample_directory):
+    """Test that each build is published and only the newest generations are kept."""
+    root = tmp_path / "shared"
+    first, _ = build_generation(str(sample_directory), root, keep=2, backend="numpy")
+    second, _ = build_generation(str(sample_directory), root, keep=2, backend="numpy")
+    third, built = build_generation(str(sample_directory), root, keep=2, backend="numpy")
+
+    assert current_generation(root) == third
+    assert not first.exists() and second.exists()
+    assert built.document_count == 2
+    with pytest.raises(ValueError, match="numpy"):
+        build_generation(str(sample_directory), root, backend="chroma")
+
+
+def test_builds_share_embedding_cache(tmp_path, sample_directory, monkeypatch):
+    """Test that a rebuild with unset settings reuses every embedding of the last build."""
+    root = tmp_path / "shared"
+    # unset settings, as the build command passes them
+    options = dict(backend=None, embedding_cache_dir=None)
+    build_generation(str(sample_directory), root, **options)
+
+    encoded = []
+    encode = DocumentEmbedder._encode
+
+    def counting_encode(self, texts):
+        encoded.extend(texts)
+        return encode(self, texts)
+
+    monkeypatch.setattr(DocumentEmbedder, "_encode", counting_encode)
+    _, built = build_generation(str(sample_directory), root, **options)
+
+    assert built.backend == "numpy"
+    assert (root / "embeddings").is_dir()
+    assert built.document_count == 2 and encoded == []
+
+
+def test_read_only_retriever_switches_generation(tmp_path, sample_directory):
+    """Test that a read-only retriever searches a generation and follows new ones."""
+    root = tmp_path / "shared"
+    build_generation(str(sample_directory), root, backend="numpy-int8")
+    retriever = DocumentRetriever(
+        persist_directory=str(current_generation(root)), backend="numpy-int8", read_only=True
+    )
+    assert retriever.document_count == 2
+    with pytest.raises(RuntimeError, match="read-only"):
+        retriever.index_documents(str(sample_directory))
+
+    watcher = GenerationWatcher(retriever, root, interval=0.05)
+    (sample_directory / "doc3.txt").write_text("Vector databases store embeddings")
+    generation, _ = build_generation(str(sample_directory), root, backend="numpy-int8")
+
+    async def follow():
+        watcher.start()
+        for _ in range(200):
+            if watcher.generation == generation:
+                break
+            await asyncio.sleep(0.02)
+        await watcher.stop()
+
+    asyncio.run(follow())
+    assert retriever.document_count == 3
+    assert len(retriever.search("databases", n_results=3)) == 3
@@ -7,16 +7,27 @@ Seattle University, ARIN 5360
 @version: 2.0.0+w26
 """
 
+import json
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 
+from retrieval import main
+from retrieval.generations import build_generation
 from retrieval.main import app
+from retrieval.progress import IndexProgress
 
 
 @pytest.fixture
 def client():
     """Provide test client with lifespan events."""
     with TestClient(app, raise_server_exceptions=False) as client:
+        # the server indexes in the background; wait until it can search
+        deadline = time.monotonic() + 300
+        while client.get("/health").json()["phase"] not in ("ready", "failed"):
+            assert time.monotonic() < deadline, "server did not finish starting"
+            time.sleep(0.05)
         yield client
 
 
@@ -62,3 +73,237 @@ def test_search_invalid_n_results(client):
     """Test search with invalid n_results returns 400."""
     response = client.post("/search", json={"query": "test", "n_results": 100})
     assert response.status_code == 400
+
+
+def test_search_batch_endpoint(client):
+    """Test batch search returns one response per query."""
+    queries = ["test", "How about Python?", "ML Engineering"]
+    response = client.post("/search/batch", json={"queries": queries, "n_results": 2})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 3
+    assert [result["query"] for result in data["results"]] == queries
+    assert all(result["count"] == 2 for result in data["results"])
+
+
+def test_search_batch_streaming(client):
+    """Test batch search can stream newline-delimited JSON."""
+    queries = [f"query number {i}" for i in range(100)]
+    response = client.post(
+        "/search/batch", json={"queries": queries, "n_results": 1, "stream": True}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["query"] for line in lines] == queries
+    assert all(line["count"] == 1 for line in lines)
+
+
+def test_search_batch_invalid(client):
+    """Test batch search rejects empty and blank queries."""
+    assert client.post("/search/batch", json={"queries": []}).status_code == 400
+    assert client.post("/search/batch", json={"queries": ["ok", "  "]}).status_code == 400
+    response = client.post("/search/batch", json={"queries": ["ok"], "n_results": 0})
+    assert response.status_code == 400
+
+
+def test_search_while_indexing(client, monkeypatch):
+    """Test searches get a fast 503 with Retry-After until the index is ready."""
+    starting = IndexProgress()
+    starting.start_indexing(files_total=10)
+    monkeypatch.setattr(main, "progress", starting)
+
+    response = client.post("/search", json={"query": "test"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert client.post("/search/batch", json={"queries": ["test"]}).status_code == 503
+
+    health = client.get("/health").json()
+    assert health["status"] == "starting"
+    assert health["phase"] == "indexing"
+    assert health["progress"]["files_total"] == 10
+
+
+def test_search_modes(client):
+    """Test that unknown modes, and hybrid without the keyword index, are rejected."""
+    response = client.post("/search", json={"query": "test", "mode": "vector"})
+    assert response.status_code == 200
+    assert client.post("/search", json={"query": "test", "mode": "fuzzy"}).status_code == 400
+    assert client.post("/search", json={"query": "test", "mode": "hybrid"}).status_code == 400
+    response = client.post("/search/batch", json={"queries": ["test"], "mode": "hybrid"})
+    assert response.status_code == 400
+
+
+def test_search_filter(client):
+    """Test that a filter is applied before n_results are picked."""
+    response = client.post(
+        "/search",
+        json={"query": "vampire", "n_results": 3, "filter": {"type": "pdf", "min_pages": 1}},
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 3
+    assert all(result["metadata"]["filename"] == "MSAI-courses.pdf" for result in results)
+
+    response = client.post(
+        "/search/batch",
+        json={"queries": ["a", "b"], "filter": {"filename": ["sample1.txt", "sample2.txt"]}},
+    )
+    assert response.status_code == 200
+    for result in response.json()["results"]:
+        filenames = {r["metadata"]["filename"] for r in result["results"]}
+        assert filenames <= {"sample1.txt", "sample2.txt"}
+
+    response = client.post("/search", json={"query": "test", "filter": {"doc_id": []}})
+    assert response.status_code == 400
+    response = client.post("/search", json={"query": "test", "filter": {"min_pages": "many"}})
+    assert response.status_code == 422
+
+
+@pytest.fixture
+def upload_client(tmp_path, monkeypatch):
+    """Provide a test client serving a small documents directory of its own."""
+    (tmp_path / "python.txt").write_text("Python is a programming language")
+    monkeypatch.setattr(main, "DOCUMENTS_DIR", str(tmp_path))
+    with TestClient(app, raise_server_exceptions=False) as client:
+        deadline = time.monotonic() + 300
+        while client.get("/health").json()["phase"] not in ("ready", "failed"):
+            assert time.monotonic() < deadline, "server did not finish starting"
+            time.sleep(0.05)
+        yield client
+
+
+def test_upload_and_delete_documents(upload_client, tmp_path):
+    """Test that uploaded documents become searchable and deleted ones disappear."""
+    client = upload_client
+    files = [
+        ("files", ("vectors.txt", b"Vector databases store embeddings", "text/plain")),
+        ("files", ("learning.txt", b"Machine learning uses neural networks", "text/plain")),
+    ]
+    response = client.post("/documents", files=files)
+    assert response.status_code == 201
+    body = response.json()
+    assert body["indexed"] == ["vectors.txt", "learning.txt"]
+    assert body["errors"] == {}
+    assert body["chunks_added"] == 2
+    assert body["documents_indexed"] == 3
+    assert (tmp_path / "vectors.txt").read_text() == "Vector databases store embeddings"
+
+    results = client.post("/search", json={"query": "embeddings", "n_results": 5}).json()
+    assert {r["metadata"]["filename"] for r in results["results"]} == {
+        "python.txt",
+        "vectors.txt",
+        "learning.txt",
+    }
+
+    # uploading a file again replaces its chunks
+    files = [("files", ("vectors.txt", b"Vector stores index embeddings", "text/plain"))]
+    assert client.post("/documents", files=files).json()["documents_indexed"] == 3
+
+    response = client.delete("/documents/vectors")
+    assert response.status_code == 200
+    assert response.json()["files"] == ["vectors.txt"]
+    assert response.json()["chunks_deleted"] == 1
+    assert response.json()["documents_indexed"] == 2
+    assert not (tmp_path / "vectors.txt").exists()
+    assert client.delete("/documents/vectors").status_code == 404
+
+
+def test_upload_lowercases_extension(upload_client, tmp_path):
+    """Test that an upload with an uppercase extension is indexed and can be deleted."""
+    client = upload_client
+    files = [("files", ("NOTES.TXT", b"Vector databases store embeddings", "text/plain"))]
+    response = client.post("/documents", files=files)
+    assert response.status_code == 201
+    assert response.json()["indexed"] == ["NOTES.txt"]
+    assert response.json()["chunks_added"] == 1
+    assert (tmp_path / "NOTES.txt").is_file()
+
+    response = client.delete("/documents/NOTES")
+    assert response.status_code == 200
+    assert response.json()["files"] == ["NOTES.txt"]
+    assert response.json()["chunks_deleted"] == 1
+
+
+def test_upload_rejects_bad_files(upload_client, tmp_path):
+    """Test that unsupported and unreadable uploads are refused and not kept."""
+    client = upload_client
+    files = [("files", ("notes.md", b"# notes", "text/markdown"))]
+    assert client.post("/documents", files=files).status_code == 400
+
+    files = [("files", ("broken.pdf", b"not really a pdf", "application/pdf"))]
+    response = client.post("/documents", files=files)
+    assert response.status_code == 201
+    assert response.json()["indexed"] == []
+    assert "broken.pdf" in response.json()["errors"]
+    assert not (tmp_path / "broken.pdf").exists()
+    assert not list(tmp_path.glob(".*.upload"))
+
+
+def test_shared_read_only_index(tmp_path, monkeypatch):
+    """Test that a worker serves the published generation and refuses to change it."""
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    (documents / "python.txt").write_text("Python is a programming language")
+    shared = tmp_path / "shared"
+    monkeypatch.setattr(main, "STORE_BACKEND", "numpy")
+    monkeypatch.setattr(main, "SHARED_INDEX_DIR", str(shared))
+    generation, _ = build_generation(str(documents), shared, **main.retriever_options())
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        deadline = time.monotonic() + 300
+        while client.get("/health").json()["phase"] not in ("ready", "failed"):
+            assert time.monotonic() < deadline, "server did not finish starting"
+            time.sleep(0.05)
+
+        health = client.get("/health").json()
+        assert health["phase"] == "ready"
+        assert health["index_generation"] == generation.name
+        results = client.post("/search", json={"query": "Python", "n_results": 5}).json()
+        assert results["count"] == 1
+        files = [("files", ("vectors.txt", b"Vector databases", "text/plain"))]
+        assert client.post("/documents", files=files).status_code == 409
+        assert not (documents / "vectors.txt").exists()
+
+
+def test_metrics(client):
+    """Test that /metrics reports requests, search stages, indexing and caches."""
+    client.post("/search", json={"query": "vampire", "n_results": 1})
+    client.post("/search", json={"query": "vampire", "n_results": 1})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in response.text.splitlines()
+        if not line.startswith("#")
+    }
+    assert samples['retrieval_http_requests_total{method="POST",route="/search",status="200"}'] >= 2
+    for stage in ("embed", "query", "format", "serialize"):
+        assert samples[f'retrieval_search_stage_seconds_count{{stage="{stage}"}}'] >= 1
+    assert samples["retrieval_indexed_files_total"] > 0
+    assert samples["retrieval_index_chunks"] == samples["retrieval_indexed_chunks_total"]
+    assert samples['retrieval_cache_hits_total{cache="result"}'] >= 1
+    assert 0 < samples['retrieval_cache_hit_ratio{cache="result"}'] <= 1
+
+
+def test_search_server_timing(client):
+    """Test that /search reports its stages in Server-Timing, and in the body on request."""
+    request = {"query": "garlic and wolves", "n_results": 2}
+    first = client.post("/search", json=request)
+    second = client.post("/search", json={**request, "timings": True})
+
+    stages = {entry.split(";")[0]: entry for entry in first.headers["server-timing"].split(", ")}
+    assert {"queue", "embed", "query", "format", "serialize", "total", "cache"} <= set(stages)
+    assert 'cache;desc="miss"' in stages["cache"]
+    assert float(stages["total"].split("dur=")[1]) > 0
+    assert "timings" not in first.json()
+
+    assert 'cache;desc="hit"' in second.headers["server-timing"]
+    body = second.json()
+    assert body["cached"] is True
+    assert "queue" in body["timings"] and "serialize" not in body["timings"]
+    assert body["results"] == first.json()["results"]
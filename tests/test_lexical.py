@@ -0,0 +1,96 @@
+"""
+Unit tests of the BM25 keyword index.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import math
+
+import pytest
+
+from retrieval.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index():
+    """A small index of three documents."""
+    index = BM25Index()
+    index.add(
+        ["pets", "dogs", "code"],
+        [
+            "The cat sat on the mat next to the dog",
+            "Dogs and more dogs: a dog book",
+            "Python code for a web server",
+        ],
+    )
+    return index
+
+
+def test_tokenize():
+    """Test that text is split into lowercase words."""
+    assert tokenize("Hello, World! It's 2026.") == ["hello", "world", "it", "s", "2026"]
+
+
+def test_search_ranks_by_bm25(index):
+    """Test that matching documents come back best first, with BM25 scores."""
+    results = index.search("cat dog")
+
+    assert [doc_id for doc_id, _ in results] == ["pets", "dogs"]
+    # one document of three has 'cat': idf = ln(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    assert results[0][1] > math.log(1 + 2.5 / 1.5)
+    assert index.search("python")[0][0] == "code"
+
+
+def test_search_without_matches(index):
+    """Test that documents sharing no word with the query are not returned."""
+    assert index.search("quantum physics") == []
+    assert index.search("the", n_results=1) == [("pets", pytest.approx(index.search("the")[0][1]))]
+
+
+def test_delete_and_replace(index):
+    """Test that deleted documents disappear and re-added ones are replaced."""
+    index.delete(["pets", "unknown"])
+    assert [doc_id for doc_id, _ in index.search("cat dog")] == ["dogs"]
+
+    index.add(["dogs"], ["cats only"])
+    assert index.search("dog") == []
+    assert index.search("cats")[0][0] == "dogs"
+    assert len(index) == 2
+
+
+def test_churn_reuses_rows(index):
+    """Test that replacing documents over and over doesn't grow the index."""
+    index.add(["twin2", "twin1"], ["zebra crossing", "zebra crossing"])
+    expected = index.search("cat dog")
+    for i in range(500):
+        index.add(["dogs", "temp"], ["Dogs and more dogs: a dog book", f"temporary {i}"])
+        index.delete(["temp"])
+
+    assert index._next_row <= 2 * 64 and len(index._lengths) <= 2 * 64
+    assert len(index) == 5
+    # scores are unchanged, and ties still rank in the order documents were added
+    assert index.search("cat dog") == expected
+    assert [doc_id for doc_id, _ in index.search("zebra")] == ["twin2", "twin1"]
+
+
+def test_flush_and_reload(tmp_path, index):
+    """Test that a flushed index is loaded again with the same scores."""
+    index.path = tmp_path / "lexical.json"
+    index.flush()
+
+    reloaded = BM25Index(tmp_path / "lexical.json")
+
+    assert len(reloaded) == 3
+    assert reloaded.search("cat dog") == index.search("cat dog")
+
+
+def test_reciprocal_rank_fusion():
+    """Test that ids ranked well in several rankings come first."""
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
@@ -9,7 +9,7 @@ Seattle University, ARIN 5360
 
 import pytest
 
-from retrieval.loader import DocumentLoader
+from retrieval.loader import DocumentChunker, DocumentLoader
 
 
 def test_loader_loads_documents(tmp_path):
@@ -53,3 +53,57 @@ def test_loader_skips_nonexistent_directory(tmp_path):
     loader = DocumentLoader()
     with pytest.raises(ValueError, match="Directory 'garbage' does not exist"):
         loader.load_documents("garbage")
+
+
+def test_loader_reports_failed_files(tmp_path):
+    """
+    Test that a file that can't be parsed is skipped and reported.
+    """
+    (tmp_path / "good.txt").write_text("This is a test file.")
+    (tmp_path / "bad.pdf").write_text("this is not a pdf")
+
+    loader = DocumentLoader()
+    documents = loader.load_documents(str(tmp_path))
+
+    assert len(documents) == 1
+    assert list(loader.errors) == ["bad.pdf"]
+
+
+def test_parallel_loader_matches_sequential(tmp_path):
+    """
+    Test that parallel loading gives the same documents in the same order.
+    """
+    for i in range(6):
+        (tmp_path / f"file{i}.txt").write_text(f"word{i} " * (25 + i))
+    (tmp_path / "bad.pdf").write_text("this is not a pdf")
+    chunker = DocumentChunker(chunk_size=10, overlap=2)
+
+    sequential = DocumentLoader(chunker=chunker).load_documents(str(tmp_path))
+    parallel_loader = DocumentLoader(chunker=chunker, max_workers=3)
+    parallel = parallel_loader.load_documents(str(tmp_path))
+
+    assert parallel == sequential
+    assert [doc["id"] for doc in parallel][:4] == ["file0_0", "file0_1", "file0_2", "file0_3"]
+    assert list(parallel_loader.errors) == ["bad.pdf"]
+
+
+def test_loader_bad_workers():
+    """
+    Test that a negative worker count raises an error.
+    """
+    with pytest.raises(ValueError):
+        DocumentLoader(max_workers=-1)
+
+
+def test_iter_documents_is_lazy(tmp_path):
+    """
+    Test that iter_documents parses files only as they are consumed.
+    """
+    (tmp_path / "a.txt").write_text("first file")
+    (tmp_path / "b.txt").write_text("second file")
+
+    documents = DocumentLoader().iter_documents(str(tmp_path))
+    assert next(documents)["text"] == "first file"
+
+    (tmp_path / "b.txt").write_text("changed before it was read")
+    assert [doc["text"] for doc in documents] == ["changed before it was read"]
@@ -0,0 +1,93 @@
+"""
+Unit tests for the file manifest.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import os
+
+from retrieval.manifest import FileManifest, fingerprint
+
+
+def test_fingerprint(tmp_path):
+    """Test that a fingerprint has size, mtime and content hash."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_text("hello")
+
+    result = fingerprint(filepath)
+
+    assert result["size"] == 5
+    assert result["mtime"] > 0
+    assert len(result["hash"]) == 64
+    assert fingerprint(filepath, content_hash=False)["hash"] is None
+
+
+def test_diff_new_and_unchanged(tmp_path):
+    """Test that new files show up as changed, and indexed ones don't."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_text("hello")
+    manifest = FileManifest()
+
+    changed, removed = manifest.diff([filepath], tmp_path)
+    assert list(changed) == [filepath]
+    assert removed == []
+
+    manifest.update(filepath, changed[filepath], ["a_0"])
+    changed, removed = manifest.diff([filepath], tmp_path)
+    assert changed == {}
+    assert removed == []
+
+
+def test_diff_modified_and_touched(tmp_path):
+    """Test that only a content change makes a file changed."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_text("hello")
+    manifest = FileManifest()
+    manifest.update(filepath, fingerprint(filepath), ["a_0"])
+
+    # same content, newer mtime
+    stat = filepath.stat()
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    changed, _ = manifest.diff([filepath], tmp_path)
+    assert changed == {}
+
+    filepath.write_text("hello there")
+    changed, _ = manifest.diff([filepath], tmp_path)
+    assert list(changed) == [filepath]
+
+
+def test_diff_removed(tmp_path):
+    """Test that a file that disappeared is reported with its ids."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_text("hello")
+    manifest = FileManifest()
+    manifest.update(filepath, fingerprint(filepath), ["a_0", "a_1"])
+    filepath.unlink()
+
+    changed, removed = manifest.diff([], tmp_path)
+
+    assert changed == {}
+    assert removed == [FileManifest.key(filepath)]
+    assert manifest.remove(removed[0]) == ["a_0", "a_1"]
+    assert manifest.files == {}
+
+
+def test_save_and_reload(tmp_path):
+    """Test that the manifest survives a round trip to disk."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_text("hello")
+    manifest = FileManifest(tmp_path / "index" / "manifest.json")
+    manifest.reset({"chunk_size": 300})
+    manifest.update(filepath, fingerprint(filepath), ["a_0"])
+    manifest.save()
+
+    reloaded = FileManifest(tmp_path / "index" / "manifest.json")
+
+    assert reloaded.matches({"chunk_size": 300})
+    assert not reloaded.matches({"chunk_size": 100})
+    assert reloaded.ids_for(filepath) == ["a_0"]
+    assert reloaded.reset({"chunk_size": 100}) == ["a_0"]
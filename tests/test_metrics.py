@@ -0,0 +1,65 @@
+"""
+Unit tests of the Prometheus metrics.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import pytest
+
+from retrieval.metrics import Registry
+
+
+def test_counter_and_gauge_render():
+    """Test that counters and gauges render one line per label values."""
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route", "status"))
+    size = registry.gauge("size", "Size")
+    requests.inc("/search", "200")
+    requests.inc("/search", "200", amount=2)
+    requests.inc('/odd"path', "500")
+    size.set(1.5)
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP requests_total Requests", "# TYPE requests_total counter"]
+    assert 'requests_total{route="/search",status="200"} 3' in lines
+    assert 'requests_total{route="/odd\\"path",status="500"} 1' in lines
+    assert "size 1.5" in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that a histogram renders cumulative buckets, +Inf, sum and count."""
+    registry = Registry()
+    seconds = registry.histogram("seconds", "Seconds", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        seconds.observe(value, "embed")
+
+    lines = registry.render().splitlines()
+
+    assert 'seconds_bucket{stage="embed",le="0.1"} 2' in lines
+    assert 'seconds_bucket{stage="embed",le="1"} 3' in lines
+    assert 'seconds_bucket{stage="embed",le="+Inf"} 4' in lines
+    assert 'seconds_sum{stage="embed"} 3.65' in lines
+    assert 'seconds_count{stage="embed"} 4' in lines
+
+
+def test_function_metrics_are_read_when_rendered():
+    """Test that function metrics are read at render time, and None leaves them empty."""
+    registry = Registry()
+    state = {"hits": None}
+    registry.counter(
+        "hits_total",
+        "Hits",
+        ("cache",),
+        function=lambda: None if state["hits"] is None else {("result",): state["hits"]},
+    )
+    assert registry.render().splitlines()[2:] == []
+
+    state["hits"] = 7
+    assert 'hits_total{cache="result"} 7' in registry.render().splitlines()
+    with pytest.raises(ValueError, match="already registered"):
+        registry.gauge("hits_total", "Again")
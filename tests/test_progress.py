@@ -0,0 +1,63 @@
+"""
+Unit tests of startup progress reporting.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import pytest
+
+from retrieval.progress import IndexProgress
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_phases():
+    """Test the phases a startup goes through."""
+    progress = IndexProgress()
+    assert progress.phase == "loading"
+    assert not progress.ready
+
+    progress.start_indexing(3)
+    assert progress.phase == "indexing"
+    progress.finish()
+    assert progress.ready
+
+    progress.fail("out of memory")
+    assert progress.snapshot()["phase"] == "failed"
+    assert progress.snapshot()["error"] == "out of memory"
+
+
+def test_eta_from_rate():
+    """Test that the ETA extrapolates the time taken per file so far."""
+    clock = FakeClock()
+    progress = IndexProgress(clock=clock)
+    assert progress.eta() is None
+
+    progress.start_indexing(4)
+    assert progress.eta() is None
+    clock.now += 10
+    progress.file_processed()
+    progress.chunks_added(7)
+    progress.duplicates_skipped(2)
+
+    assert progress.eta() == pytest.approx(30)
+    snapshot = progress.snapshot()
+    assert snapshot["files_processed"] == 1
+    assert snapshot["chunks_embedded"] == 7
+    assert snapshot["chunks_deduplicated"] == 2
+    assert snapshot["elapsed_seconds"] == pytest.approx(10)
+
+    progress.finish()
+    assert progress.eta() == 0
@@ -12,7 +12,9 @@ from pathlib import Path
 
 import pytest
 
+from retrieval.progress import IndexProgress
 from retrieval.retriever import DocumentRetriever
+from retrieval.timing import Timings
 
 
 @pytest.fixture
@@ -156,3 +158,216 @@ def test_with_chunks(retriever):
     results = retriever.search("What MSAI courses are 5 credits?")
     assert len(results) > 0
     assert "5 credits" in results[0]["text"]
+
+
+def test_persistent_index_skips_unchanged_files(tmp_path, sample_directory):
+    """Test that a second retriever on the same index re-embeds nothing."""
+    index_dir = str(tmp_path / "index")
+    first = DocumentRetriever(persist_directory=index_dir)
+    assert first.index_documents(sample_directory) == 3
+
+    second = DocumentRetriever(persist_directory=index_dir)
+    assert second.document_count == 3
+    assert second._indexed is True
+    assert second.index_documents(sample_directory) == 0
+    assert second.document_count == 3
+
+
+def test_reindex_picks_up_changes(tmp_path, sample_directory):
+    """Test that changed files are re-embedded and deleted ones removed."""
+    retriever = DocumentRetriever(persist_directory=str(tmp_path / "index"))
+    retriever.index_documents(sample_directory)
+
+    (Path(sample_directory) / "doc1.txt").write_text("Rust is a systems language")
+    (Path(sample_directory) / "doc2.txt").unlink()
+    retriever.index_documents(sample_directory)
+
+    assert retriever.document_count == 2
+    texts = [result["text"] for result in retriever.search("language", n_results=2)]
+    assert "Rust is a systems language" in texts
+
+
+def test_search_many(retriever, sample_directory):
+    """Test that search_many answers each query."""
+    with pytest.raises(ValueError, match="No documents indexed"):
+        retriever.search_many(["Python"])
+
+    retriever.index_documents(sample_directory)
+    results = retriever.search_many(["Python", "neural networks"], n_results=1)
+
+    assert len(results) == 2
+    assert all(len(result) == 1 for result in results)
+
+
+def test_iter_search_many_batches(retriever, sample_directory):
+    """Test that iter_search_many yields the same results as search."""
+    retriever.index_documents(sample_directory)
+    queries = ["Python", "neural networks", "embeddings"]
+
+    results = list(retriever.iter_search_many(queries, n_results=1, batch_size=2))
+
+    assert results == [retriever.search(query, n_results=1) for query in queries]
+
+
+def test_repeated_search_uses_result_cache(retriever, sample_directory):
+    """Test that a repeated search is answered from the result cache."""
+    retriever.index_documents(sample_directory)
+
+    first = retriever.search("Python", n_results=2)
+    second = retriever.search(" Python ", n_results=2)
+
+    assert first == second
+    assert retriever.result_cache.stats()["hits"] == 1
+
+
+def test_result_cache_invalidated_by_indexing(retriever, sample_directory):
+    """Test that adding documents means cached results are not served."""
+    retriever.index_documents(sample_directory)
+    before = retriever.search("Rust", n_results=5)
+
+    (Path(sample_directory) / "doc4.txt").write_text("Rust is a systems language")
+    retriever.index_documents(sample_directory)
+    after = retriever.search("Rust", n_results=5)
+
+    assert len(before) == 3
+    assert len(after) == 4
+    assert retriever.result_cache.stats()["hits"] == 0
+
+
+def test_chunk_by_tokens(tmp_path):
+    """Test that token chunking keeps every chunk within the model's limit."""
+    retriever = DocumentRetriever(chunk_size=512, overlap=16, chunk_by_tokens=True)
+    (tmp_path / "long.txt").write_text("Vampires fear garlic and crucifixes. " * 300)
+
+    retriever.index_documents(str(tmp_path))
+
+    assert retriever.loader.chunker.chunk_size <= retriever.store.embedder.embedder.max_seq_length
+    assert retriever.document_count > 1
+
+
+def test_persistent_numpy_backend(tmp_path, sample_directory):
+    """Test that the NumPy backend index survives a restart."""
+    index_dir = str(tmp_path / "index")
+    DocumentRetriever(persist_directory=index_dir, backend="numpy").index_documents(
+        sample_directory
+    )
+
+    retriever = DocumentRetriever(persist_directory=index_dir, backend="numpy")
+
+    assert retriever.document_count == 3
+    assert retriever.index_documents(sample_directory) == 0
+    assert len(retriever.search("Python", n_results=3)) == 3
+
+
+def test_index_progress(sample_directory):
+    """Test that indexing reports files and chunks, and stops when cancelled."""
+    retriever = DocumentRetriever(chunk_size=5, overlap=1)
+    progress = IndexProgress()
+    retriever.index_documents(sample_directory, progress)
+
+    assert progress.files_total == 3
+    assert progress.files_processed == 3
+    assert progress.chunks_embedded == retriever.document_count
+
+    cancelled = IndexProgress()
+    cancelled.cancel()
+    fresh = DocumentRetriever(chunk_size=5, overlap=1)
+    assert fresh.index_documents(sample_directory, cancelled) == 0
+    assert cancelled.files_processed == 0
+
+
+def test_startup_profile(sample_directory):
+    """Test that model loading and every indexing stage are timed."""
+    retriever = DocumentRetriever(chunk_size=5, overlap=1)
+    retriever.index_documents(sample_directory)
+
+    profile = retriever.profile.as_dict()
+    for stage in ["import", "model_load", "store_open", "file_scan", "parse", "embed", "insert"]:
+        assert profile[stage] >= 0
+    assert retriever.profile.count("parse") == 4  # three files, then the end
+
+
+def test_hybrid_search(tmp_path, sample_directory):
+    """Test that hybrid search ranks keyword matches and keeps working after a restart."""
+    index_dir = str(tmp_path / "index")
+    retriever = DocumentRetriever(persist_directory=index_dir, lexical=True)
+    retriever.index_documents(sample_directory)
+
+    assert retriever.default_mode == "hybrid"
+    results = retriever.search("neural networks", n_results=3)
+    # only one chunk shares words with the query, so only one is returned
+    assert [result["metadata"]["filename"] for result in results] == ["doc2.txt"]
+    assert results[0]["score"] > 0
+    # queries without keyword matches fall back to vector search
+    assert len(retriever.search("zebra", n_results=2)) == 2
+    assert len(retriever.search("neural networks", n_results=3, mode="vector")) == 3
+
+    restarted = DocumentRetriever(persist_directory=index_dir, lexical=True)
+    assert restarted.index_documents(sample_directory) == 0
+    assert restarted.search("neural networks")[0]["metadata"]["filename"] == "doc2.txt"
+
+
+def test_hybrid_needs_lexical_index(retriever, sample_directory):
+    """Test that hybrid search and unknown modes are rejected without the index."""
+    retriever.index_documents(sample_directory)
+
+    with pytest.raises(ValueError, match="keyword index"):
+        retriever.search("Python", mode="hybrid")
+    with pytest.raises(ValueError, match="Unknown search mode"):
+        retriever.search("Python", mode="fuzzy")
+
+
+def test_search_with_filters(tmp_path, sample_directory):
+    """Test that filters narrow vector and hybrid results, and are cached apart."""
+    retriever = DocumentRetriever(lexical=True)
+    retriever.index_documents(sample_directory)
+
+    for mode in ("vector", "hybrid"):
+        results = retriever.search("Python", 3, mode=mode, where={"filename": "doc3.txt"})
+        assert [result["metadata"]["filename"] for result in results] == ["doc3.txt"]
+    results = retriever.search("Python", 3, mode="vector", where_document={"$contains": "neural"})
+    assert [result["metadata"]["filename"] for result in results] == ["doc2.txt"]
+    # the unfiltered search isn't answered from the filtered one's cache entry
+    assert len(retriever.search("Python", 3, mode="vector")) == 3
+
+
+def test_dedup_skips_repeated_chunks(tmp_path):
+    """Test that copies of indexed text are not embedded, and return when the original goes."""
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    boilerplate = " ".join(f"legal{i}" for i in range(60))
+    (documents / "a.txt").write_text(boilerplate)
+    (documents / "b.txt").write_text(boilerplate + " Copyright 2026.")
+    (documents / "c.txt").write_text("Vector databases store embeddings")
+
+    index_dir = str(tmp_path / "index")
+    progress = IndexProgress()
+    retriever = DocumentRetriever(persist_directory=index_dir, dedup=True)
+    assert retriever.index_documents(str(documents), progress) == 2
+    assert progress.chunks_deduplicated == 1
+    results = retriever.search("legal", n_results=3)
+    assert len({result["text"] for result in results}) == len(results)
+
+    # once the kept copy is removed, the duplicate is indexed in its place
+    (documents / "a.txt").unlink()
+    restarted = DocumentRetriever(persist_directory=index_dir, dedup=True)
+    assert restarted.document_count == 2
+    restarted.index_documents(str(documents))
+    filenames = {result["metadata"]["filename"] for result in restarted.search("legal", 2)}
+    assert filenames == {"b.txt", "c.txt"}
+    assert restarted.dedup.duplicates == 0
+
+
+def test_search_many_reports_stages_and_cache_hits(retriever, sample_directory):
+    """Test that searches time their stages and say which results were cached."""
+    retriever.index_documents(sample_directory)
+    retriever.search("Python", n_results=2)
+
+    timings, cache_hits = Timings(), []
+    retriever.search_many(
+        ["Python", "embeddings"], n_results=2, timings=timings, cache_hits=cache_hits
+    )
+
+    assert cache_hits == [True, False]
+    assert {"embed", "query", "format"} <= set(timings.as_dict())
+    assert all(seconds >= 0 for seconds in timings.as_dict().values())
@@ -7,6 +7,8 @@ Seattle University, ARIN 5360
 @version: 0.1.0+w26
 """
 
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -17,6 +19,11 @@ from retrieval.main import app
 def client():
     """Fixture provides a fresh test client for each test"""
     with TestClient(app, raise_server_exceptions=False) as client:
+        # the server indexes in the background; wait until it can search
+        deadline = time.monotonic() + 300
+        while client.get("/health").json()["phase"] not in ("ready", "failed"):
+            assert time.monotonic() < deadline, "server did not finish starting"
+            time.sleep(0.05)
         yield client
 
 
@@ -41,3 +48,12 @@ def test_generic_exception_handler(client):
     assert res.status_code == 500
     data = res.json()
     assert "Internal server error" in data["detail"]
+
+
+def test_health_reports_progress(client):
+    """The health check reports the finished startup's progress"""
+    data = client.get("/health").json()
+    assert data["phase"] == "ready"
+    assert data["progress"]["files_processed"] == data["progress"]["files_total"]
+    assert data["progress"]["eta_seconds"] == 0
+    assert data["startup_profile"]["model_load"] > 0
@@ -8,8 +8,13 @@ Seattle University, ARIN 5360
 @version: 1.0.0+w26
 """
 
+import threading
+import time
+
+import numpy as np
 import pytest
 
+from retrieval.backends import NumpyBackend
 from retrieval.embeddings import DocumentEmbedder
 from retrieval.store import VectorStore
 
@@ -94,3 +99,171 @@ def test_search_with_n_results(vector_store, sample_docs):
     vector_store.add_documents(sample_docs)
     results = vector_store.search("some query", n_results=2)
     assert len(results) == 2
+
+
+def test_search_many(vector_store, sample_docs):
+    """Test that search_many returns one result list per query."""
+
+    vector_store.add_documents(sample_docs)
+    results = vector_store.search_many(["Python", "vectors", "search"], n_results=2)
+    assert len(results) == 3
+    assert all(len(result) == 2 for result in results)
+    assert results[0] == vector_store.search("Python", n_results=2)
+    assert vector_store.search_many([]) == []
+
+
+def test_generation_bumps_on_change(vector_store, sample_docs):
+    """Test that every change to the store bumps its generation."""
+
+    generation = vector_store.generation
+    vector_store.add_documents(sample_docs)
+    assert vector_store.generation == generation + 1
+    vector_store.delete(["1"])
+    assert vector_store.generation == generation + 2
+    assert vector_store.count() == 2
+
+
+def test_add_stream_in_batches(vector_store):
+    """Test that add_stream consumes a generator in fixed-size batches."""
+
+    sizes = []
+    docs = ({"id": str(i), "text": f"text {i}", "metadata": {"n": i}} for i in range(7))
+
+    assert vector_store.add_stream(docs, batch_size=3, on_batch=sizes.append) == 7
+    assert sizes == [3, 3, 1]
+    assert vector_store.count() == 7
+
+
+def test_add_stream_reraises_producer_errors(vector_store):
+    """Test that an error while producing documents reaches the caller."""
+
+    def docs():
+        yield {"id": "1", "text": "fine", "metadata": {"n": 1}}
+        raise RuntimeError("parse failed")
+
+    with pytest.raises(RuntimeError, match="parse failed"):
+        vector_store.add_stream(docs(), batch_size=1)
+
+
+def test_numpy_backend_store(document_embedder, sample_docs):
+    """Test that the NumPy backend answers like the ChromaDB one."""
+
+    chroma_store = VectorStore(document_embedder)
+    numpy_store = VectorStore(document_embedder, backend="numpy")
+    chroma_store.add_documents(sample_docs)
+    numpy_store.add_documents(sample_docs)
+
+    for query in ["Python", "vectors", "search"]:
+        expected = chroma_store.search(query, n_results=3)
+        actual = numpy_store.search(query, n_results=3)
+        assert [r["id"] for r in actual] == [r["id"] for r in expected]
+        assert actual[0]["distance"] == pytest.approx(expected[0]["distance"], abs=1e-4)
+
+
+def test_unknown_backend(document_embedder):
+    """Test that an unknown backend name raises an error."""
+
+    with pytest.raises(ValueError, match="Unknown store backend"):
+        VectorStore(document_embedder, backend="faiss")
+
+
+def test_quantized_backend_store(document_embedder, sample_docs):
+    """Test that the quantized backends find the same best match."""
+
+    exact_store = VectorStore(document_embedder, backend="numpy")
+    exact_store.add_documents(sample_docs)
+    for backend in ["numpy-int8", "numpy-binary"]:
+        store = VectorStore(document_embedder, backend=backend)
+        store.add_documents(sample_docs)
+        assert store.backend.quantization == backend.removeprefix("numpy-")
+        for query in ["Python", "vectors"]:
+            assert store.search(query, 1)[0]["id"] == exact_store.search(query, 1)[0]["id"]
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_search_among(document_embedder, sample_docs, backend):
+    """Test that searches can be limited to some candidate documents."""
+
+    store = VectorStore(document_embedder, backend=backend)
+    store.add_documents(sample_docs)
+
+    results = store.search_among(["Python", "search"], [["2", "3"], []], n_results=5)
+
+    assert sorted(result["id"] for result in results[0]) == ["2", "3"]
+    assert results[1] == []
+
+
+class SlowEmbedder:
+    """Stands in for DocumentEmbedder, recording the size of each call."""
+
+    def __init__(self):
+        self.sizes = []
+        self.inserting = threading.Event()
+        self.overlapped = False
+
+    def embed_documents(self, texts):
+        self.sizes.append(len(texts))
+        time.sleep(0.01)
+        # batches after the first are embedded while the previous one is inserted
+        self.overlapped |= self.inserting.is_set()
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class SlowBackend(NumpyBackend):
+    """A NumPy backend taking at most 3 documents per slow add()."""
+
+    max_batch_size = 3
+
+    def __init__(self, embedder):
+        super().__init__()
+        self.embedder = embedder
+        self.sizes = []
+
+    def add(self, ids, texts, metadatas, embeddings):
+        self.embedder.inserting.set()
+        self.sizes.append(len(ids))
+        time.sleep(0.05)
+        super().add(ids, texts, metadatas, embeddings)
+        self.embedder.inserting.clear()
+
+
+def test_add_documents_in_bounded_overlapping_batches():
+    """Test that documents are embedded and inserted in bounded batches that overlap."""
+
+    embedder = SlowEmbedder()
+    backend = SlowBackend(embedder)
+    store = VectorStore(embedder, backend=backend, embed_batch_size=4, insert_batch_size=10)
+    docs = [{"id": str(i), "text": f"text {i}", "metadata": {"n": i}} for i in range(10)]
+
+    store.add_documents(docs)
+
+    assert store.count() == 10
+    assert embedder.sizes == [4, 4, 2]
+    # the backend's limit wins over the larger insert_batch_size
+    assert store.insert_batch_size == 3
+    assert backend.sizes == [3, 1, 3, 1, 2]
+    assert embedder.overlapped
+    assert store.timings.count("embed") == 3
+    assert store.timings.count("insert") == 5
+    # the insert thread only lives as long as the add
+    assert not [t for t in threading.enumerate() if t.name.startswith("store-insert")]
+
+
+def test_add_documents_insert_errors():
+    """Test that a failed insert reaches the caller, after inserts in flight end."""
+
+    class FailingBackend(NumpyBackend):
+        def add(self, ids, texts, metadatas, embeddings):
+            if "5" in ids:
+                raise RuntimeError("disk full")
+            super().add(ids, texts, metadatas, embeddings)
+
+    store = VectorStore(SlowEmbedder(), backend=FailingBackend(), embed_batch_size=2)
+    docs = [{"id": str(i), "text": f"text {i}", "metadata": {"n": i}} for i in range(8)]
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        store.add_documents(docs)
+    assert store.count() == 4
+    assert not [t for t in threading.enumerate() if t.name.startswith("store-insert")]
+    with pytest.raises(ValueError, match="Batch sizes"):
+        VectorStore(SlowEmbedder(), backend=NumpyBackend(), insert_batch_size=0)
@@ -0,0 +1,64 @@
+"""
+Unit tests of stage timings and lazy imports.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from retrieval.timing import Timings
+
+
+class FakeClock:
+    """A clock that advances one second per reading."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+def test_stages_add_up():
+    """Test that repeated stages accumulate, in the order first seen."""
+    timings = Timings(clock=FakeClock())
+    with timings.measure("embed"):
+        pass
+    timings.add("insert", 0.5)
+    with timings.measure("embed"):
+        pass
+
+    assert timings.as_dict() == {"embed": 2.0, "insert": 0.5}
+    assert timings.count("embed") == 2
+    assert timings.summary() == "embed=2.00s insert=0.50s"
+    timings.reset()
+    assert timings.as_dict() == {}
+
+
+def test_measure_on_error():
+    """Test that a stage that raises is still timed."""
+    timings = Timings(clock=FakeClock())
+    with pytest.raises(RuntimeError):
+        with timings.measure("parse"):
+            raise RuntimeError("bad file")
+
+    assert timings.as_dict() == {"parse": 1.0}
+
+
+def test_heavy_imports_are_lazy():
+    """Test that importing the API does not import the model or database libraries."""
+    heavy = ["chromadb", "sentence_transformers", "torch", "pypdf"]
+    code = f"import sys, retrieval.main; print([m for m in {heavy!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,131 @@
+"""
+Unit tests of the directory watcher.
+
+@author: Anthony Nguyen and Sebastian Silva
+Seattle University, ARIN 5360
+@see: https://catalog.seattleu.edu/preview_course_nopop.php?catoid=55&coid
+=190380
+@version: 1.0.0+w26
+"""
+
+import asyncio
+
+import pytest
+
+from retrieval.loader import DocumentLoader
+from retrieval.retriever import DocumentRetriever
+from retrieval.watcher import DirectoryWatcher
+
+
+class RecordingRetriever:
+    """Stands in for DocumentRetriever, recording which files each update saw."""
+
+    def __init__(self):
+        self.loader = DocumentLoader()
+        self.calls = []
+
+    def index_documents(self, directory):
+        self.calls.append(sorted(path.name for path in self.loader.list_files(directory)))
+        return 0
+
+
+async def wait_for(condition, timeout=10.0):
+    """Wait until condition() is true."""
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError("condition not met in time")
+
+
+@pytest.mark.parametrize("events", [False, True], ids=["polling", "events"])
+def test_changes_are_indexed_once_settled(tmp_path, events):
+    """Test that a new file is indexed once, after it stopped changing."""
+    if events:
+        pytest.importorskip("watchfiles")
+    (tmp_path / "a.txt").write_text("first file")
+    retriever = RecordingRetriever()
+
+    async def run():
+        watcher = DirectoryWatcher(retriever, str(tmp_path), interval=0.05, debounce=0.2)
+        watcher.start()
+        try:
+            # the first update catches up with anything missed while starting
+            await wait_for(lambda: watcher.updates == 1)
+            await asyncio.sleep(0.3)
+            for i in range(3):
+                (tmp_path / "b.txt").write_text(f"second file, draft {i}")
+                await asyncio.sleep(0.05)
+            (tmp_path / "notes.md").write_text("not a document")
+            await wait_for(lambda: watcher.updates == 2)
+            await asyncio.sleep(0.5)
+        finally:
+            await watcher.stop()
+        return watcher
+
+    watcher = asyncio.run(run())
+
+    assert not watcher.running
+    assert retriever.calls == [["a.txt"], ["a.txt", "b.txt"]]
+
+
+def test_failed_update_keeps_watching(tmp_path):
+    """Test that an indexing error is logged and the next change is still picked up."""
+    retriever = RecordingRetriever()
+    failures = []
+
+    def index_documents(directory):
+        if not failures:
+            failures.append(directory)
+            raise RuntimeError("disk full")
+        return RecordingRetriever.index_documents(retriever, directory)
+
+    retriever.index_documents = index_documents
+
+    async def run():
+        watcher = DirectoryWatcher(
+            retriever, str(tmp_path), interval=0.05, debounce=0.1, events=False
+        )
+        watcher.start()
+        try:
+            await wait_for(lambda: failures)
+            (tmp_path / "a.txt").write_text("a file")
+            await wait_for(lambda: watcher.updates == 1)
+        finally:
+            await watcher.stop()
+
+    asyncio.run(run())
+    assert retriever.calls == [["a.txt"]]
+
+
+def test_bad_settings(tmp_path):
+    """Test that invalid timings are rejected."""
+    with pytest.raises(ValueError):
+        DirectoryWatcher(RecordingRetriever(), str(tmp_path), interval=0)
+    with pytest.raises(ValueError):
+        DirectoryWatcher(RecordingRetriever(), str(tmp_path), debounce=-1)
+
+
+def test_watcher_upserts_and_deletes(tmp_path):
+    """Test that a real retriever picks up added and removed files while searching."""
+    (tmp_path / "a.txt").write_text("Python is a programming language")
+    retriever = DocumentRetriever(backend="numpy")
+    retriever.index_documents(str(tmp_path))
+
+    async def run():
+        watcher = DirectoryWatcher(
+            retriever, str(tmp_path), interval=0.05, debounce=0.1, events=False
+        )
+        watcher.start()
+        try:
+            await wait_for(lambda: watcher.updates == 1)
+            (tmp_path / "b.txt").write_text("Vector databases store embeddings")
+            await wait_for(lambda: retriever.document_count == 2)
+            assert len(retriever.search("databases", n_results=5)) == 2
+            (tmp_path / "a.txt").unlink()
+            await wait_for(lambda: retriever.document_count == 1)
+        finally:
+            await watcher.stop()
+
+    asyncio.run(run())
+    assert [r["metadata"]["filename"] for r in retriever.search("Python")] == ["b.txt"]